@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Paces the main loop. mainUpdate used to restart its QTimer at the end of
+every tick, so the tick rate depended on how long each frame took, and
+playback ran off time.time() rather than what was drawn. Here a short,
+steady timer calls Tick, which on time.perf_counter:
+    - works out how many fixed steps of 1/update_rate are due, and moves
+      the simulation time (Time) on by them
+    - calls ingest once to take in the data up to that time
+    - calls update(dt) once, with dt the time of the steps due, at most
+      max_updates of them a tick, dropping the rest if it cannot keep up.
+      The update sets the pose from the latest angles, so running it for
+      every step would only do the same work again
+    - calls render when a frame is due at the target fps, skipping frames
+      rather than catching up when late
+The achieved rates, late and skipped frames, dropped steps and the time in
+each stage are kept for Stats.
+Classes are:
+    FrameScheduler - fixed timestep update and paced render
+"""
+
+import time
+
+TICK_MS      = 2        # ms between Ticks, from a Qt.PreciseTimer
+UPDATE_RATE  = 100.0    # Fixed steps a second
+TARGET_FPS   = 60.0
+MAX_UPDATES  = 5        # Most steps taken in one Tick
+STATS_WINDOW = 1.0      # Seconds over which rates are measured
+SMOOTH       = 16       # Smoothing of stage times
+STAGES       = ("ingest", "update", "render")
+
+
+class FrameScheduler ():
+    """ Calls ingest(), update(dt) and render() at their rates from Tick.
+    Any of them can be None """
+    def __init__ (self, ingest=None, update=None, render=None, update_rate=UPDATE_RATE,
+                  fps=TARGET_FPS, max_updates=MAX_UPDATES, clock=time.perf_counter):
+        self.ingest = ingest
+        self.update = update
+        self.render = render
+        self.clock  = clock
+        self.max_updates = max_updates
+        self.SetRates (update_rate, fps)
+        self.Restart ()
+
+    def SetRates (self, update_rate, fps):
+        self.dt     = 1.0 / update_rate
+        self.period = 1.0 / fps
+
+    def Restart (self):
+        """ Start the clocks from now and clear the stats """
+        now = self.clock()
+        self.sim_time   = now       # Time the updates have reached
+        self.next_frame = now
+        self.frames     = 0
+        self.updates    = 0
+        self.late       = 0         # Frames drawn more than a period late
+        self.skipped    = 0         # Frames not drawn at all
+        self.dropped    = 0         # Steps not run to keep up
+        self.stage_time = {stage:0.0 for stage in STAGES}
+        self.fps        = 0.0
+        self.ups        = 0.0
+        self.win_start  = now
+        self.win_frames = 0
+        self.win_updates = 0
+
+    def Time (self):
+        """ Simulation time, the clock time the updates have reached. This is
+        what playback should show """
+        return (self.sim_time)
+
+    def _Stage (self, stage, start):
+        now = self.clock()
+        self.stage_time[stage] += (now - start - self.stage_time[stage]) / SMOOTH
+        return (now)
+
+    def Tick (self):
+        now   = self.clock()
+        steps = int ((now - self.sim_time) / self.dt)
+        if steps > self.max_updates:
+            # Cannot keep up, let the simulation time jump on
+            self.dropped  += steps - self.max_updates
+            self.sim_time += (steps - self.max_updates) * self.dt
+            steps = self.max_updates
+        if steps > 0:
+            self.sim_time += steps * self.dt
+            if self.ingest:
+                self.ingest ()
+            now = self._Stage ("ingest", now)
+            if self.update:
+                self.update (steps * self.dt)
+            now = self._Stage ("update", now)
+            self.updates     += steps
+            self.win_updates += steps
+
+        if now >= self.next_frame:
+            behind = int ((now - self.next_frame) / self.period)
+            if behind > 0:
+                self.late    += 1
+                self.skipped += behind
+            self.next_frame += (behind + 1) * self.period
+            if self.render:
+                self.render ()
+            now = self._Stage ("render", now)
+            self.frames     += 1
+            self.win_frames += 1
+
+        if now - self.win_start >= STATS_WINDOW:
+            self.fps = self.win_frames / (now - self.win_start)
+            self.ups = self.win_updates / (now - self.win_start)
+            self.win_start   = now
+            self.win_frames  = 0
+            self.win_updates = 0
+
+    def Stats (self):
+        """ Rates, counts and the smoothed time in ms of each stage """
+        out = {"fps":self.fps, "target_fps":1.0 / self.period, "updates_per_s":self.ups,
+               "update_rate":1.0 / self.dt, "frames":self.frames, "updates":self.updates,
+               "late_frames":self.late, "skipped_frames":self.skipped, "dropped_updates":self.dropped}
+        for stage in STAGES:
+            out[stage + "_ms"] = 1000.0 * self.stage_time[stage]
+        return (out)
+
+    def Summary (self):
+        """ One line for the status bar """
+        st = self.Stats()
+        return ("%.0f fps (%.0f)  late %d  skipped %d  ingest %.1f update %.1f render %.1f ms" %
+                (st["fps"], st["target_fps"], st["late_frames"], st["skipped_frames"],
+                 st["ingest_ms"], st["update_ms"], st["render_ms"]))
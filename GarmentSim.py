@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Garment simulator for trying out the streaming code without a jacket. It
+listens on a local UDP port and answers the messages ApparelConnection
+sends: "Start" or SA_SND_DAT start streaming to whoever sent them and
+SA_STP_DAT stops. Records are SE, SQ, AC and CL in the text form read by
+translate_elem or the WireProtocol binary form.
+The angles come from a track, made with one of the MotionGenerator
+motions or read from a .sat file, or from sine waves if no track is given.
+Each sensor's angles are interpolated from the track (looping at its end) at
+the rate asked for, so any rate and number of sensors can be simulated.
+Sensor times are ms since the simulator started, sim.t0 on time.perf_counter,
+so a receiver in the same process can work out the latency of each sample.
+Classes are:
+    MotionSource - angles of each sensor over time, from a track
+    GarmentSim   - thread serving the garment on a UDP port
+
+    python GarmentSim.py [--port 8080] [--motion Squat | --replay file.sat] ...
+"""
+
+import argparse
+import heapq
+import socket
+import sys
+import threading
+import time
+import numpy as np
+import StreamData as sd
+import MotionGenerator as mg
+import WireProtocol as wp
+import Rotation as rt
+
+SENSOR_IDS  = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16)  # As Motion's limb table
+KINDS       = ("SE", "SQ", "AC", "CL")
+CAL_PERIOD  = 1.0       # Seconds between CL records of a sensor
+MAX_SLEEP   = 0.002     # Longest sleep of the send loop
+DEFAULT_PORT = 8080
+
+
+class MotionSource ():
+    """ Angles of each sensor at any time, interpolated from the SA_EUL_ANG
+    samples of a track and repeating every span seconds. With no track the
+    sensors follow sine waves """
+    def __init__ (self, track=None):
+        self.curves = {}        # Sensor: (times, (N,3) angles)
+        self.span   = 10.0
+        if track is None:
+            return
+        cols = track.store.columns["SA_EUL_ANG"]
+        tim  = cols.Time()
+        sen  = cols.Column ("sensor")
+        ang  = np.stack ([cols.Column (f) for f in ("angle_X", "angle_Y", "angle_Z")], axis=1).astype (np.float64)
+        if len(tim):
+            self.span = max (float(tim.max() - tim.min()), 1e-3)
+            tim = tim - tim.min()
+        for sensor in np.unique (sen).tolist():
+            rows = np.flatnonzero (sen == sensor)
+            order = np.argsort (tim[rows], kind="stable")
+            self.curves[sensor] = (tim[rows][order], ang[rows][order])
+
+    def Angles (self, sensors, times):
+        """ (len(times), len(sensors), 3) angles in degrees """
+        out = np.zeros ((len(times), len(sensors), 3))
+        phase = np.mod (times, self.span)
+        for j, sensor in enumerate (sensors):
+            if sensor in self.curves:
+                tim, ang = self.curves[sensor]
+                for k in range (3):
+                    out[:,j,k] = np.interp (phase, tim, ang[:,k])
+            elif not self.curves:
+                out[:,j,0] = 45 * np.sin (2 * np.pi * (times / self.span + j / len(sensors)))
+        return (out)
+
+    @classmethod
+    def FromMotion (cls, motion="Squat", period=10., t_step=0.02):
+        """ Source from one of the MotionGenerator motions """
+        return (cls (getattr (mg, motion) (period, t_step).Track (motion)))
+
+    @classmethod
+    def FromFile (cls, filename, track_name=None):
+        """ Source from a track in a .sat file, the first unless named """
+        with open (filename, 'r') as fp:
+            tracklist = sd.ReadTrackList (fp)
+        for track in tracklist:
+            if track_name is None or track.name == track_name:
+                return (cls (track))
+        print ("No track", track_name, "in", filename)
+        return (None)
+
+
+class GarmentSim (threading.Thread):
+    """ Simulated garment. sensors is a count or list of sensor numbers, rate
+    the samples per second of each sensor, kinds the records sent for each
+    sample (CL only every CAL_PERIOD), records the records per datagram, loss
+    the fraction of datagrams dropped and jitter the most a datagram is
+    delayed in seconds, which can reorder them """
+    def __init__ (self, port=DEFAULT_PORT, host="127.0.0.1", source=None, sensors=len(SENSOR_IDS),
+                  rate=100., kinds=("SE",), records=20, loss=0.0, jitter=0.0, protocol=wp.TEXT, seed=None):
+        super().__init__ (name="GarmentSim", daemon=True)
+        self.sock = socket.socket (socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind ((host, port))
+        self.sock.setblocking (False)
+        self.port     = self.sock.getsockname()[1]
+        self.source   = source if source is not None else MotionSource()
+        self.sensors  = list (SENSOR_IDS[:sensors]) if isinstance (sensors, int) else list (sensors)
+        self.rate     = rate
+        self.kinds    = [k for k in KINDS if k in kinds]
+        self.records  = records
+        self.loss     = loss
+        self.jitter   = jitter
+        self.protocol = protocol
+        self.rng      = np.random.default_rng (seed)
+        self.client   = None
+        self.streaming  = False
+        self.stop_event = threading.Event()
+        self.t0       = time.perf_counter()
+        self.next_k   = 0           # Index of the next sample, at next_k / rate
+        self.pending  = []          # Record arrays not yet filling a datagram
+        self.delayed  = []          # Heap of (send time, sequence, datagram)
+        self.seq      = 0
+        self.sent     = 0           # Datagrams sent
+        self.dropped  = 0           # Datagrams dropped on purpose
+        self.sent_records = 0       # Records made into datagrams, dropped or not
+
+    def Control (self):
+        """ Act on any messages from the receiver """
+        while True:
+            try:
+                msg, addr = self.sock.recvfrom (256)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue    # Refused from an earlier client on some platforms
+            msg = msg.strip()
+            if msg in (b"Start", b"SA_SND_DAT"):
+                if not self.streaming:
+                    self.next_k = int (np.ceil ((time.perf_counter() - self.t0) * self.rate))
+                self.client    = addr
+                self.streaming = True
+            elif msg == b"SA_STP_DAT":
+                self.streaming = False
+                self.pending   = []
+
+    def Samples (self, now):
+        """ Record arrays (code, sensor, time ms, values) for the samples due by
+        now, in time order """
+        last = int (np.floor ((now - self.t0) * self.rate))
+        if last < self.next_k:
+            return (None)
+        k = np.arange (self.next_k, last + 1)
+        self.next_k = last + 1
+        times = k / self.rate
+        ang   = self.source.Angles (self.sensors, times)            # (K,S,3)
+        n_k, n_s = len(k), len(self.sensors)
+        blocks = []
+        for kind in self.kinds:
+            vals = np.zeros ((n_k, n_s, 4))
+            keep = np.ones (n_k, dtype=bool)
+            if kind == "SE":
+                vals[...,:3] = ang
+            elif kind == "SQ":
+                vals[...] = rt.EulerQuaternions (ang)
+            elif kind == "AC":
+                vals[...,:3] = self.rng.normal (0.0, 0.05, (n_k, n_s, 3))
+            elif kind == "CL":
+                vals[...,0] = 3
+                keep = k % max (int (self.rate * CAL_PERIOD), 1) == 0
+            blocks.append ((wp.TAG_CODE[kind], vals, keep))
+        # Order by sample then kind then sensor
+        codes = np.stack ([np.full ((n_k, n_s), c) for c, v, m in blocks], axis=1)
+        vals  = np.stack ([v for c, v, m in blocks], axis=1)
+        keep  = np.stack ([np.broadcast_to (m[:,None], (n_k, n_s)) for c, v, m in blocks], axis=1)
+        sens  = np.broadcast_to (np.array (self.sensors)[None,None,:], keep.shape)
+        tims  = np.broadcast_to (np.round (times * 1000.).astype (np.int64)[:,None,None], keep.shape)
+        return (codes[keep], sens[keep], tims[keep], vals[keep])
+
+    def Datagram (self, codes, sensors, times, values):
+        if self.protocol == wp.BINARY:
+            return (wp.Encode (codes, sensors, times, values))
+        out = []
+        for code, sensor, tim, val in zip (codes.tolist(), sensors.tolist(), times.tolist(), values.tolist()):
+            name, tag, fields = wp.CODES[code]
+            if tag == "CL":
+                out.append ("CL,%d,%d,%d;" % (sensor, tim, val[0]))
+            else:
+                out.append ("%s,%d,%d,%s;" % (tag, sensor, tim, ",".join ("%.4f" % v for v in val[:len(fields)])))
+        return ("".join (out).encode ('utf-8'))
+
+    def Send (self, now):
+        """ Make the samples due into datagrams and send the ones due """
+        new = self.Samples (now)
+        if new is not None and self.streaming:
+            if self.pending:
+                new = tuple (np.concatenate ((a, b)) for a, b in zip (self.pending, new))
+            n_full = len(new[0]) // self.records * self.records
+            for i in range (0, n_full, self.records):
+                if self.rng.random() < self.loss:
+                    self.dropped += 1
+                    continue
+                gram = self.Datagram (*(a[i:i+self.records] for a in new))
+                due  = now + (self.rng.uniform (0.0, self.jitter) if self.jitter > 0 else 0.0)
+                heapq.heappush (self.delayed, (due, self.seq, gram))
+                self.seq += 1
+            self.sent_records += n_full
+            self.pending = [a[n_full:] for a in new]
+        while self.delayed and self.delayed[0][0] <= now:
+            due, seq, gram = heapq.heappop (self.delayed)
+            try:
+                self.sock.sendto (gram, self.client)
+                self.sent += 1
+            except OSError:
+                pass
+
+    def run (self):
+        while not self.stop_event.is_set():
+            self.Control()
+            now = time.perf_counter()
+            self.Send (now)
+            wake = self.t0 + self.next_k / self.rate
+            if self.delayed:
+                wake = min (wake, self.delayed[0][0])
+            self.stop_event.wait (min (max (wake - time.perf_counter(), 0.0), MAX_SLEEP))
+
+    def Stop (self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join (1.0)
+        self.sock.close()
+
+    def Stats (self):
+        per_sample = len([k for k in self.kinds if k != "CL"])
+        per_s = len(self.sensors) * (self.rate * per_sample + ("CL" in self.kinds) / CAL_PERIOD)
+        return ({"sent":self.sent, "dropped":self.dropped, "records":self.sent_records,
+                 "records_per_s":per_s})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser (description="Simulated garment on a UDP port")
+    parser.add_argument ("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument ("--host", default="127.0.0.1")
+    parser.add_argument ("--sensors", type=int, default=len(SENSOR_IDS))
+    parser.add_argument ("--rate", type=float, default=100., help="samples per second per sensor")
+    parser.add_argument ("--kinds", default="SE", help="records to send, e.g. SE,SQ,AC,CL")
+    parser.add_argument ("--records", type=int, default=20, help="records per datagram")
+    parser.add_argument ("--loss", type=float, default=0.0, help="fraction of datagrams dropped")
+    parser.add_argument ("--jitter", type=float, default=0.0, help="most a datagram is delayed, s")
+    parser.add_argument ("--binary", action="store_true", help="send WireProtocol binary records")
+    parser.add_argument ("--motion", help="MotionGenerator motion, e.g. Squat, Bow, BicepCurl")
+    parser.add_argument ("--replay", help=".sat file to replay")
+    parser.add_argument ("--track", help="track in the replay file")
+    args = parser.parse_args()
+
+    if args.replay:
+        source = MotionSource.FromFile (args.replay, args.track)
+        if source is None:
+            sys.exit (1)
+    elif args.motion:
+        source = MotionSource.FromMotion (args.motion)
+    else:
+        source = None
+    sim = GarmentSim (args.port, args.host, source, args.sensors, args.rate, args.kinds.split (','),
+                      args.records, args.loss, args.jitter, wp.BINARY if args.binary else wp.TEXT)
+    sim.start()
+    print ("Garment on %s:%d, Ctrl-C to stop" % (args.host, sim.port))
+    try:
+        while True:
+            time.sleep (1.0)
+            print (sim.Stats())
+    except KeyboardInterrupt:
+        sim.Stop()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Renders tracks without a display, for turning recorded sessions into review
+videos and thumbnail strips on machines with no screen or GL. The figure is
+drawn by a small NumPy software rasteriser with the same camera as
+PlayerViewer (70 degree perspective, moved 120 down and 200 back), on the
+same floor and grid. Rods are drawn far to near as capsules (or thin lines
+for the stick figure), then the joints as discs. The poses for every frame
+come from Kinematics in one go, at a fixed frame rate over the track.
+
+Frames go to a raw RGB file (for ffmpeg -f rawvideo -pix_fmt rgb24) or to a
+folder of PNG images. Long tracks are split into blocks of frames rendered
+by a pool of worker processes, each writing its frames straight into the
+output.
+Classes are:
+    SoftwareRenderer - draws frames of the figure into NumPy images
+
+    python HeadlessRender.py Examples/testset.sat --track Bow --out bow.raw --thumbs bow.png
+"""
+
+import argparse
+import math as m
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import Player as pl
+import Kinematics as km
+import TrackBinary as tb
+import TrackIndex as ti
+
+DEFAULT_FPS   = 25.0
+DEFAULT_SIZE  = (640, 480)
+FIELD_OF_VIEW = 70.0            # As gluPerspective in PlayerViewer
+NEAR_PLANE    = 0.1
+CAMERA        = np.array ([0.0, -120.0, -200.0])   # As glTranslate in PlayerViewer
+GROUND_MIN    = -500
+GROUND_MAX    = 500
+GROUND_LINES  = 10
+ROD_RADIUS    = 2.0
+JOINT_RADIUS  = 3.0
+BACKGROUND    = (51, 51, 51)
+FLOOR_COLOUR  = (102, 153, 76)
+GRID_COLOUR   = (25, 25, 25)
+ROD_COLOUR    = (200, 200, 200)
+EDGE_COLOUR   = (2, 2, 2)
+JOINT_COLOUR  = (250, 48, 250)
+CHUNK_FRAMES  = 250             # Frames given to a worker at a time
+RAW_EXTENSION = ".raw"
+
+
+def WritePNG (filename, image):
+    """ Write an (H,W,3) uint8 image as a PNG file """
+    height, width = image.shape[:2]
+    rows = np.concatenate ((np.zeros ((height, 1), dtype=np.uint8),
+                            np.ascontiguousarray (image, dtype=np.uint8).reshape (height, -1)), axis=1)
+
+    def Chunk (kind, data):
+        return (struct.pack (">I", len(data)) + kind + data +
+                struct.pack (">I", zlib.crc32 (kind + data) & 0xffffffff))
+
+    with open (filename, "wb") as fp:
+        fp.write (b"\x89PNG\r\n\x1a\n")
+        fp.write (Chunk (b"IHDR", struct.pack (">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        fp.write (Chunk (b"IDAT", zlib.compress (rows.tobytes(), 6)))
+        fp.write (Chunk (b"IEND", b""))
+
+
+class SoftwareRenderer ():
+    """ Draws frames of a figure, given as the start and end of each rod and
+    the joint positions, into (H,W,3) uint8 images. solid draws the rods as
+    capsules with a dark edge, otherwise as lines """
+    def __init__ (self, size=DEFAULT_SIZE, solid=True, floor=True, grid=True):
+        self.width, self.height = size
+        self.solid = solid
+        self.focal = 1.0 / m.tan (m.radians (FIELD_OF_VIEW / 2))
+        self.floor = floor
+        self.grid  = grid
+        self.ys, self.xs = np.mgrid[0:self.height, 0:self.width].astype (np.float32) + 0.5
+        self.background = self._Background ()
+
+    def Project (self, points):
+        """ Pixel x, y and depth of world points (...,3) """
+        cam   = np.asarray (points, dtype=np.float64) + CAMERA
+        depth = -cam[...,2]
+        safe  = np.where (depth > NEAR_PLANE, depth, NEAR_PLANE)
+        aspect = self.width / self.height
+        x = (self.focal / aspect * cam[...,0] / safe + 1) * 0.5 * self.width
+        y = (1 - self.focal * cam[...,1] / safe) * 0.5 * self.height
+        return (x, y, depth)
+
+    def Scale (self, depth):
+        """ Pixels per world unit at depth """
+        return (self.focal * 0.5 * self.height / np.maximum (depth, NEAR_PLANE))
+
+    def _Clip (self, poly):
+        """ Polygon (list of world points) cut to in front of the near plane """
+        out = []
+        for k in range (len(poly)):
+            a, b = poly[k], poly[(k + 1) % len(poly)]
+            da, db = -(a[2] + CAMERA[2]) - NEAR_PLANE, -(b[2] + CAMERA[2]) - NEAR_PLANE
+            if da >= 0:
+                out.append (a)
+            if (da >= 0) != (db >= 0):
+                out.append (a + (b - a) * (da / (da - db)))
+        return (out)
+
+    def _Box (self, x0, x1, y0, y1):
+        """ Pixel slices of a box, None if it is off the image """
+        c0, c1 = max (int (m.floor (x0)), 0), min (int (m.ceil (x1)) + 1, self.width)
+        r0, r1 = max (int (m.floor (y0)), 0), min (int (m.ceil (y1)) + 1, self.height)
+        if c0 >= c1 or r0 >= r1:
+            return (None)
+        return (slice (r0, r1), slice (c0, c1))
+
+    def Polygon (self, image, poly, colour):
+        """ Fill a convex polygon of world points """
+        poly = self._Clip ([np.asarray (p, dtype=np.float64) for p in poly])
+        if len(poly) < 3:
+            return
+        x, y, _ = self.Project (np.array (poly))
+        box = self._Box (x.min(), x.max(), y.min(), y.max())
+        if box is None:
+            return
+        px, py = self.xs[box], self.ys[box]
+        inside = np.ones (px.shape, dtype=bool)
+        sign = np.sign (np.sum (x * np.roll (y, -1) - np.roll (x, -1) * y))
+        for k in range (len(x)):
+            k1 = (k + 1) % len(x)
+            inside &= sign * ((x[k1] - x[k]) * (py - y[k]) - (y[k1] - y[k]) * (px - x[k])) >= 0
+        image[box][inside] = colour
+
+    def Segment (self, image, a, b, radius, colour, edge=None):
+        """ Draw the 2D segment a to b (pixel x, y) radius pixels thick, with
+        an edge of one pixel in colour edge if given """
+        reach = radius + 1
+        box = self._Box (min (a[0], b[0]) - reach, max (a[0], b[0]) + reach,
+                         min (a[1], b[1]) - reach, max (a[1], b[1]) + reach)
+        if box is None:
+            return
+        px, py = self.xs[box] - a[0], self.ys[box] - a[1]
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        length = dx * dx + dy * dy
+        t = np.clip ((px * dx + py * dy) / length, 0.0, 1.0) if length > 0 else 0.0
+        dist = np.hypot (px - t * dx, py - t * dy)
+        patch = image[box]
+        if edge is not None:
+            patch[dist <= radius + 1] = edge
+        patch[dist <= radius] = colour
+
+    def Line (self, image, a, b, colour):
+        """ One pixel line between world points, cut to the near plane """
+        seg = self._Clip ([np.asarray (a, dtype=np.float64), np.asarray (b, dtype=np.float64)])
+        if len(seg) < 2:
+            return
+        x, y, _ = self.Project (np.array (seg[:2]))
+        self.Segment (image, (x[0], y[0]), (x[1], y[1]), 0.5, colour)
+
+    def _Background (self):
+        image = np.empty ((self.height, self.width, 3), dtype=np.uint8)
+        image[:] = BACKGROUND
+        if self.floor:
+            self.Polygon (image, ((GROUND_MIN, 0, GROUND_MAX), (GROUND_MIN, 0, GROUND_MIN),
+                                  (GROUND_MAX, 0, GROUND_MIN), (GROUND_MAX, 0, GROUND_MAX)), FLOOR_COLOUR)
+        if self.grid:
+            step = int ((GROUND_MAX - GROUND_MIN) / GROUND_LINES)
+            for i in range (GROUND_MIN, GROUND_MAX, step):
+                self.Line (image, (i, 0, GROUND_MAX), (i, 0, GROUND_MIN), GRID_COLOUR)
+                self.Line (image, (GROUND_MAX, 0, i), (GROUND_MIN, 0, i), GRID_COLOUR)
+        return (image)
+
+    def Frame (self, start, end, joints, out=None):
+        """ Image of one figure, start and end (rods,3) and joints (n,3) """
+        image = out if out is not None else np.empty_like (self.background)
+        image[:] = self.background
+        sx, sy, sd = self.Project (start)
+        ex, ey, ed = self.Project (end)
+        jx, jy, jd = self.Project (joints)
+        # Rods far to near by the depth of their middle, then the joints,
+        # which being wider than the rods are seen over them
+        items  = sorted (((0.5 * (sd[k] + ed[k]), 0, k) for k in range (len(sd))), reverse=True)
+        items += sorted (((jd[k], 1, k) for k in range (len(jd))), reverse=True)
+        for depth, kind, k in items:
+            if depth <= NEAR_PLANE:
+                continue
+            if kind == 1:
+                self.Segment (image, (jx[k], jy[k]), (jx[k], jy[k]),
+                              JOINT_RADIUS * self.Scale (depth), JOINT_COLOUR)
+            elif self.solid:
+                self.Segment (image, (sx[k], sy[k]), (ex[k], ey[k]),
+                              ROD_RADIUS * self.Scale (depth), ROD_COLOUR, EDGE_COLOUR)
+            else:
+                self.Segment (image, (sx[k], sy[k]), (ex[k], ey[k]), 1.0, ROD_COLOUR)
+        return (image)
+
+
+def TrackFigure (track, fps=DEFAULT_FPS, times=None):
+    """ Frame times over track at fps (or the given times) with the start
+    and end of every rod, (N,rods,3), and the joints, (N,joints,3). Joints
+    are drawn at the start of the rods, once each """
+    player = track.player
+    body = pl.Body (player.model, player.height) if player else pl.Body ("standard", 1.0)
+    if track.calibrate:
+        body.UpdateCalibrate (track.calibrate)
+    if times is None:
+        _, all_times = track.store.TimeOrder()      # First and last in time, not as recorded
+        if len(all_times) == 0:
+            times = np.empty (0)
+        else:
+            times = all_times[0] + np.arange (0.0, all_times[-1] - all_times[0], 1.0 / fps)
+    skeleton = km.Skeleton (body)
+    end = skeleton.Pose (km.TrackAngles (track, times), len(times))
+    parent = skeleton.parent
+    start  = np.where ((parent < 0)[None,:,None], skeleton.tran, end[:,np.maximum (parent, 0)])
+    at     = np.unique (parent)
+    joints = np.where ((at < 0)[None,:,None], skeleton.tran, end[:,np.maximum (at, 0)])
+    return (times, start, end, joints)
+
+def _RenderBlock (spec):
+    """ Worker: render frames first to first+n into the output """
+    out, fmt, total, size, solid, first, start, end, joints = spec
+    renderer = SoftwareRenderer (size, solid)
+    if fmt == "raw":
+        frames = np.memmap (out, dtype=np.uint8, mode="r+", shape=(total, size[1], size[0], 3))
+        for i in range (len(start)):
+            renderer.Frame (start[i], end[i], joints[i], out=frames[first + i])
+        frames.flush()
+        del frames
+    else:
+        image = np.empty_like (renderer.background)
+        for i in range (len(start)):
+            WritePNG (os.path.join (out, "frame_%06d.png" % (first + i)),
+                      renderer.Frame (start[i], end[i], joints[i], out=image))
+    return (len(start))
+
+def RenderTrack (track, out, fps=DEFAULT_FPS, size=DEFAULT_SIZE, solid=True, workers=None):
+    """ Render track at fps into out, a raw RGB file if it ends in
+    RAW_EXTENSION or else a folder of PNG images. Blocks of CHUNK_FRAMES
+    frames are shared among workers processes (all cores if None, in this
+    process if 1). Returns the number of frames """
+    times, start, end, joints = TrackFigure (track, fps)
+    total = len(times)
+    fmt = "raw" if out.lower().endswith (RAW_EXTENSION) else "png"
+    if fmt == "raw":
+        with open (out, "wb") as fp:
+            fp.truncate (total * size[0] * size[1] * 3)
+    else:
+        os.makedirs (out, exist_ok=True)
+    specs = [(out, fmt, total, size, solid, k, start[k:k+CHUNK_FRAMES], end[k:k+CHUNK_FRAMES],
+              joints[k:k+CHUNK_FRAMES]) for k in range (0, total, CHUNK_FRAMES)]
+    if workers == 1 or len(specs) <= 1:
+        done = sum (_RenderBlock (spec) for spec in specs)
+    else:
+        with ProcessPoolExecutor (max_workers=workers) as pool:
+            done = sum (pool.map (_RenderBlock, specs))
+    return (done)
+
+def RenderFrames (track, fps=DEFAULT_FPS, size=DEFAULT_SIZE, solid=True):
+    """ Every frame of track in memory, an (N,H,W,3) uint8 array """
+    times, start, end, joints = TrackFigure (track, fps)
+    renderer = SoftwareRenderer (size, solid)
+    frames = np.empty ((len(times), size[1], size[0], 3), dtype=np.uint8)
+    for i in range (len(times)):
+        renderer.Frame (start[i], end[i], joints[i], out=frames[i])
+    return (frames)
+
+def ThumbnailStrip (track, filename, count=10, size=DEFAULT_SIZE, shrink=4, solid=True):
+    """ count frames spread evenly over track, each shrunk by shrink (block
+    average), side by side in a PNG file. Returns the strip """
+    _, all_times = track.store.TimeOrder()
+    if len(all_times) == 0:
+        return (None)
+    times = np.linspace (all_times[0], all_times[-1], count)
+    _, start, end, joints = TrackFigure (track, times=times)
+    renderer = SoftwareRenderer (size, solid)
+    height, width = size[1] // shrink, size[0] // shrink
+    thumbs = []
+    for i in range (count):
+        image = renderer.Frame (start[i], end[i], joints[i])[:height * shrink,:width * shrink]
+        thumbs.append (image.reshape (height, shrink, width, shrink, 3).mean (axis=(1, 3)).astype (np.uint8))
+    strip = np.concatenate (thumbs, axis=1)
+    WritePNG (filename, strip)
+    return (strip)
+
+def ReadTracks (filename):
+    """ Tracks of a .sat or .sab file """
+    if tb.IsBinary (filename):
+        return (tb.ReadTracks (filename))
+    return (ti.LazyTrackList (filename))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser (description="Render tracks to video frames and thumbnails without a display")
+    parser.add_argument ("file", help=".sat or .sab track file")
+    parser.add_argument ("--track", help="track to render, the first if not given")
+    parser.add_argument ("--out", help="raw RGB file (" + RAW_EXTENSION + ") or folder for PNG frames")
+    parser.add_argument ("--thumbs", help="PNG file for a thumbnail strip")
+    parser.add_argument ("--count", type=int, default=10, help="thumbnails in the strip")
+    parser.add_argument ("--fps", type=float, default=DEFAULT_FPS)
+    parser.add_argument ("--size", default="%dx%d" % DEFAULT_SIZE, help="frame size, WxH")
+    parser.add_argument ("--stick", action="store_true", help="draw rods as lines")
+    parser.add_argument ("--workers", type=int, help="worker processes, all cores if not given")
+    args = parser.parse_args()
+
+    size = tuple (int (v) for v in args.size.lower().split ('x'))
+    tracks = [trk for trk in ReadTracks (args.file) if args.track is None or trk.name == args.track]
+    if not tracks:
+        print ("No track", args.track, "in", args.file)
+        sys.exit (1)
+    track = tracks[0]
+    if args.out:
+        n = RenderTrack (track, args.out, args.fps, size, not args.stick, args.workers)
+        print ("Rendered %d frames of %s to %s" % (n, track.name, args.out))
+        if args.out.lower().endswith (RAW_EXTENSION):
+            print ("ffmpeg -f rawvideo -pix_fmt rgb24 -s %dx%d -r %g -i %s video.mp4" %
+                   (size[0], size[1], args.fps, args.out))
+    if args.thumbs:
+        ThumbnailStrip (track, args.thumbs, args.count, size, solid=not args.stick)
+        print ("Thumbnails of %s in %s" % (track.name, args.thumbs))
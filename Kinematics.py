@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Batched forward kinematics. Body and Rod work out the pose for one set of
+angles at a time by recursing over the skeleton. Here the
+skeleton is flattened into arrays (parent index and rod vector per joint, in
+the order Body.OutputPos gives them) and the pose is worked out for N frames
+at once, the rotations being (N,3,3) arrays from Rotation.EulerMatrices.
+Classes are:
+    Skeleton - flattened copy of a Body
+
+The rules are those of Rod.UpdateRod: a joint with an angle is rotated by
+RotationMat(angle) on top of its parent's rotation, a joint without one takes
+its parent's rotation, and the end of each rod is its parent's end plus the
+rotated rod vector.
+"""
+
+import numpy as np
+import Rotation as rt
+import TrackStore as ts
+
+
+class Skeleton ():
+    """ Flattened Body. Joint j is the end of rod names[j], parent[j] is the
+    index of the rod it hangs off (-1 for the rods on the root) """
+    def __init__ (self, body):
+        self.names  = []
+        self.parent = []
+        self.orig   = []
+        for rod in body.root:
+            self._Add (rod, -1)
+        self.parent = np.array (self.parent, dtype=np.int64)
+        self.orig   = np.array (self.orig, dtype=np.float64)
+        self.index  = {name:j for j, name in enumerate (self.names)}
+        self.tran   = np.array (body.tran, dtype=np.float64)
+        # Root rotation as in Body.Update
+        self.root_rot = rt.CachedRootMatrix (body.rotate, body.calibrate)
+
+    def _Add (self, rod, parent):
+        """ Add rod and the rods below it, depth first as Rod.OutputPos """
+        j = len(self.names)
+        self.names.append (rod.name)
+        self.parent.append (parent)
+        self.orig.append (np.asarray (rod.orig, dtype=np.float64))
+        for item in rod.next:
+            self._Add (item, j)
+
+    def __len__ (self):
+        return (len(self.names))
+
+    def Forward (self, angles, valid):
+        """ Joint positions for N frames. angles is (N,joints,3) in degrees and
+        valid (N,joints) says which joints have an angle in each frame.
+        Returns an (N,joints,3) array """
+        n, n_joints = valid.shape
+        rot = np.empty ((n, n_joints, 3, 3))
+        pos = np.empty ((n, n_joints, 3))
+        for j in range (n_joints):
+            p = self.parent[j]
+            rot_prev = np.broadcast_to (self.root_rot, (n, 3, 3)) if p < 0 else rot[:,p]
+            pos_prev = self.tran if p < 0 else pos[:,p]
+            rot[:,j] = rot_prev
+            have = np.flatnonzero (valid[:,j])
+            if len(have):
+                rot[have,j] = rt.EulerMatrices (angles[have,j]) @ rot_prev[have]
+            pos[:,j] = pos_prev + rot[:,j] @ self.orig[j]
+        return (pos)
+
+    def Angles (self, limb_angles, n):
+        """ (N,joints,3) angles and (N,joints) valid arrays from a dict of limb
+        name: (N,3) angles with NaN where there is no angle """
+        angles = np.zeros ((n, len(self), 3))
+        valid  = np.zeros ((n, len(self)), dtype=bool)
+        for limb, ang in limb_angles.items():
+            if limb in self.index:
+                j = self.index[limb]
+                valid[:,j]  = ~np.isnan (ang).any (axis=1)
+                angles[:,j] = np.where (valid[:,j,None], ang, 0.0)
+        return (angles, valid)
+
+    def Pose (self, limb_angles, n):
+        """ Joint positions (N,joints,3) for a dict of limb name: (N,3) angles """
+        return (self.Forward (*self.Angles (limb_angles, n)))
+
+
+def TrackAngles (track, times, msg="SA_EUL_ANG"):
+    """ Latest angle of each limb of the track at each of times, as a dict of
+    limb name: (N,3) array with NaN before the limb's first sample. Limbs are
+    given by the track's sensor_dict. The samples need not have been recorded
+    in time order """
+    cols  = track.store.columns[msg]
+    tim   = cols.Time()
+    sen   = cols.Column ("sensor")
+    ang   = [cols.Column (f) for f in ("angle_X", "angle_Y", "angle_Z")]
+    limbs = {}
+    for sensor, limb in track.sensor_dict.items():
+        rows = np.flatnonzero (sen == sensor)
+        order, sensor_times = ts.SortTimes (tim[rows])
+        if order is not None:
+            rows = rows[order]
+        last = np.searchsorted (sensor_times, times, side="right") - 1
+        out  = np.full ((len(times), 3), np.nan)
+        have = last >= 0
+        pick = rows[last[have]]
+        for k in range (3):
+            out[have,k] = ang[k][pick]
+        limbs[limb] = out
+    return (limbs)
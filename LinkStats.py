@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Statistics on the data arriving from a garment, so a choppy replay can be put
+down to the network or to the program. For each connection the packets are
+counted with their arrival rate and inter-arrival jitter, and for each sensor
+stream (message type and sensor number) the embedded sensor timestamps are
+used to find gaps, samples arriving out of order and duplicates. Jitter of a
+stream is worked out as in RFC 3550, from the change in arrival time minus
+sensor time, so clock offsets do not matter. The samples of a datagram all
+arrive at once, so the transit is taken once a datagram for each stream, from
+its newest sample. Times are in seconds.
+Classes are:
+    StreamStats - counters for one sensor stream
+    LinkStats   - counters for a connection and its streams
+"""
+
+import time
+from collections import Counter
+import numpy as np
+import TrackStore as ts
+
+RATE_WINDOW = 1.0   # Seconds over which rates are measured
+GAP_FACTOR  = 1.5   # A step of more than this many periods is a gap
+SMOOTH      = 16    # Smoothing of jitter and period, as RFC 3550
+
+
+def _Stale (last, now=None):
+    """ True if nothing has arrived since last for a rate window, a rate
+    measured then is out of date """
+    now = time.perf_counter() if now is None else now
+    return (last is None or now - last > RATE_WINDOW)
+
+
+class StreamStats ():
+    """ Counters for the samples of one message type from one sensor """
+    def __init__ (self):
+        self.count      = 0
+        self.max_time   = None  # Newest sensor time seen
+        self.period     = None  # Smoothed step between sensor times
+        self.transit    = None  # Arrival time - sensor time of the last datagram
+        self.jitter     = 0.0
+        self.gaps       = 0
+        self.lost       = 0     # Samples still missing in the gaps
+        self.reordered  = 0
+        self.duplicates = 0
+        self.rate       = 0.0   # Samples per second on arrival
+        self.last       = None  # Arrival of the newest sample
+        self.win_start  = None
+        self.win_count  = 0
+
+    def _Count (self, arrival, n):
+        """ Count n samples arriving together """
+        self.count += n
+        self.last   = arrival
+        if self.win_start is None:
+            self.win_start = arrival
+        elif arrival - self.win_start >= RATE_WINDOW:
+            self.rate      = self.win_count / (arrival - self.win_start)
+            self.win_start = arrival
+            self.win_count = 0
+        self.win_count += n
+
+    def Add (self, arrival, sensor_time):
+        """ Count a sample and check its sensor time against the stream """
+        self._Count (arrival, 1)
+        self.Sequence (sensor_time)
+
+    def Extend (self, arrival, times):
+        """ Count the samples of the stream in a datagram, times a list of the
+        sensor times in the order they came, and take the transit from the
+        newest """
+        self._Count (arrival, len(times))
+        for sensor_time in times:
+            self.Sequence (sensor_time)
+        self.Transit (arrival, max (times))
+
+    def Sequence (self, sensor_time):
+        """ Check a sensor time for gaps, reordering and duplicates """
+        if self.max_time is None:
+            self.max_time = sensor_time
+            return
+        step = sensor_time - self.max_time
+        if step == 0:
+            self.duplicates += 1
+            return
+        if step < 0:
+            # Late, so most likely one of the samples counted as lost
+            self.reordered += 1
+            self.lost = max (self.lost - 1, 0)
+            return
+        if self.period is not None and step > GAP_FACTOR * self.period:
+            self.gaps += 1
+            self.lost += int (round (step / self.period)) - 1
+        elif self.period is None:
+            self.period = step
+        else:
+            self.period += (step - self.period) / SMOOTH
+        self.max_time = sensor_time
+
+    def Transit (self, arrival, sensor_time):
+        """ Update the jitter from the newest sample of the stream in a datagram """
+        transit = arrival - sensor_time
+        if self.transit is not None:
+            self.jitter += (abs (transit - self.transit) - self.jitter) / SMOOTH
+        self.transit = transit
+
+    def Rate (self, now=None):
+        """ Samples per second, 0 once the stream has stopped """
+        return (0.0 if _Stale (self.last, now) else self.rate)
+
+    def Stats (self):
+        return ({"count":self.count, "rate":self.Rate(), "period":self.period, "jitter":self.jitter,
+                 "gaps":self.gaps, "lost":self.lost, "reordered":self.reordered,
+                 "duplicates":self.duplicates})
+
+
+class LinkStats ():
+    """ Packet counters for a connection and StreamStats for each of its
+    sensor streams, keyed by (message name, sensor) """
+    def __init__ (self):
+        self.packets   = 0
+        self.bytes     = 0
+        self.rate      = 0.0    # Packets per second
+        self.interval  = None   # Smoothed time between packets
+        self.jitter    = 0.0    # Smoothed deviation from interval
+        self.last      = None
+        self.win_start = None
+        self.win_count = 0
+        self.errors    = Counter()  # Decode errors by reason
+        self.streams   = {}
+
+    def Packet (self, arrival, size):
+        """ Count a packet, arrival from time.perf_counter """
+        self.packets += 1
+        self.bytes   += size
+        if self.last is not None:
+            delta = arrival - self.last
+            if self.interval is None:
+                self.interval = delta
+            else:
+                self.jitter   += (abs (delta - self.interval) - self.jitter) / SMOOTH
+                self.interval += (delta - self.interval) / SMOOTH
+        self.last = arrival
+        if self.win_start is None:
+            self.win_start = arrival
+        elif arrival - self.win_start >= RATE_WINDOW:
+            self.rate      = self.win_count / (arrival - self.win_start)
+            self.win_start = arrival
+            self.win_count = 0
+        self.win_count += 1
+
+    def Block (self, arrival, store, start):
+        """ Count the samples of a datagram, those from start on in the
+        TrackStore store """
+        kind = store.kind[start:store.count]
+        row  = store.row[start:store.count]
+        for name, msg in store.columns.items():
+            rows = row[kind == ts.MSG_CODE[name]]
+            if len(rows) == 0:
+                continue
+            # Group by sensor with one stable sort, keeping the order they came
+            sensors = msg.cols["sensor"][rows]
+            order   = np.argsort (sensors, kind="stable")
+            sensors = sensors[order]
+            times   = msg.time[rows[order]].tolist()
+            starts  = np.flatnonzero (np.append (True, sensors[1:] != sensors[:-1])).tolist()
+            for sensor, begin, end in zip (sensors[starts].tolist(), starts, starts[1:] + [len(times)]):
+                key = (name, sensor)
+                if key not in self.streams:
+                    self.streams[key] = StreamStats()
+                self.streams[key].Extend (arrival, times[begin:end])
+        others = row[kind == ts.OTHER_CODE]
+        if len(others):
+            self.Elements (arrival, [store.other[r] for r in others.tolist()])
+
+    def Elements (self, arrival, elements):
+        """ Count the elements decoded from a packet """
+        streams = self.streams
+        newest  = {}    # Key: newest sensor time in the packet
+        for elem in elements:
+            key = (elem.name, elem.data.get ("sensor"))
+            if key not in streams:
+                streams[key] = StreamStats()
+            streams[key].Add (arrival, elem.time)
+            if key not in newest or elem.time > newest[key]:
+                newest[key] = elem.time
+        for key, sensor_time in newest.items():
+            streams[key].Transit (arrival, sensor_time)
+
+    def Stale (self, now=None):
+        """ True if nothing has arrived for a rate window, the rates shown are
+        then out of date """
+        return (_Stale (self.last, now))
+
+    def Totals (self):
+        """ Connection counters with the stream counters summed """
+        out = {"packets":self.packets, "bytes":self.bytes, "rate":0.0 if self.Stale() else self.rate,
+               "interval":self.interval, "jitter":self.jitter,
+               "decode_errors":sum (self.errors.values()),
+               "gaps":0, "lost":0, "reordered":0, "duplicates":0}
+        for stream in self.streams.values():
+            for key in ("gaps", "lost", "reordered", "duplicates"):
+                out[key] += getattr (stream, key)
+        return (out)
+
+    def Stats (self):
+        """ Totals plus the errors by reason and the stats of every stream """
+        out = self.Totals()
+        out["errors"]  = dict (self.errors)
+        out["streams"] = {key:stream.Stats() for key, stream in sorted (self.streams.items(), key=lambda kv: str(kv[0]))}
+        return (out)
+
+    def Summary (self, label):
+        """ A few lines of text for the garment status window """
+        tot = self.Totals()
+        lines = ["%s: %.0f pkt/s  jitter %.1f ms" % (label, tot["rate"], 1000 * tot["jitter"]),
+                 "  lost %d (%d gaps)  reordered %d  dup %d  errors %d" %
+                 (tot["lost"], tot["gaps"], tot["reordered"], tot["duplicates"], tot["decode_errors"])]
+        rates = {}
+        now   = time.perf_counter()
+        for (name, sensor), stream in self.streams.items():
+            if name == "SA_EUL_ANG":
+                rates[sensor] = stream.Rate (now)
+        if rates:
+            lines.append ("  " + "  ".join ("S%s %.0fHz" % (sen, rate) for sen, rate in sorted (rates.items())))
+        return ("\n".join (lines))
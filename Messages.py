@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+The garment messages shared by the modules that store, send and receive them:
+the Element that holds one sample, the table of message types kept as columns
+(see TrackStore) and the decoding of the text records sent by the garment.
+Kept apart from StreamData so TrackStore and WireProtocol, which StreamData
+uses, need not import StreamData. StreamData gives the same names as before.
+Classes are:
+    Element - basic element in a time series contains data at a particular time
+"""
+
+import numpy as np
+
+# Fields stored for each message type we know about, time is always stored
+# as float64 alongside these. Anything not in this table is kept as Element
+# objects in TrackStore.other
+MSG_FIELDS = {
+    "SA_EUL_ANG" : (("sensor", np.int16), ("angle_X", np.float32), ("angle_Y", np.float32), ("angle_Z", np.float32)),
+    "SA_ACC_LIN" : (("sensor", np.int16), ("acc_X", np.float32), ("acc_Y", np.float32), ("acc_Z", np.float32)),
+    "SA_BNO_QUA" : (("sensor", np.int16), ("qw", np.float32), ("qx", np.float32), ("qy", np.float32), ("qz", np.float32)),
+    "SA_BNO_EUL" : (("sensor", np.int16), ("angle_x", np.float32), ("angle_y", np.float32), ("angle_z", np.float32)),
+    "SA_BNO_CAL" : (("sensor", np.int16), ("cal", np.int16)),
+    }
+MSG_NAMES  = list (MSG_FIELDS.keys())
+MSG_CODE   = {name:i for i, name in enumerate (MSG_NAMES)}
+OTHER_CODE = 255        # Kind used for samples stored as Element objects
+
+
+# Element is the basic element in our time series which consists of a list
+# of Elements. The dictionary can hold different types of data
+class Element ():
+    def __init__ (self, name, time, data_dict):
+        self.name      = name
+        self.time      = time       # Time in seconds
+        self.data_time = None       # Time in date_time form, not always filled in
+        self.data      = data_dict
+            
+    def Print (self):
+        print (self.name, self.time, self.data)
+        
+    def String (self):
+        return  (self.name + "," + str(self.time) + "," + dict_string (self.data))
+    
+    def Read (self, str_items):
+        """ Read and store element data using array of string items containing 
+        information"""   
+        length = len(str_items)
+        self.name = str_items [0]
+        self.time = float (str_items[1])
+        self.data = {}
+        for i in range (2, length, 2):
+            if (self.IsFloat(str_items[i])):
+                self.data[str_items[i]] = float (str_items[i+1])
+            elif (self.IsInt(str_items[i])):
+                self.data[str_items[i]] = int (str_items[i+1])
+            else:
+                print (str_items[i])
+                self.data[str_items[i]] = str_items[i+1]                
+        
+    def IsFloat (self, name):
+        fl_names = ["angle_X", "angle_Y", "angle_Z", "acc_X", "acc_Y", "acc_Z"]
+        return (name in fl_names)
+        
+    def IsInt (self, name):
+        int_names = ["sensor"]
+        return (name in int_names)
+
+
+def dict_string ( dct ):
+    """ Convert dictionary to string
+    """
+    line = ""
+    for key, value in dct.items():
+        line += str(key) + "," + str(value) + ","
+        
+    if len(line) > 0:
+        return (line[0:-1])   # Don't include final commma
+    else:
+        return (line)
+
+def DecodeError (errors, reason, *msg):
+    """ Count a decode problem in the errors Counter, or print it if there is
+    no Counter """
+    if errors is None:
+        print (*msg)
+    else:
+        errors[reason] += 1
+
+#
+# Reads data string from sensor and returns a list of elements for processing
+# NOT COMPLETE Still needs to be worked on
+def translate_elem ( item, errors=None ):
+    """ Elements for the text records in item. Bad records are skipped, and
+    counted by reason in errors (a collections.Counter) if given rather than
+    printed """
+    lines = item.split (';')
+    ele_list = []
+    for line in lines[:-1]:   # Don't include blank item
+        li = line.split (',')
+        try:
+            if li[0] == 'SQ':
+                if len (li) == 7:
+                    name = "SA_BNO_QUA"
+                    sensor = int (li[1])
+                    time   = float(li[2])/1000.
+                    data   = {"sensor":sensor, "qw":float(li[3]), "qx":float(li[4]), "qy":float(li[5]), "qz":float(li[6])}
+                    new_elem = Element (name, time, data)
+                    ele_list.append (new_elem)
+                else:
+                    DecodeError (errors, "SQ length", "Wrong number of parameters for SQ, expecting 7 got ", len(li), li)
+     
+            elif li[0] == 'SE':
+                if len (li) == 6:
+                    name = "SA_EUL_ANG"
+                    sensor = int (li[1])
+                    time   = float(li[2])/1000.
+                    data   = {"sensor":sensor, "angle_X":float(li[3]), "angle_Y":float(li[4]), "angle_Z":float(li[5])}
+                    new_elem = Element (name, time, data)
+                    ele_list.append (new_elem)
+                else:
+                    DecodeError (errors, "SE length", "Wrong number of parameters for SE, expecting 6 got ", len(li), li)
+                    
+            elif li[0] == 'SO':
+                if len (li) == 6:
+                    name = "SA_BNO_EUL"
+                    sensor = int (li[1])
+                    time   = float(li[2])/1000.
+                    data   = {"sensor":sensor, "angle_x":float(li[3]), "angle_y":float(li[4]), "angle_z":float(li[5])}
+                    new_elem = Element (name, time, data)
+                    ele_list.append (new_elem)
+                else:
+                    DecodeError (errors, "SO length", "Wrong number of parameters for SO, expecting 6 got ", len(li), li)
+                    
+            elif li[0] == 'CL':
+                if len(li) == 4:
+                    name = "SA_BNO_CAL"
+                    sensor = int (li[1])
+                    time   = float(li[2])/1000.
+                    data   = {"sensor":sensor, "cal":int(li[3])}
+                    new_elem = Element (name, time, data)
+                    ele_list.append (new_elem)
+                else:
+                    DecodeError (errors, "CL length", "Wrong number of parameters for CL, expecting 4 got ", len(li), li)
+                    
+            elif li[0] == 'AC':
+                if len(li) == 6:
+                    name = "SA_ACC_LIN"
+                    sensor = int (li[1])
+                    time   = float(li[2])/1000.
+                    data   = {"sensor":sensor, "acc_X":float(li[3]), "acc_Y":float(li[4]), "acc_Z":float(li[5])}
+                    new_elem = Element (name, time, data)
+                    ele_list.append (new_elem)
+                else:
+                    DecodeError (errors, "AC length", "Wrong number of parameters for AC, expecting 6 got ", len(li), li)
+            else:
+                DecodeError (errors, "unknown", "Unknown item: ", item )
+        except ValueError:
+            DecodeError (errors, "bad number", "Bad number in record: ", li)
+        
+    return (ele_list)
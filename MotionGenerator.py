@@ -1,17 +1,299 @@
 # -*- coding: utf-8 -*-
 """
 Simple routine to create a set of motion data for testing SA_visualizer
-software
+software. Motions are made as arrays for all 15 sensors at once (a Clip),
+which can be joined one after another, looped, laid over each other,
+resampled to another rate and given noise and dropped samples. A clip can
+be built straight into a Track in memory or written to a .sat file, where
+the lines are formatted a block at a time with NumPy and looped clips are
+written in chunks, so large test files take seconds rather than minutes,
+or to a binary track file (.sab).
+
+    clip = mg.Squat (period=4.).Then (mg.Bow (5.)).Loop (100).Noise (0.5, seed=1)
+    clip.Save ("stress.sat", "Squat_Bow")
+    track = mg.BicepCurl (t_step=0.01).Track ("Curl")
+
+Classes are:
+    Clip   - SA_EUL_ANG angles of every sensor over time
+    Motion - writes the motions to files in a folder, appending as before
+
+    python MotionGenerator.py out.sat [--motions Squat Bow] [--repeat 100] ...
 
 Created on Sun May 15 10:33:31 2022
 
 @author: Paul Gough
 """
+import argparse
 from datetime import datetime
-from math import sin, pi
 import os
+import numpy as np
+import StreamData as sd
+import TrackStore as ts
+import TrackBinary as tb
+import Player as pl
+
+SENSORS = (3, 2, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16)    # In the order of the limb table
+LIMBS   = {3:"RightLowerarm", 2:"RightUpperarm", 4:"LeftLowerarm", 5:"Spine", 6:"LeftUpperarm",
+           7:"RightHip", 8:"RightKnee", 9:"RightAnkle", 10:"RightFoot", 11:"LeftHip", 12:"LeftKnee",
+           13:"LeftAnkle", 14:"LeftFoot", 15:"RightHand", 16:"LeftHand"}
+COLUMN  = {sensor:j for j, sensor in enumerate (SENSORS)}
+MOTIONS = ("Squat", "FoldArms", "BicepCurl", "Bow")
+AXES    = ("angle_X", "angle_Y", "angle_Z")
+TIME_FORMAT  = "%d/%m/%Y %H:%M:%S"
+TIME_DECIMALS  = 3      # Decimals of times and angles in .sat files, as before
+ANGLE_DECIMALS = 2
+TABLE_MAX   = 1 << 20   # Most distinct values formatted once and looked up
+CHUNK_STEPS = 16384     # Time steps of a clip formatted and written at a time
+
+
+def _Format (scaled, decimals):
+    """ Text of the integers scaled / 10**decimals, as a right aligned (n,
+    width) byte matrix and the length of each """
+    neg    = scaled < 0
+    mag    = np.abs (scaled)
+    point  = 1 if decimals else 0
+    whole  = mag // 10**decimals
+    digits = np.ones (len(mag), dtype=np.int64)     # Digits before the point
+    while True:
+        big = whole >= 10**digits
+        if not big.any():
+            break
+        digits += big
+    length = digits + point + decimals + neg
+    width  = int (length.max()) if len(mag) else 1
+    chars  = np.empty ((len(mag), width), dtype=np.uint8)
+    rest   = mag.copy()
+    for k in range (width - 1, -1, -1):
+        if point and k == width - 1 - decimals:
+            chars[:,k] = ord ('.')
+            continue
+        chars[:,k] = rest % 10 + ord ('0')
+        rest //= 10
+    rows = np.flatnonzero (neg)
+    chars[rows, width - length[rows]] = ord ('-')
+    return (chars, length)
+
+def FormatFixed (values, decimals):
+    """ values to decimals places, as _Format. When the values have few
+    distinct scaled values each is formatted once and looked up """
+    scaled = np.round (np.asarray (values, dtype=np.float64) * 10.0**decimals).astype (np.int64)
+    if len(scaled) == 0:
+        return (_Format (scaled, decimals))
+    lo, hi = int (scaled.min()), int (scaled.max())
+    if hi - lo < min (TABLE_MAX, len(scaled)):
+        chars, length = _Format (np.arange (lo, hi + 1), decimals)
+        return (chars[scaled - lo], length[scaled - lo])
+    return (_Format (scaled, decimals))
+
+def _Lines (pieces, n):
+    """ Bytes of n lines made of pieces, each a constant string or a (chars,
+    length) pair from FormatFixed """
+    chars, valid = [], []
+    for piece in pieces:
+        if isinstance (piece, str):
+            text = np.frombuffer (piece.encode ('ascii'), dtype=np.uint8)
+            chars.append (np.broadcast_to (text, (n, len(text))))
+            valid.append (np.ones ((n, len(text)), dtype=bool))
+        else:
+            mat, length = piece
+            chars.append (mat)
+            valid.append (np.arange (mat.shape[1])[None,:] >= (mat.shape[1] - length)[:,None])
+    return (np.concatenate (chars, axis=1)[np.concatenate (valid, axis=1)].tobytes())
+
+
+def NewTrack (name, height=1.6, player="Marvin"):
+    """ Empty track with the player and limb table of the motions """
+    trk = sd.Track (name)
+    trk.player      = pl.Player (player, "standard", height)
+    trk.sensor_dict = dict (LIMBS)
+    trk.start_time  = datetime.now().strftime (TIME_FORMAT)
+    return (trk)
+
+
+class Clip ():
+    """ SA_EUL_ANG angles of every sensor at each time step. times is (N,),
+    angles (N, 15, 3) in degrees with the sensors in SENSORS order, and sent
+    (N, 15) is True where a sensor sends its angles. period is the time from
+    the start of the clip to the start of whatever follows it """
+    def __init__ (self, times, angles, sent, period):
+        self.times  = np.asarray (times, dtype=np.float64)
+        self.angles = angles
+        self.sent   = sent
+        self.period = float (period)
+
+    def __len__ (self):
+        """ Number of samples sent """
+        return (int (np.count_nonzero (self.sent)))
+
+    @classmethod
+    def Still (cls, period=10., t_step=0.02):
+        """ Clip with every angle 0 and nothing sent, steps from 0 to period
+        inclusive, for the motions to fill in """
+        steps = int (period / t_step)
+        times = period * np.arange (steps + 1) / steps
+        return (cls (times, np.zeros ((len(times), len(SENSORS), 3)), np.zeros ((len(times), len(SENSORS)), dtype=bool), period))
+
+    def Set (self, sensor, axis, values):
+        """ Angles of sensor about axis ("angle_X" ...) from values, a number or
+        one per step, and send them at every step """
+        self.angles[:, COLUMN[sensor], AXES.index (axis)] = values
+        self.sent[:, COLUMN[sensor]] = True
+        return (self)
+
+    def Then (self, other):
+        """ This clip followed by other """
+        return (Clip (np.concatenate ((self.times, other.times - other.times[0] + self.times[0] + self.period)),
+                      np.concatenate ((self.angles, other.angles)), np.concatenate ((self.sent, other.sent)),
+                      self.period + other.period))
+
+    def Loop (self, count):
+        """ This clip count times over """
+        shift = (np.arange (count) * self.period)[:,None]
+        return (Clip ((self.times[None,:] + shift).ravel(), np.tile (self.angles, (count, 1, 1)),
+                      np.tile (self.sent, (count, 1)), self.period * count))
+
+    def _Curves (self, times):
+        """ Angles of every sensor at times, interpolated from the samples it
+        sent, and whether each sensor sends within its first to last sample """
+        angles = np.zeros ((len(times), len(SENSORS), 3))
+        sent   = np.zeros ((len(times), len(SENSORS)), dtype=bool)
+        for j in range (len(SENSORS)):
+            rows = np.flatnonzero (self.sent[:,j])
+            if len(rows) == 0:
+                continue
+            tim = self.times[rows]
+            for k in range (3):
+                angles[:,j,k] = np.interp (times, tim, self.angles[rows,j,k])
+            sent[:,j] = (times >= tim[0]) & (times <= tim[-1])
+        return (angles, sent)
+
+    def Resample (self, rate):
+        """ This clip with rate steps a second, each sensor's angles
+        interpolated from the samples it sent """
+        times = self.times[0] + np.arange (int (round ((self.times[-1] - self.times[0]) * rate)) + 1) / rate
+        angles, sent = self._Curves (times)
+        return (Clip (times, angles, sent, self.period))
+
+    def Overlay (self, other):
+        """ This clip with the sensors other sends taken from other instead,
+        resampled to the steps of this clip, other starting with it """
+        angles, sent = other._Curves (self.times - self.times[0] + other.times[0])
+        over = sent.any (axis=0)
+        out  = Clip (self.times, self.angles.copy(), self.sent.copy(), self.period)
+        out.angles[:,over] = angles[:,over]
+        out.sent[:,over]   = sent[:,over]
+        return (out)
+
+    def Noise (self, sigma, seed=None):
+        """ This clip with normally distributed noise of sigma degrees on the
+        angles. seed is a number or a numpy Generator """
+        rng = np.random.default_rng (seed)
+        return (Clip (self.times, self.angles + rng.normal (0.0, sigma, self.angles.shape), self.sent, self.period))
+
+    def Dropout (self, fraction, seed=None):
+        """ This clip with fraction of the samples, chosen at random, not sent """
+        rng = np.random.default_rng (seed)
+        return (Clip (self.times, self.angles, self.sent & (rng.random (self.sent.shape) >= fraction), self.period))
+
+    def Samples (self, start=0, end=None):
+        """ The samples sent in steps start to end, in time order, as arrays of
+        step, sensor, time and (M,3) angles """
+        rows, cols = np.nonzero (self.sent[start:end])
+        rows += start
+        return (rows, np.array (SENSORS)[cols], self.times[rows], self.angles[rows, cols])
+
+    def Track (self, name="Motion", height=1.6, player="Marvin"):
+        """ The clip as a Track, built straight into its store """
+        trk = NewTrack (name, height, player)
+        rows, sensors, times, angles = self.Samples()
+        cols = {"sensor":sensors}
+        for k, axis in enumerate (AXES):
+            cols[axis] = angles[:,k]
+        trk.store.Extend (np.full (len(rows), ts.MSG_CODE["SA_EUL_ANG"]), np.arange (len(rows)), {"SA_EUL_ANG":(times, cols)})
+        trk.SetTimeLen()
+        return (trk)
+
+    def Lines (self, start=0, end=None, offset=0.0):
+        """ Bytes of the .sat lines for the samples of steps start to end, with
+        offset added to the times. Each time is formatted once per step """
+        end = len(self.times) if end is None else end
+        rows, sensors, times, angles = self.Samples (start, end)
+        step_chars, step_len = FormatFixed (self.times[start:end] + offset, TIME_DECIMALS)
+        pieces = ["SA_EUL_ANG,", (step_chars[rows - start], step_len[rows - start]), ",sensor,", FormatFixed (sensors, 0)]
+        for k, axis in enumerate (AXES):
+            pieces += ["," + axis + ",", FormatFixed (angles[:,k], ANGLE_DECIMALS)]
+        pieces.append ("\n")
+        return (_Lines (pieces, len(rows)))
+
+    def Write (self, fp, name="Motion", height=1.6, repeat=1, vary=None):
+        """ Write the clip as a track to fp, a text file pointer, looped repeat
+        times a chunk at a time. vary, if given, is called with the clip and
+        the loop count and returns the clip to write for that loop, e.g. with
+        its own noise """
+        NewTrack (name, height).WriteHeader (fp)
+        for k in range (repeat):
+            clip = vary (self, k) if vary else self
+            for start in range (0, len(clip.times), CHUNK_STEPS):
+                fp.write (clip.Lines (start, start + CHUNK_STEPS, k * self.period).decode ('ascii'))
+
+    def Repeat (self, repeat, vary=None):
+        """ The clip looped repeat times, each loop vary(clip, k) if given """
+        if vary is None:
+            return (self.Loop (repeat))
+        clip = vary (self, 0)
+        for k in range (1, repeat):
+            clip = clip.Then (vary (self, k))
+        return (clip)
+
+    def Save (self, filename, name="Motion", height=1.6, repeat=1, vary=None, append=False):
+        """ Save the clip as a track to filename, binary if it ends in
+        TrackBinary.EXTENSION, otherwise text and added to the end of the file
+        if append. Binary tracks are made in memory and replace the file """
+        if filename.lower().endswith (tb.EXTENSION):
+            tb.WriteTrackFile ([self.Repeat (repeat, vary).Track (name, height)], filename)
+            return
+        with open (filename, "a" if append else "w") as fp:
+            self.Write (fp, name, height, repeat, vary)
+
+
+def Squat (period=10., t_step=0.02):
+    clip = Clip.Still (period, t_step)
+    frac = clip.times / period
+    r_knee = -90 * np.sin (frac * np.pi)
+    clip.Set (8, "angle_X", r_knee).Set (12, "angle_X", r_knee)
+    clip.Set (9, "angle_X", -r_knee).Set (13, "angle_X", -r_knee)
+    return (clip)
+
+def FoldArms (period=10., t_step=0.02):
+    clip = Clip.Still (period, t_step)
+    r_shoulder = 90 * np.sin (clip.times / period * np.pi)
+    clip.Set (2, "angle_Y", r_shoulder).Set (6, "angle_Y", -r_shoulder)
+    clip.Set (3, "angle_Y", r_shoulder).Set (4, "angle_Y", -r_shoulder)
+    return (clip)
+
+def _ArmsDown (clip):
+    """ Upper arms down, sent at the first step only """
+    clip.angles[:, COLUMN[2], 2] = 90.
+    clip.angles[:, COLUMN[6], 2] = -90.
+    clip.sent[0, [COLUMN[2], COLUMN[6]]] = True
+    return (clip)
+
+def BicepCurl (period=10., t_step=0.02):
+    clip = Clip.Still (period, t_step)
+    r_elbow = -90 * np.sin (clip.times / period * np.pi)
+    for sensor in (3, 4, 15, 16):
+        clip.Set (sensor, "angle_X", r_elbow)
+    return (_ArmsDown (clip.Loop (2)))
+
+def Bow (period=10., t_step=0.02):
+    clip = Clip.Still (period, t_step)
+    clip.Set (5, "angle_X", 90 * np.sin (clip.times / period * np.pi))
+    return (_ArmsDown (clip.Loop (2)))
+
 
 class Motion ():
+    """ Writes motions to files in folder, each as a track added to the end
+    of the file """
     def __init__ (self, folder, t_step=0.02, height=1.6):
         self.path   = folder
         self.t_step = t_step
@@ -20,7 +302,7 @@ class Motion ():
         "5,Spine,6,LeftUpperarm, 7,RightHip,8,RightKnee,9,RightAnkle,10,RightFoot,"\
         "11,LeftHip,12,LeftKnee,13,LeftAnkle,14,LeftFoot,15,RightHand,16,LeftHand\n"
 
-    def Bow (self, file_name, period = 10., header='Bow'):
+    def Write (self, file_name, clip, lbl):
         # Open the file
         try:
             fp = open (self.path + file_name, 'a+')
@@ -28,110 +310,29 @@ class Motion ():
             print ("Error opening the file ", self.path + file_name)
             return False
 
-        self.Header(fp, lbl=header)
-
-        # Make sure arms are down
-        fp.write ("SA_EUL_ANG,0.0,sensor,2,angle_Z,90.0 ,angle_X,0.0,angle_Y,0.0\n")
-        fp.write ("SA_EUL_ANG,0.0,sensor,6,angle_Z,-90.0 ,angle_X,0.0,angle_Y,0.0\n")
-
-        steps = int(period/self.t_step)
-        for j in range (0, 2):
-            for i in range (0, steps+1):
-                frac = i/steps
-                tim  = period * (j + frac)
-                spine     =  90 * sin (frac*pi)
-                fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,5,angle_Z,0.0 ,angle_X,{spine:.2f},angle_Y,0.0\n")
+        self.Header (fp, lbl=lbl)
+        for start in range (0, len(clip.times), CHUNK_STEPS):
+            fp.write (clip.Lines (start, start + CHUNK_STEPS).decode ('ascii'))
         fp.close()
         return True
 
-    def BicepCurl (self, file_name, period = 10.):
-        # Open the file
-        try:
-            fp = open (self.path + file_name, 'a+')
-        except:
-            print ("Error opening the file")
-            return False
+    def Bow (self, file_name, period = 10., header='Bow'):
+        return (self.Write (file_name, Bow (period, self.t_step), header))
 
-        self.Header(fp, lbl='Bicep_Curl')
-
-        # Make sure arms are down
-        fp.write ("SA_EUL_ANG,0.0,sensor,2,angle_Z,90.0 ,angle_X,0.0,angle_Y,0.0\n")
-        fp.write ("SA_EUL_ANG,0.0,sensor,6,angle_Z,-90.0 ,angle_X,0.0,angle_Y,0.0\n")
-
-        steps = int(period/self.t_step)
-        for j in range (0, 2):
-            for i in range (0, steps+1):
-                frac = i/steps
-                tim  = period * (j + frac)
-                r_elbow     =  -90 * sin (frac*pi)
-                l_elbow     = r_elbow
-                r_hand      = r_elbow
-                l_hand      = l_elbow
-                fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,3,angle_Z,0.0 ,angle_X,{r_elbow:.2f},angle_Y,0.0\n")
-                fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,4,angle_Z,0.0 ,angle_X,{l_elbow:.2f},angle_Y,0.0\n")
-                fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,15,angle_Z,0.0 ,angle_X,{r_hand:.2f},angle_Y,0.0\n")
-                fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,16,angle_Z,0.0 ,angle_X,{l_hand:.2f},angle_Y,0.0\n")
-        fp.close()
-        return True
+    def BicepCurl (self, file_name, period = 10.):
+        return (self.Write (file_name, BicepCurl (period, self.t_step), 'Bicep_Curl'))
 
     def FoldArms (self, file_name, period = 10.):
-        # Open the file
-        try:
-            fp = open (self.path + file_name, 'a+')
-        except:
-            print ("Error opening the file ", )
-            return False
-
-        self.Header(fp, lbl='Fold_Arms')
-
-        steps = int(period/self.t_step)
-        for i in range (0, steps+1):
-            frac = i/steps
-            tim = frac * period
-            r_shoulder  = 90 * sin (frac*pi)
-            l_shoulder  = -r_shoulder
-            r_elbow     =  r_shoulder
-            l_elbow     = -r_shoulder
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,2,angle_Z,0.0 ,angle_Y,{r_shoulder:.2f},angle_X,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,6,angle_Z,0.0 ,angle_Y,{l_shoulder:.2f},angle_X,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,3,angle_Z,0.0 ,angle_Y,{r_elbow:.2f},angle_X,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,4,angle_Z,0.0 ,angle_Y,{l_elbow:.2f},angle_X,0.0\n")
-
-        fp.close()
-        return True
+        return (self.Write (file_name, FoldArms (period, self.t_step), 'Fold_Arms'))
 
     def Squat (self, file_name, period = 10.):
-
-        # Open the file
-        try:
-            fp = open (self.path + file_name, 'a+')
-        except:
-            print ("Error opening the file")
-            return False
-
-        self.Header(fp)
-
-        steps = int(period/self.t_step)
-        for i in range (0, steps+1):
-            frac = i/steps
-            tim = frac * period
-            r_knee  = -90 * sin (frac*pi)
-            l_knee  = r_knee
-            r_ankle = -r_knee
-            l_ankle = -l_knee
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,8,angle_Z,0.0 ,angle_X,{r_knee:.2f},angle_Y,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,12,angle_Z,0.0 ,angle_X,{l_knee:.2f},angle_Y,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,9,angle_Z,0.0 ,angle_X,{r_ankle:.2f},angle_Y,0.0\n")
-            fp.write (f"SA_EUL_ANG,{tim:.3f},sensor,13,angle_Z,0.0 ,angle_X,{l_ankle:.2f},angle_Y,0.0\n")
-
-        fp.close()
-        return True
+        return (self.Write (file_name, Squat (period, self.t_step), 'Squat'))
 
         # Print Header
 
     def Header (self, fp, lbl='Squat', name='Marvin' ):
         now        = datetime.now()
-        now_string = now.strftime("%d/%m/%Y %H:%M:%S")
+        now_string = now.strftime(TIME_FORMAT)
 
         track_lbl   = f"SA_Track,{lbl}\n"
         player      = f"SA_Player,{name},standard,{self.height}\n"
@@ -143,18 +344,36 @@ class Motion ():
         fp.write (start_time)
 
 if __name__ == '__main__':
-    print ("Start")
-
-    #path = "X:\\Dropbox\\Projects\\FootfallAndHeartbeats\\"
-    path = "C:\\Users\\pgou\\Dropbox\\Projects\\FootfallAndHeartbeats\\"
-    fn   = "testset.sat"
-
-    if os.path.exists(path+fn):
-        os.remove (path + fn)
-    move = Motion(path)
-    move.Squat (fn)
-    move.FoldArms (fn, period = 5.)
-    move.BicepCurl (fn, period = 4.)
-    move.Bow (fn, period = 5., header='Bow')
-    move.Bow (fn, period = 10., header='Bow_slow')
-    print ("Finish")
\ No newline at end of file
+    parser = argparse.ArgumentParser (description="Write motion tracks for testing, one for each motion")
+    parser.add_argument ("filename", help="Track file, binary if it ends in " + tb.EXTENSION)
+    parser.add_argument ("--motions", nargs="+", choices=MOTIONS, default=list (MOTIONS))
+    parser.add_argument ("--period", type=float, default=10., help="Seconds of each motion")
+    parser.add_argument ("--rate", type=float, default=50., help="Samples a second of each sensor")
+    parser.add_argument ("--repeat", type=int, default=1, help="Times each motion is looped")
+    parser.add_argument ("--noise", type=float, default=0.0, help="Standard deviation in degrees")
+    parser.add_argument ("--dropout", type=float, default=0.0, help="Fraction of samples not sent")
+    parser.add_argument ("--seed", type=int)
+    parser.add_argument ("--join", action="store_true", help="The motions one after another in one track")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng (args.seed)
+    def Vary (clip, k):
+        if args.noise > 0:
+            clip = clip.Noise (args.noise, rng)
+        if args.dropout > 0:
+            clip = clip.Dropout (args.dropout, rng)
+        return (clip)
+
+    clips = [(name, globals()[name] (args.period, 1.0 / args.rate)) for name in args.motions]
+    if args.join:
+        joined = clips[0][1]
+        for name, clip in clips[1:]:
+            joined = joined.Then (clip)
+        clips = [("_".join (args.motions), joined)]
+    if args.filename.lower().endswith (tb.EXTENSION):
+        tb.WriteTrackFile ([clip.Repeat (args.repeat, Vary).Track (name) for name, clip in clips], args.filename)
+    else:
+        with open (args.filename, "w") as fp:
+            for name, clip in clips:
+                clip.Write (fp, name, repeat=args.repeat, vary=Vary)
+    print ("Wrote", args.filename, os.path.getsize (args.filename) / 1e6, "MB")
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded queue of received datagrams, filled by a receive thread and emptied
+by the GUI. It is a collections.deque with a maximum length, whose append and
+popleft are atomic, so the two sides need no lock. When the queue is full the
+oldest packet is dropped, so a slow consumer loses old data rather than
+falling further and further behind. Counts are kept for the metrics.
+Classes are:
+    PacketQueue - the queue and its counters
+    Receiver    - thread draining a socket into a PacketQueue
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+DEFAULT_DEPTH = 4096    # Packets held before the oldest are dropped
+RECV_TIMEOUT  = 0.1     # Seconds the receive thread waits before checking for stop
+
+
+class PacketQueue ():
+    """ Packets are held as (receive time, bytes), time from time.perf_counter """
+    def __init__ (self, maxlen=DEFAULT_DEPTH):
+        self.maxlen    = maxlen
+        self.packets   = deque (maxlen=maxlen)
+        self.received  = 0      # Packets put on the queue
+        self.dropped   = 0      # Packets lost because the queue was full
+        self.max_depth = 0
+        self.bytes     = 0
+
+    def __len__ (self):
+        return (len(self.packets))
+
+    def Put (self, data, stamp=None):
+        """ Add a packet, called from the receive thread """
+        depth = len(self.packets)
+        if depth >= self.maxlen:
+            self.dropped += 1
+        elif depth >= self.max_depth:
+            self.max_depth = depth + 1
+        self.packets.append ((time.perf_counter() if stamp is None else stamp, data))
+        self.received += 1
+        self.bytes    += len(data)
+
+    def GetAll (self):
+        """ Take every packet that is waiting, oldest first """
+        out = []
+        for _ in range (len(self.packets)):
+            try:
+                out.append (self.packets.popleft())
+            except IndexError:
+                break
+        return (out)
+
+    def Stats (self):
+        return ({"depth":len(self.packets), "max_depth":self.max_depth,
+                 "received":self.received, "dropped":self.dropped, "bytes":self.bytes})
+
+
+class Receiver (threading.Thread):
+    """ Reads datagrams from sock until stopped, putting them on queue """
+    def __init__ (self, sock, queue, buffer_size, name="Receiver"):
+        super().__init__ (name=name, daemon=True)
+        self.sock        = sock
+        self.queue       = queue
+        self.buffer_size = buffer_size
+        self.stop_event  = threading.Event()
+        self.errors      = 0
+
+    def run (self):
+        self.sock.settimeout (RECV_TIMEOUT)
+        while not self.stop_event.is_set():
+            try:
+                data = self.sock.recv (self.buffer_size)
+            except socket.timeout:
+                continue
+            except OSError:
+                # Refused (nothing listening yet) or the socket was closed
+                self.errors += 1
+                if self.stop_event.wait (RECV_TIMEOUT):
+                    break
+                continue
+            self.queue.Put (data)
+
+    def Stop (self, wait=True):
+        self.stop_event.set()
+        if wait and self.is_alive() and threading.current_thread() is not self:
+            self.join (2*RECV_TIMEOUT)
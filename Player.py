@@ -10,6 +10,7 @@ Originally Created on Fri Nov 17 08:21:01 2017
 """
 import numpy as np
 import math as m
+import Rotation as rt
 
 class Player ():
     def __init__ (self, name, model, height ):
@@ -114,11 +115,10 @@ class Body ():
             self.rotate = np.array (updates["Root"][3:6])
             self.tran   = self.origin + tran
         
-        rot_abs = RotationMat ( self.rotate )
-        rot_cal = RotationMat ( self.calibrate )
-        rotm =   rot_cal.T * rot_abs  # Matrix multiply to get combined rotation
+        # Combined rotation, cached as the root and calibration rarely change
+        self.rotm = rt.CachedRootMatrix (self.rotate, self.calibrate)
         for limb in self.root:
-            limb.UpdateRod ( updates, rotm)
+            limb.UpdateRod ( updates, self.rotm)
             
     # Function that updates body with new calibreation data contained in updates dict
     def UpdateCalibrate (self, updates):
@@ -170,7 +170,7 @@ class Body ():
 class Rod ():
     def __init__ (self, name, offset, orient, rotate, s_orient, abs_update):
         self.name       = name
-        self.offset     = offset  # Transformed value
+        self.offset     = np.array (offset, dtype=np.float64)  # Transformed value
         self.orig       = offset  # Original value
         self.orient     = orient  # Rotation to orient body to sensor
         self.rotate     = rotate  # Combined rotation matrix 
@@ -178,6 +178,8 @@ class Rod ():
         self.calibrate  = np.array ([0.0,0.0,0.0])  # Calibration rotation
         self.abs_update = abs_update # Set true if node is updated using absolute values and false if relative
         self.next   = []
+        self.rotm       = np.identity (3)      # Combined rotation, updated in place
+        self.rot_rel    = np.empty ((3, 3))    # Rotation of this rod
         
     def AddNext (self, next):
         self.next.append ( next)
@@ -205,8 +207,8 @@ class Rod ():
     def UpdateRod (self, updates, rot_prev):
         if self.name in updates:
             self.rotate = updates[self.name]
-            rot_rel = RotationMat ( self.rotate )
-            rotm = rot_rel * rot_prev
+            rt.EulerMatrix (self.rotate, out=self.rot_rel)
+            rotm = np.matmul (self.rot_rel, rot_prev, out=self.rotm)
         else:
             rotm = rot_prev            
      
@@ -231,9 +233,7 @@ class Rod ():
 #         else:
 #             rotm = rot_prev
         
-        t_orig = self.orig.reshape(3,1)
-        new_pos = rotm * t_orig
-        self.offset = np.squeeze (np.array(new_pos))
+        np.matmul (rotm, self.orig, out=self.offset)
 
         if self.next != []:
             for item in self.next:
@@ -254,21 +254,9 @@ class Rod ():
 #   Function to return a rotation matrix for the input angles
 #
 def RotationMat ( rotate_angles ):
-    r_x = m.radians( rotate_angles[0] )
-    r_y = m.radians( rotate_angles[1] )
-    r_z = m.radians( rotate_angles[2] )
-
-    # Rotations for Left Hand coordinates
-   # rot_z = np.matrix ([[m.cos(r_z), m.sin(r_z), 0.], [-m.sin(r_z), m.cos(r_z), 0.], [0., 0., 1.]])
-   # rot_y = np.matrix ([[m.cos(r_y), 0., -m.sin(r_y)], [0., 1., 0.], [m.sin(r_y), 0., m.cos(r_y)]])
-   # rot_x = np.matrix ([[1., 0., 0.], [0., m.cos(r_x), m.sin(r_x)], [0, -m.sin(r_x), m.cos(r_x)]])
-    
-   # Right Hand Rule
-    rot_z = np.matrix ([[m.cos(r_z), -m.sin(r_z), 0.], [m.sin(r_z), m.cos(r_z), 0.], [0., 0., 1.]])
-    rot_y = np.matrix ([[m.cos(r_y), 0., m.sin(r_y)], [0., 1., 0.], [-m.sin(r_y), 0., m.cos(r_y)]])
-    rot_x = np.matrix ([[1., 0., 0.], [0., m.cos(r_x), -m.sin(r_x)], [0, m.sin(r_x), m.cos(r_x)]])
-        
-    return (rot_x * rot_y * rot_z)
+    """ Rotation matrix (a 3x3 array, multiply with @) for the x, y, z angles
+    in degrees using the right hand rule, see Rotation """
+    return (rt.EulerMatrix (rotate_angles))
 
 #
 # Simple fnction to take latest data from sensors and update the angle list used
@@ -284,11 +272,7 @@ def UpdateLimbPos ( angles, abs_updates, sensorlist ):
 
 
 def isRotationMatrix(R) :
-    Rt = np.transpose(R)
-    shouldBeIdentity = np.dot(Rt, R)
-    I = np.identity(3, dtype = R.dtype)
-    n = np.linalg.norm(I - shouldBeIdentity)
-    return n < 1e-6
+    return (rt.IsRotationMatrix (R))
  
  
 # Calculates rotation matrix to euler angles
@@ -297,21 +281,7 @@ def isRotationMatrix(R) :
 def rotationMatrixToEulerAngles(R) :
  
     assert(isRotationMatrix(R))
-     
-    sy = m.sqrt(R[0,0] * R[0,0] +  R[1,0] * R[1,0])
-     
-    singular = sy < 1e-6
- 
-    if  not singular :
-        x = m.atan2(R[2,1] , R[2,2])
-        y = m.atan2(-R[2,0], sy)
-        z = m.atan2(R[1,0], R[0,0])
-    else :
-        x = m.atan2(-R[1,2], R[1,1])
-        y = m.atan2(-R[2,0], sy)
-        z = 0
- 
-    return np.array([x, y, z])
+    return (rt.MatrixToEuler (R))
 
 def ErrorMsg ( level, msg):
     print ("Warning ", msg)
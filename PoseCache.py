@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Pose cache for a track. At keyframes every interval seconds of track time the
+latest angle of every sensor is stored, along with the joint positions from
+them when a body is given (worked out for all the keyframes at once by
+Kinematics), so the full state of the body at any time is the nearest
+keyframe before it plus the few samples since. That makes
+a seek cost the same wherever it lands in the track, and limbs whose sensors
+have not reported for a while still get the right pose. Samples are taken
+in time order, which need not be the order they were recorded in.
+"""
+
+import numpy as np
+import TrackStore as ts
+import Kinematics as km
+
+DEFAULT_INTERVAL = 0.1      # Seconds of track time between keyframes
+ANGLE_MSG        = "SA_EUL_ANG"
+ANGLE_FIELDS     = ("angle_X", "angle_Y", "angle_Z")
+
+
+class PoseCache ():
+    """ Keyframes of the latest angle per sensor for a track, and of the joint
+    positions when a body is given """
+    def __init__ (self, track, interval=DEFAULT_INTERVAL, body=None):
+        self.track    = track
+        self.interval = interval
+        self.count    = track.store.count    # Samples in the track when built
+        msg = track.store.columns[ANGLE_MSG]
+        order, self.time = ts.SortTimes (msg.Time())
+        self.sensor  = msg.Column ("sensor")
+        self.angles  = [msg.Column (f) for f in ANGLE_FIELDS]
+        if order is not None:
+            # Rows from here on are of the samples in time order
+            self.sensor = self.sensor[order]
+            self.angles = [ang[order] for ang in self.angles]
+        self.sensors = np.unique (self.sensor)
+        self.start   = float(track.store.Times()[0]) if len(track.store.Times()) else 0.0
+
+        # Keyframe k holds the state at start + k*interval, for each sensor the
+        # row of its latest sample at or before then (-1 if none yet)
+        n_keys = int (np.floor (track.t_len / interval)) + 1
+        self.key_time = self.start + interval * np.arange (n_keys)
+        self.key_row  = np.full ((n_keys, len(self.sensors)), -1, dtype=np.int64)
+        for j, sen in enumerate (self.sensors):
+            rows = np.flatnonzero (self.sensor == sen)
+            last = np.searchsorted (self.time[rows], self.key_time, side="right") - 1
+            self.key_row[:,j] = np.where (last >= 0, rows[np.maximum (last, 0)], -1)
+
+        # Joint positions (keyframes, joints, 3) for all the keyframes at once,
+        # joints in the order of skeleton.names
+        self.body     = body
+        self.skeleton = None
+        self.key_pos  = None
+        if body is not None:
+            if track.calibrate:
+                body.UpdateCalibrate (track.calibrate)
+            self.skeleton = km.Skeleton (body)
+            self.key_pos  = self.skeleton.Pose (self.KeyAngles(), n_keys)
+
+    def KeyAngles (self):
+        """ Dict of limb name: (keyframes,3) angles at each keyframe, NaN before
+        the limb's sensor has reported. Limbs are given by the track's
+        sensor_dict """
+        limbs = {}
+        for j, sen in enumerate (self.sensors.tolist()):
+            if sen not in self.track.sensor_dict:
+                continue
+            rows = self.key_row[:,j]
+            have = rows >= 0
+            out  = np.full ((len(rows), 3), np.nan)
+            for k, col in enumerate (self.angles):
+                out[have,k] = col[rows[have]]
+            limbs[self.track.sensor_dict[sen]] = out
+        return (limbs)
+
+    def KeyIndex (self, cur_time):
+        """ Keyframe at or before cur_time (relative to the track start) """
+        k = min (max (int (cur_time // self.interval), 0), len(self.key_time) - 1)
+        if k > 0 and self.key_time[k] > self.start + cur_time:    # Rounding
+            k -= 1
+        return (k)
+
+    def _Delta (self, cur_time):
+        """ Keyframe at or before cur_time and the range of time ordered rows
+        of the samples since it """
+        k  = self.KeyIndex (cur_time)
+        lo = np.searchsorted (self.time, self.key_time[k], side="right")
+        hi = np.searchsorted (self.time, self.start + cur_time, side="right")
+        return (k, lo, hi)
+
+    def SensorRows (self, cur_time):
+        """ Row in the time ordered angles of the latest sample of every sensor at
+        cur_time, -1 for sensors that have not reported. Starts from the
+        keyframe and replays the samples since """
+        k, lo, hi = self._Delta (cur_time)
+        rows = self.key_row[k].copy()
+        if hi > lo:
+            # Last sample of each sensor in the delta, later samples win
+            sen  = self.sensor[lo:hi][::-1]
+            _, first = np.unique (sen, return_index=True)
+            rows[np.searchsorted (self.sensors, sen[first])] = hi - 1 - first
+        return (rows)
+
+    def SensorState (self, cur_time):
+        """ Dict of sensor number: angles for every sensor reported by cur_time """
+        rows = self.SensorRows (cur_time)
+        return ({int(sen):np.array ([col[row] for col in self.angles], dtype=np.float64)
+                 for sen, row in zip (self.sensors, rows) if row >= 0})
+
+    def LimbState (self, cur_time, sensor_dict):
+        """ The same as SensorState but keyed by limb name, which is the form
+        pl.UpdateLimbPos builds up and Body.Update takes """
+        return ({sensor_dict[sen]:ang for sen, ang in self.SensorState (cur_time).items()
+                 if sen in sensor_dict})
+
+    def Positions (self, cur_time):
+        """ Joint positions (joints,3) at cur_time, None if there is no body.
+        Those of the keyframe if no sample has come since, else worked out for
+        the one frame from the state at cur_time """
+        if self.skeleton is None:
+            return (None)
+        k, lo, hi = self._Delta (cur_time)
+        if hi <= lo:
+            return (self.key_pos[k])
+        state = self.LimbState (cur_time, self.track.sensor_dict)
+        return (self.skeleton.Pose ({limb:ang[None] for limb, ang in state.items()}, 1)[0])
+
+    def nbytes (self):
+        size = self.key_time.nbytes + self.key_row.nbytes
+        if self.key_pos is not None:
+            size += self.key_pos.nbytes
+        return (size)
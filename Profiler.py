@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Light instrumentation of the hot paths, to see where the tick goes. Code is
+marked with named stages:
+
+    with pf.Stage ("ReadData"):
+        ...
+
+and named counters (pf.Count ("elements", n)). For each stage the last
+WINDOW durations are kept in a ring buffer, giving rolling p50/p95/p99, as
+well as the calls and the memory blocks allocated and not freed in the stage
+(from sys.getallocatedblocks, so a stage includes the stages inside it). The
+block count is for the whole process, so what other threads (receivers, a
+save) allocate while a stage runs is counted in it too, it is only a guide.
+Counters give a rate a second over the same window. It is all off until
+Enable(True), when off a stage costs one function call and a with block.
+Stats can be dumped to JSON or CSV (by the file extension) to compare builds.
+Classes are:
+    StageStats - durations and allocations of one stage
+    Profiler   - named stages and counters, PROFILER is the one used
+"""
+
+import csv
+import json
+import sys
+import threading
+import time
+import numpy as np
+
+WINDOW      = 1024      # Durations kept for each stage
+RATE_WINDOW = 1.0       # Seconds over which counter rates are measured
+
+
+class StageStats ():
+    """ Ring buffer of the last WINDOW durations of a stage, in seconds """
+    def __init__ (self):
+        self.times  = np.zeros (WINDOW)
+        self.next   = 0
+        self.calls  = 0
+        self.total  = 0.0
+        self.blocks = 0     # Memory blocks allocated and not freed, over all calls, by any thread
+
+    def Add (self, duration, blocks):
+        self.times[self.next] = duration
+        self.next = self.next + 1 if self.next + 1 < WINDOW else 0
+        self.calls  += 1
+        self.total  += duration
+        self.blocks += blocks
+
+    def Stats (self):
+        held = self.times[:min (self.calls, WINDOW)]
+        p50, p95, p99 = np.percentile (held, (50, 95, 99)) if len(held) else (0.0, 0.0, 0.0)
+        return ({"calls":self.calls, "mean_ms":1000 * held.mean() if len(held) else 0.0,
+                 "p50_ms":1000 * p50, "p95_ms":1000 * p95, "p99_ms":1000 * p99,
+                 "max_ms":1000 * held.max() if len(held) else 0.0, "total_s":self.total,
+                 "blocks_per_call":self.blocks / self.calls if self.calls else 0.0})
+
+
+class _Counter ():
+    def __init__ (self, now):
+        self.total     = 0
+        self.rate      = 0.0
+        self.win_start = now
+        self.win_count = 0
+
+    def Add (self, n, now):
+        self.total     += n
+        self.win_count += n
+        if now - self.win_start >= RATE_WINDOW:
+            self.rate      = self.win_count / (now - self.win_start)
+            self.win_start = now
+            self.win_count = 0
+
+
+class _Timer ():
+    def __init__ (self, profiler, name):
+        self.profiler = profiler
+        self.name     = name
+
+    def __enter__ (self):
+        self.blocks = sys.getallocatedblocks()
+        self.start  = time.perf_counter()
+
+    def __exit__ (self, *exc):
+        duration = time.perf_counter() - self.start
+        self.profiler.Add (self.name, duration, sys.getallocatedblocks() - self.blocks)
+        return (False)
+
+
+class _Off ():
+    """ Stage used while the profiler is off """
+    def __enter__ (self):
+        pass
+
+    def __exit__ (self, *exc):
+        return (False)
+
+_OFF = _Off()
+
+
+class Profiler ():
+    """ Named stages and counters, recorded only while enabled """
+    def __init__ (self):
+        self.enabled  = False
+        self.stages   = {}
+        self.counters = {}
+        self.lock     = threading.Lock()
+
+    def Enable (self, on=True):
+        self.enabled = on
+
+    def Clear (self):
+        with self.lock:
+            self.stages   = {}
+            self.counters = {}
+
+    def Add (self, name, duration, blocks):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats()
+            self.stages[name].Add (duration, blocks)
+
+    def Stage (self, name):
+        """ Context manager timing the code in it as stage name """
+        return (_Timer (self, name) if self.enabled else _OFF)
+
+    def Count (self, name, n=1):
+        """ Add n to counter name """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            if name not in self.counters:
+                self.counters[name] = _Counter (now)
+            self.counters[name].Add (n, now)
+
+    def Stats (self):
+        """ Dict of stage name: stats and counter name: total and rate """
+        with self.lock:
+            stages   = {name:stage.Stats() for name, stage in self.stages.items()}
+            counters = {name:{"total":cnt.total, "per_s":cnt.rate} for name, cnt in self.counters.items()}
+        return ({"enabled":self.enabled, "stages":stages, "counters":counters})
+
+    def Dump (self, filename):
+        """ Write Stats to filename, CSV if it ends in .csv and JSON otherwise """
+        stats = self.Stats()
+        if filename.lower().endswith (".csv"):
+            with open (filename, "w", newline="") as fp:
+                out = csv.writer (fp)
+                keys = list (StageStats().Stats().keys())
+                out.writerow (["kind", "name"] + keys)
+                for name, row in sorted (stats["stages"].items()):
+                    out.writerow (["stage", name] + [row[k] for k in keys])
+                out.writerow ([])
+                out.writerow (["kind", "name", "total", "per_s"])
+                for name, row in sorted (stats["counters"].items()):
+                    out.writerow (["counter", name, row["total"], row["per_s"]])
+        else:
+            with open (filename, "w") as fp:
+                json.dump (stats, fp, indent=1)
+
+
+PROFILER = Profiler()
+
+def Stage (name):
+    return (PROFILER.Stage (name))
+
+def Count (name, n=1):
+    PROFILER.Count (name, n)
+
+def Enable (on=True):
+    PROFILER.Enable (on)
+
+def Stats ():
+    return (PROFILER.Stats())
+
+def Dump (filename):
+    PROFILER.Dump (filename)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-Software that enables a user to load a time series pose data file (.sat) and
+Software that enables a user to load a time series pose data file (.sat/.sab) and
 replay the data in the form of a 3D pose, data graphs and tables. This file 
 containsclasses to create a user interface using pyQt5 and control the 
 main event loop for the program.
@@ -9,11 +9,13 @@ Created on Fri Jan 19 13:42:49 2018
 
 @author: Paul Gough
 """
+import os
 import sys
 import time
 import numpy as np
-from PyQt5.QtWidgets import QMainWindow, QWidget, QTableWidget, QTableWidgetItem, QPushButton, QLabel, QLineEdit, QSlider, QFileDialog, \
-        QAction, QMdiArea, QMdiSubWindow, QDialogButtonBox, QVBoxLayout, QGroupBox, QFormLayout, QGridLayout, QHBoxLayout, QListWidget, QDialog, QApplication, qApp
+from PyQt5.QtWidgets import QMainWindow, QWidget, QTableView, QPushButton, QLabel, QLineEdit, QSlider, QFileDialog, \
+        QAction, QMdiArea, QMdiSubWindow, QDialogButtonBox, QVBoxLayout, QGroupBox, QFormLayout, QGridLayout, QHBoxLayout, QListWidget, QDialog, QApplication, qApp, \
+        QDockWidget, QCheckBox, QTableWidget, QTableWidgetItem
 from PyQt5.QtCore import *
 #from PyQt5.QtCore import QPoint, QSize
 from PyQt5.QtGui import  QColor, QPainter
@@ -24,6 +26,11 @@ from pyqtgraph.Qt import QtGui, QtCore
 
 import Viewer as vw
 import StreamData as sd 
+import TrackBinary as tb
+import TrackWriter as tw
+import SensorHub as sh
+import FrameScheduler as fs
+import Profiler as pf
 import pygame as pg
 #from pygame.locals import *
 import Player as pl
@@ -32,6 +39,17 @@ import Player as pl
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+TRACK_FILTER = "Track Files (*.sat *.sab);;Text Tracks (*.sat);;Binary Tracks (*.sab)"
+CONNECT_POLL  = 200    # ms between checks on a connection being made
+CONNECT_TRIES = 25     # Checks before giving up
+STATS_INTERVAL = 0.5   # s between updates of the link statistics
+TABLE_RATE    = 15     # Most updates a second of the data table
+RECORD_FOLDER = os.path.join (os.path.dirname (os.path.abspath (__file__)), "Recordings")
+
+def ZeroPose ():
+    """ Angles of the limbs at rest, the pose before any data has come """
+    return ({"RightLowerarm": np.array([0, 0, 0]), "RightUpperarm": np.array([0, 0, 0]), "Spine": np.array([0, 0, 0]), "LeftLowerarm": np.array([0,0,0]), "LeftUpperarm": np.array([0,0,0])})
+
 #
 # Main window - it all starts here
 #
@@ -49,6 +67,7 @@ class MainWindow (QMainWindow):
         # Some useful variables for connecting device
         self.state        = vw.ViewStates.PLAYER_IDLE
         self.conn_garment = None 
+        self.save_thread  = None    # TrackWriter.SaveThread while saving
         self.ip_address   = '192.168.1.1'
         self.ip_port      = 8080
         self.conn_list    = []  # List of names of connected items
@@ -61,7 +80,7 @@ class MainWindow (QMainWindow):
                             9:"RightAnkle", 10:"RightFoot", 11:"LeftHip", 12:"LeftKnee", 
                             13:"LeftAnkle", 14:"LeftFoot", 15:"RightHand", 16:"LeftHand"}
         self.calib =  {"RightLowerarm": np.array([0,0,0]), "RightUpperarm": np.array([0,0,0]),"Spine": np.array([0,0,0]), "LeftLowerarm": np.array([0,0,0]), "LeftUpperarm": np.array([0,0,0])}
-        self.abs_updates = {"RightLowerarm": np.array([0, 0, 0]), "RightUpperarm": np.array([0, 0, 0]), "Spine": np.array([0, 0, 0]), "LeftLowerarm": np.array([0,0,0]), "LeftUpperarm": np.array([0,0,0]) }
+        self.abs_updates = ZeroPose()
         self.viewer3D  = vw.PlayerViewer ([self.curplayer], (800,800))
         
         self.mdiArea = QMdiArea()
@@ -103,10 +122,21 @@ class MainWindow (QMainWindow):
         self.mdi_recplay.setGeometry (0,200,400,300)
 #        self.mdi_recplay.show()
 
-        # Set up timer 
+        # Stage timings, docked and hidden until View/Profiler
+        self.profiler_panel = ProfilerPanel (self)
+        self.addDockWidget (Qt.RightDockWidgetArea, self.profiler_panel)
+        self.profiler_panel.hide()
+
+        # Set up timer, a steady tick with the scheduler deciding what is due
+        self.scheduler = fs.FrameScheduler (self.mainUpdate, self.poseUpdate, self.renderFrame)
+        self.widget_recplay.recplay.clock = self.scheduler.Time
+        self.frame_label = QLabel ()
+        self.statusBar().addPermanentWidget (self.frame_label)
+        self.frame_stats_time = 0.0
         self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.mainUpdate) 
-        self.timer.start(20)
+        self.timer.setTimerType (Qt.PreciseTimer)
+        self.timer.timeout.connect(self.scheduler.Tick) 
+        self.timer.start(fs.TICK_MS)
         
         self.show ()
         
@@ -135,6 +165,7 @@ class MainWindow (QMainWindow):
         quit_act.setShortcut ('Ctrl+X')
         data_act = QAction('Data stream', self)
         plot_act = QAction('Data plots', self)
+        prof_act = QAction('Profiler', self)
         conn_act = QAction('Connect garment...', self)
         disc_act = QAction('Disconnect garment...', self)
         
@@ -149,6 +180,7 @@ class MainWindow (QMainWindow):
         file.addAction (quit_act)
         view.addAction (data_act)
         view.addAction (plot_act)
+        view.addAction (prof_act)
         conn.addAction (conn_act)
         conn.addAction (disc_act)
         
@@ -161,18 +193,22 @@ class MainWindow (QMainWindow):
         file.triggered.connect(self.selected)
         conn_act.triggered.connect (self.conn_trigger)
         disc_act.triggered.connect (self.disc_trigger)
+        prof_act.triggered.connect (self.profiler_trigger)
                                
     def new_player_trigger (self):
         print ("New Player...")
         
     def load_tracks_trigger (self):
-        filename, _ = QFileDialog.getOpenFileName(self,"Load tracks", "..","Track Files (*.sat)")
+        filename, _ = QFileDialog.getOpenFileName(self,"Load tracks", "..",TRACK_FILTER)
         
         if not filename:
             return
+        if self.save_thread is not None:
+            print ("Still saving tracks")
+            return
         
         try:
-            self.save_fp = open (filename, "r")
+            self.save_fp = open (filename, "rb" if tb.IsBinary (filename) else "r")
         except:
             print ("Error opening track file")
             
@@ -180,16 +216,18 @@ class MainWindow (QMainWindow):
         self.widget_recplay.UpdateTrackList ()
           
     def save_tracks_trigger (self):
-        filename, _ = QFileDialog.getSaveFileName(self,"Save tracks","../..","Track Files (*.sat)")
-        try:
-            self.save_fp = open (filename, "w")
-        except:
+        filename, _ = QFileDialog.getSaveFileName(self,"Save tracks","../..",TRACK_FILTER)
+        if not filename:
+            return
+        if self.save_thread is not None:
+            print ("Still saving tracks")
             return
         if len(self.widget_recplay.recplay.track_list) > 0:
-           self.widget_recplay.recplay.WriteTracklist(self.save_fp)
+            # Written on a thread, progress shown by ShowSaveProgress
+            self.save_thread = tw.SaveThread (self.widget_recplay.recplay.track_list, filename)
+            self.save_thread.start()
         else:
             print ("No tracks to save")
-        self.save_fp.close()
             
     def log_raw_trigger (self):
         pass
@@ -204,13 +242,18 @@ class MainWindow (QMainWindow):
            
     def disc_trigger (self):
         pass
+
+    def profiler_trigger (self):
+        self.profiler_panel.show()
+        self.profiler_panel.raise_()
         
     def selected(self,q):
         print(q.text() + ' selected')
         
-    def update_plots (self, pdata):
-        for plot in self.activeplots:
-            plot.UpdatePlot(pdata)
+    def update_plots (self, pdata, block=None):
+        with pf.Stage ("update_plots"):
+            for plot in self.activeplots:
+                plot.UpdatePlot(pdata, block)
             
     def clear_plots (self):
         for plot in self.activeplots:
@@ -221,11 +264,14 @@ class MainWindow (QMainWindow):
     #==========================================================================
     def mainUpdate (self):
         
-        """ Main loop that handles 3D viewer and realtime graphs"""
+        """ Main loop that handles 3D viewer and realtime graphs. Called by
+        the scheduler as its ingest stage, taking in the data up to the
+        scheduler's time """
         
         # React to key press on 3D viewer
-        for event in pg.event.get():
-            self.viewer3D.ProcessEvent (event, None)
+        with pf.Stage ("events"):
+            for event in pg.event.get():
+                self.viewer3D.ProcessEvent (event, None)
             
         # Check if rec/play back button pressed
         if (self.widget_recplay.recplay.state_change == True):
@@ -245,7 +291,7 @@ class MainWindow (QMainWindow):
                 
         # Examine state and react accordingly
         if self.state == vw.ViewStates.PLAYER_IDLE:
-            self.abs_updates = {"RightLowerarm": np.array([0, 0, 0]), "RightUpperarm": np.array([0, 0, 0]), "Spine": np.array([0, 0, 0]), "LeftLowerarm": np.array([0,0,0]), "LeftUpperarm": np.array([0,0,0]) }
+            self.abs_updates = ZeroPose()
             if self.conn_garment:
                 if self.conn_garment.garment_sensors:
                     for item in self.conn_list:
@@ -253,13 +299,18 @@ class MainWindow (QMainWindow):
                             self.state = vw.ViewStates.STREAMING
                             
         elif self.state == vw.ViewStates.STREAMING:
-            new_data = self.conn_garment.garment_sensors.ReadData()
+            # Samples as columns, Elements only for the newest of each sensor
+            # which is all the table and the pose show
+            block    = self.conn_garment.garment_sensors.ReadColumns()
+            new_data = block.Latest()
 #            angles = vw.GenerateEulerAngles (new_data)
             self.new_table.UpdateTable (new_data)
 #            self.new_table.UpdateTable (angles)           
             if new_data:
                 self.abs_updates = pl.UpdateLimbPos ( new_data, self.abs_updates, self.sensor_dict)
-            self.update_plots(new_data)
+            self.update_plots(new_data, block)
+            self.ShowQueueStats ()
+            self.widget_garment.UpdateStats (self.conn_garment.garment_sensors)
 
         elif self.state == vw.ViewStates.CALIBRATE:
             new_data = self.conn_garment.garment_sensors.ReadData()
@@ -268,14 +319,16 @@ class MainWindow (QMainWindow):
                 self.calib = self.widget_garment.Calibrate(item, self.calib, self.sensor_dict)
                 
         elif self.state == vw.ViewStates.RECORD:
-            new_data = self.conn_garment.garment_sensors.ReadData()
+            block    = self.conn_garment.garment_sensors.ReadColumns()
+            new_data = block.Latest()
 #            angles = vw.GenerateEulerAngles (new_data)
-            self.widget_recplay.recplay.Record (new_data)
+            self.widget_recplay.recplay.Record (block)
 #            self.widget_recplay.recplay.Record (angles)
             self.new_table.UpdateTable (new_data)
 #            self.new_table.UpdateTable (angles)
             self.abs_updates = pl.UpdateLimbPos ( new_data, self.abs_updates, self.sensor_dict)
-            self.update_plots(new_data)
+            self.update_plots(new_data, block)
+            self.widget_garment.UpdateStats (self.conn_garment.garment_sensors)
                 
         elif self.state == vw.ViewStates.PLAYBACK:
            # self.curplayer = self.widget_recplay.recplay.cur_track.player
@@ -284,27 +337,69 @@ class MainWindow (QMainWindow):
             self.calib     = self.widget_recplay.recplay.cur_track.calibrate
             new_data = self.widget_recplay.recplay.Play()
             self.new_table.UpdateTable (new_data)
-            self.abs_updates = pl.UpdateLimbPos ( new_data, self.abs_updates, self.sensor_dict)
+            # Full pose at the current time from the pose cache, so seeks are right
+            pose = self.widget_recplay.recplay.GetPoseState (self.sensor_dict)
+            if pose is None:
+                self.abs_updates = pl.UpdateLimbPos ( new_data, self.abs_updates, self.sensor_dict)
+            else:
+                # Built fresh each time, so a limb not reported by the time
+                # seeked to goes back to rest rather than keep its last pose
+                self.abs_updates = ZeroPose()
+                self.abs_updates.update (pose)
             self.widget_recplay.UpdateSlider ()
             self.update_plots(new_data)
             
+        if self.save_thread is not None:
+            self.ShowSaveProgress ()
+        if time.perf_counter() - self.frame_stats_time >= STATS_INTERVAL:
+            self.frame_stats_time = time.perf_counter()
+            self.frame_label.setText (self.scheduler.Summary())
+            if self.profiler_panel.isVisible():
+                self.profiler_panel.Refresh()
+
+    def poseUpdate (self, dt):
+        """ Update of the pose from the latest angles, once a tick whatever
+        the steps due (dt) """
         # Should only need to update this when a change occuts
         # Should really put a quick check here to see if things have changed
         # For FFHB don't need this calibration step
         #self.curplayer.body.UpdateCalibrate (self.calib)
-        self.curplayer.body.Update (self.abs_updates)
+        with pf.Stage ("Body.Update"):
+            self.curplayer.body.Update (self.abs_updates)
   
-        # Draw the 3D image
+    def renderFrame (self):
+        """ Draw the 3D image, at the scheduler's frame rate """
         glClearColor( 0.2,0.2,0.2 ,0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLineWidth(1)    
-        self.viewer3D.DrawGround()
+        with pf.Stage ("DrawGround"):
+            self.viewer3D.DrawGround()
         glLineWidth(3)
         #self.viewer3D.DrawPlayer (0)
-        self.viewer3D.DrawPlayerSolid (0)
+        with pf.Stage ("DrawPlayerSolid"):
+            self.viewer3D.DrawPlayerSolid (0)
         
-        pg.display.flip()
-        self.timer.start(10)
+        with pf.Stage ("display.flip"):
+            pg.display.flip()
+
+    def ShowSaveProgress (self):
+        """ Progress of a save in the status bar, and the result when done """
+        save = self.save_thread
+        if not save.done:
+            self.statusBar().showMessage ("Saving %s  %d%%" % (os.path.basename (save.filename), 100 * save.progress))
+            return
+        if save.error is not None:
+            print ("Error saving tracks", save.error)
+            self.statusBar().showMessage ("Error saving %s" % os.path.basename (save.filename))
+        else:
+            self.statusBar().showMessage ("Saved %s" % os.path.basename (save.filename))
+        self.save_thread = None
+
+    def ShowQueueStats (self):
+        """ Receive queue depth and drops of each connection in the status bar """
+        stats = self.conn_garment.garment_sensors.QueueStats()
+        self.statusBar().showMessage ("   ".join ("%s: queue %d (max %d) dropped %d" % (key, val["depth"], val["max_depth"], val["dropped"])
+                                                 for key, val in stats.items()))
 #-----------------------------------------------------------------------------
 # Connections popup dialog
 #-----------------------------------------------------------------------------
@@ -316,6 +411,8 @@ class ConnDialog(QDialog):
         self.sensor_name = sensor_name
         self.garment_sensors = None
         self.createFormGroupBox()
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.timeout.connect (self.pollConnect)
  
         self.buttonBox   = QDialogButtonBox()
         self.but_connect = QPushButton("Connect", default=True)
@@ -351,7 +448,6 @@ class ConnDialog(QDialog):
         self.hide()
         
     def connectClicked (self):
-        count = 0 
         self.connect_status.setText("Connecting")
         self.connect_status.repaint()
         new_ip   = self.get_ip_address.text()
@@ -361,22 +457,28 @@ class ConnDialog(QDialog):
         self.ip_port    = new_port
         self.buffer_size = new_buffer
         
-        # Add to connected sensors list
+        # Add to connected sensors list, the hub connects in the background
         if not self.garment_sensors:        
-            self.garment_sensors = sd.Sensors()
+            self.garment_sensors = sh.SensorHub()
         self.garment_sensors.AddConTCP (self.sensor_name, self.ip_address, self.ip_port, self.buffer_size )
-        while self.garment_sensors.sensoritems[self.sensor_name].status != sd.ConStatus.CONNECTED:
-            count += 1
-            self.connect_status.setText(dynamic_string ('Connecting', '.', count))
-            self.connect_status.repaint()
-            self.garment_sensors.Connect()
-            if count > 4:
-                self.connect_status.setText('Connection failed')
-                self.connect_status.repaint()
-                return
-
-        print ("Made connection, assigning garment_sensor")
-        self.hide()
+        self.garment_sensors.Connect (self.sensor_name)
+        self.count = 0
+        self.poll_timer.start (CONNECT_POLL)
+
+    def pollConnect (self):
+        """ Check on the connection started by connectClicked """
+        self.count += 1
+        status = self.garment_sensors.sensoritems[self.sensor_name].status
+        if status in [sd.ConStatus.CONNECTED, sd.ConStatus.STREAMING]:
+            self.poll_timer.stop()
+            print ("Made connection, assigning garment_sensor")
+            self.hide()
+        elif self.count > CONNECT_TRIES:
+            self.poll_timer.stop()
+            self.garment_sensors.sensoritems[self.sensor_name].CloseConnect()
+            self.connect_status.setText('Connection failed')
+        else:
+            self.connect_status.setText(dynamic_string ('Connecting', '.', self.count))
 #-----------------------------------------------------------------------------
 # Window that shows the status of the garment and sensors
 #-----------------------------------------------------------------------------
@@ -395,6 +497,7 @@ class GarmentStatus(QWidget):
         self.but_calibrate.setStyleSheet("font: 12pt Arial MS")
         self.garment_view  = DrawJacket(self)
         self.garment_view.setGeometry (0,0,100,150)
+        self.stats_time    = 0.0
         
         self.grid = QGridLayout(self.widget)
 
@@ -404,6 +507,15 @@ class GarmentStatus(QWidget):
         self.grid.addWidget (self.but_calibrate, 4, 0)
         self.grid.addWidget (self.garment_view, 1,1, 4,1)
     
+    def UpdateStats (self, garment_sensors):
+        """ Show the link statistics of each connection in label_freq, at most
+        every STATS_INTERVAL seconds """
+        now = time.perf_counter()
+        if now - self.stats_time < STATS_INTERVAL:
+            return
+        self.stats_time = now
+        self.label_freq.setText ("\n".join (item.stats.Summary (key) for key, item in garment_sensors.sensoritems.items()))
+
     def Trigger_Calibrate (self):
         self.parent.state = vw.ViewStates.CALIBRATE
         self.calibrate_start =  time.time()
@@ -499,6 +611,7 @@ class RecordPlay(QWidget):
         self.full_layout.addLayout (self.but_layout)
                 
         self.recplay = sd.RecPlay()   # Create object for 
+        self.recplay.record_folder = RECORD_FOLDER    # Record straight to disk
         
     def recClicked (self):
         print ("Record clicked") 
@@ -524,15 +637,15 @@ class RecordPlay(QWidget):
     
     def UpdateTrackList (self):
         self.list.clear()
-        for track in self.recplay.track_list:
-            self.list.addItem(track.name)
+        for name in self.recplay.TrackNames():
+            self.list.addItem(name)
             
     def ListClicked (self):
         row = self.list.currentRow()
         print ("List clicked ", row)
         # Clear the data table and the RT graph
         self.table.dataview.ClearList()
-        self.table.tableWidget.clearContents()
+        self.table.ClearTable()
         self.rt_plot.ClearPlot()
         self.rt_plot.plotview.ClearList()
 
@@ -636,8 +749,7 @@ class RTGraph (QWidget):
         """ Clear any running plots """
         # Empty buffers
         for plot in self.plotview.plotlist:
-            plot.x = []
-            plot.y = []
+            plot.Clear()
         # Clear plot
         for i in range (0,self.max_plot):
           x = []
@@ -646,8 +758,10 @@ class RTGraph (QWidget):
           self.graph[i].setData(x, y, pen = i, name = name)
           self.graph[i].clear()
             
-    def UpdatePlot (self, ele_list ):
-        """ Take in new data and update plot """
+    def UpdatePlot (self, ele_list, block=None):
+        """ Take in new data and update plot. With block, a TrackStore of the
+        samples, the plots are fed from its columns and ele_list need only
+        hold the newest Element of each sensor, for the list of options """
         if len(ele_list) == 0:
             return
         
@@ -660,8 +774,11 @@ class RTGraph (QWidget):
                 for item in self.plotview.optionslist:
                     self.ylist.addItem(item)
                     
-            if self.plots:
-                self.plotview.UpdatePlot (ele, self.plots)
+        # Samples go to the selected plots through the plotview routes
+        if block is None:
+            self.plotview.UpdatePlots (ele_list)
+        else:
+            self.plotview.UpdatePlotColumns (block)
 
         i = 0
         for i in range (0,self.max_plot):
@@ -678,8 +795,91 @@ class RTGraph (QWidget):
 #-----------------------------------------------------------------------------
 # Data tables
 #-----------------------------------------------------------------------------
+class DataTableModel (QAbstractTableModel):
+    """ Table of the latest element for each (message, sensor) row of a
+    DataView. Elements are staged as they arrive and only turned into text
+    by Refresh, at most rate times a second, which signals dataChanged for
+    just the cells whose text has changed """
+    def __init__(self, min_rows, columns, rate=TABLE_RATE):
+        super(DataTableModel, self).__init__()
+        self.min_rows = min_rows
+        self.columns  = columns
+        self.interval = 1.0 / rate
+        self.headers  = ['Msg', 'Time(s)']
+        self.colour   = QtGui.QColor(200,240,200)
+        self.last     = 0.0
+        self.Clear ()
+
+    def Clear (self):
+        self.beginResetModel()
+        self.cells   = [[""] * self.columns for i in range (self.min_rows)]
+        self.pending = {}       # Row : newest element not yet shown
+        self.endResetModel()
+
+    def Stage (self, rows):
+        """ rows is a dict of row : element, as from DataView.Rows """
+        self.pending.update (rows)
+
+    def Refresh (self, force=False):
+        """ Show the staged elements, if 1/rate seconds have passed """
+        now = time.perf_counter()
+        if not self.pending or (not force and now - self.last < self.interval):
+            return
+        self.last = now
+        top = max (self.pending) + 1
+        if top > len(self.cells):
+            self.beginInsertRows (QModelIndex(), len(self.cells), top - 1)
+            self.cells.extend ([[""] * self.columns for i in range (top - len(self.cells))])
+            self.endInsertRows()
+        for row, ele in self.pending.items():
+            new = self.Cells (ele)
+            old = self.cells[row]
+            self.cells[row] = new
+            # Signal each run of changed cells
+            col = 0
+            while col < self.columns:
+                if new[col] == old[col]:
+                    col += 1
+                    continue
+                first = col
+                while col < self.columns and new[col] != old[col]:
+                    col += 1
+                self.dataChanged.emit (self.index (row, first), self.index (row, col - 1))
+        self.pending = {}
+
+    def Cells (self, ele):
+        """ Text of each column for ele, the data as key, value pairs """
+        out = [ele.name, "{0:.2f}".format(ele.time)]
+        for key, val in ele.data.items():
+            out.append (key if isinstance(key, str) else str(key))
+            out.append (val if isinstance(val, str) else str(val))
+        out = out[:self.columns]
+        return (out + [""] * (self.columns - len(out)))
+
+    def rowCount (self, parent=QModelIndex()):
+        return (0 if parent.isValid() else len(self.cells))
+
+    def columnCount (self, parent=QModelIndex()):
+        return (0 if parent.isValid() else self.columns)
+
+    def data (self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return (QVariant())
+        if role == Qt.DisplayRole:
+            return (self.cells[index.row()][index.column()])
+        if role == Qt.BackgroundRole and index.column() == 0 and self.cells[index.row()][0]:
+            return (self.colour)
+        return (QVariant())
+
+    def headerData (self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return (QVariant())
+        if orientation == Qt.Horizontal and section < len(self.headers):
+            return (self.headers[section])
+        return (str(section + 1))
+
 class DataTable (QWidget):
-    def __init__(self, parent):
+    def __init__(self, parent, rate=TABLE_RATE):
         super(DataTable, self).__init__(parent)
 
         self.widget = QWidget()
@@ -689,90 +889,38 @@ class DataTable (QWidget):
         self.list.itemClicked.connect(self.ItemClicked)
 #        self.list.addItem("Item 1")
         self.row_num    = 7 
-        self.tableWidget = QTableWidget()
-        self.layout.addWidget (self.tableWidget, 4)
-        self.tableWidget.setRowCount(self.row_num)
-        self.tableWidget.setColumnCount(10)
-        self.tableWidget.setHorizontalHeaderLabels (['Msg', 'Time(s)'])
+        self.model = DataTableModel (self.row_num, 10, rate)
+        self.tableView = QTableView()
+        self.tableView.setModel (self.model)
+        self.layout.addWidget (self.tableView, 4)
 #         Adding this dynamic column resizing used to much computing power!
-#        header4 = self.tableWidget.horizontalHeader()
+#        header4 = self.tableView.horizontalHeader()
 #        header4.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
-        self.tableWidget.setItem(1, 0, QtGui.QTableWidgetItem())
 
-        self.tablelist = []     # Used to store elements that appear in table
-        
         # Set up DataView object to handle list 
         self.dataview = sd.DataView()
         
     def UpdateTable (self, ele_list):
-        if len(ele_list) == 0:
-            return
-        
-        # Check if item in option list - if not add it and update list
-        for ele in ele_list:
-            update = self.dataview.RefreshList(ele)  # Update true if a new option added to optionlist
-            if update:
-                self.list.clear()
-                for item in self.dataview.optionslist:
-                    self.list.addItem(item)
-            
-            # Is the element a selected item, if so update table entry
-            # FIrst if handles sensor_n items 
-            # Second handles SA_EUL_AUG etc. 
-            for item in self.dataview.filterlist:
-                update_ele = False
-                if "Sensor" in item:
-                    str_items = item.split ('_')
-                    sen_num = int (str_items[1])
-                    ele_sen_num = int(ele.data["sensor"])
-                    if sen_num == ele_sen_num:
-                        update_ele = True
-                else :
-                    if item == ele.name:
-                        update_ele = True
-                    
-
-                if (update_ele):
-                    #for ele in self.tablelist:
-                    #    ele.Print()
-                    indx = 0
-                    found = False
-                    for item in self.tablelist:
-                        if item.name == ele.name and item.data['sensor'] == ele.data['sensor']:
-                            found = True
-                            break
-                        indx += 1
-                        
-                    if not found :
-                        self.tablelist.append (ele)
-
-
-                    # check that we have enough rows in the table to display all the information
-                    # if note print a warning
-                    # print ( len(self.tablelist), self.row_num )
-                    if len(self.tablelist) > self.row_num:
-                        print ("Warning data table does not have suffient rows to display all items ")
-                    self.tableWidget.setItem (indx, 0, QTableWidgetItem (ele.name))
-                    self.tableWidget.item(indx,0).setBackground(QtGui.QColor(200,240,200))
-                    
-                    
-                    self.tableWidget.setItem (indx, 1, QTableWidgetItem ("{0:.2f}".format(ele.time)))
-                    i = 1
-                    for key, val in ele.data.items():
-                        i += 1
-                        if isinstance(key, str): 
-                            self.tableWidget.setItem (indx, i, QTableWidgetItem(key))
-                        else:
-                            self.tableWidget.setItem (indx, i, QTableWidgetItem(str(key)))
-                        i += 1
-                        if isinstance(val, str): 
-                            self.tableWidget.setItem (indx, i, QTableWidgetItem(val))
-                        else:
-                            self.tableWidget.setItem (indx, i, QTableWidgetItem(str(val)))
+        with pf.Stage ("UpdateTable"):
+            # Check if item in option list - if not add it and update list
+            for ele in ele_list:
+                update = self.dataview.RefreshList(ele)  # Update true if a new option added to optionlist
+                if update:
+                    self.list.clear()
+                    for item in self.dataview.optionslist:
+                        self.list.addItem(item)
                 
+            # Only the newest element for each row is kept, and the table only
+            # redrawn at the model's rate
+            if ele_list:
+                self.model.Stage (self.dataview.Rows (ele_list))
+            self.model.Refresh ()
+                
+    def ClearTable (self):
+        self.model.Clear()
+
     def ItemClicked (self, item):
-        self.tablelist = []
-        self.tableWidget.clearContents()
+        self.model.Clear()
         self.dataview.SetFilter (item.text())
                          
                 
@@ -780,6 +928,66 @@ class DataTable (QWidget):
 #        self.sensor_num = n
         
 
+#-----------------------------------------------------------------------------
+# Dockable panel of the Profiler stage timings
+#-----------------------------------------------------------------------------
+class ProfilerPanel (QDockWidget):
+    """ Turns the profiler on and off, shows the rolling percentiles of each
+    stage and the rates of the counters, and dumps them to JSON or CSV """
+    COLUMNS = ("Stage", "Calls", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Blocks/call")
+
+    def __init__ (self, parent):
+        super(ProfilerPanel, self).__init__("Profiler", parent)
+        self.widget = QWidget()
+        self.enabled = QCheckBox ("Enabled")
+        self.enabled.setChecked (pf.PROFILER.enabled)
+        self.enabled.toggled.connect (pf.Enable)
+        self.but_clear = QPushButton ("Clear")
+        self.but_clear.clicked.connect (self.Clear)
+        self.but_dump = QPushButton ("Dump...")
+        self.but_dump.clicked.connect (self.Dump)
+        self.table = QTableWidget (0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels (self.COLUMNS)
+        self.table.horizontalHeaderItem (self.COLUMNS.index ("Blocks/call")).setToolTip (
+            "Memory blocks allocated and not freed in the stage, by the whole process,\n"
+            "so allocations by other threads while the stage runs are counted too")
+        self.table.verticalHeader().setVisible (False)
+        self.label_counts = QLabel ('')
+
+        self.grid = QGridLayout(self.widget)
+        self.grid.addWidget (self.enabled, 0, 0)
+        self.grid.addWidget (self.but_clear, 0, 1)
+        self.grid.addWidget (self.but_dump, 0, 2)
+        self.grid.addWidget (self.table, 1, 0, 1, 3)
+        self.grid.addWidget (self.label_counts, 2, 0, 1, 3)
+        self.setWidget (self.widget)
+
+    def Refresh (self):
+        stats = pf.Stats()
+        stages = sorted (stats["stages"].items())
+        self.table.setRowCount (len(stages))
+        for row, (name, st) in enumerate (stages):
+            values = (name, "%d" % st["calls"], "%.3f" % st["p50_ms"], "%.3f" % st["p95_ms"],
+                      "%.3f" % st["p99_ms"], "%.3f" % st["max_ms"], "%.1f" % st["blocks_per_call"])
+            for col, text in enumerate (values):
+                self.table.setItem (row, col, QTableWidgetItem (text))
+        self.label_counts.setText ("\n".join ("%s: %d elements, %.0f/s" % (name, cnt["total"], cnt["per_s"])
+                                              for name, cnt in sorted (stats["counters"].items())))
+
+    def Clear (self):
+        pf.PROFILER.Clear()
+        self.Refresh()
+
+    def Dump (self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Dump profile", "..", "JSON (*.json);;CSV (*.csv)")
+        if not filename:
+            return
+        try:
+            pf.Dump (filename)
+        except OSError as err:
+            print ("Error writing profile", err)
+
+
 def dynamic_string (string, ch, i):
     return (string + (i%10)*ch )
         
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Rotation matrices for the x, y, z Euler angles (in degrees, right hand rule)
+used throughout, R = Rx * Ry * Rz. The matrix is written straight from the
+sines and cosines of the angles rather than as the product of three matrices:
+
+        |  cy*cz             -cy*sz              sy    |
+    R = |  sx*sy*cz + cx*sz   cx*cz - sx*sy*sz  -sx*cy |
+        |  sx*sz - cx*sy*cz   cx*sy*sz + sx*cz   cx*cy |
+
+Functions work on plain numpy arrays. EulerMatrix can write into an existing
+array, EulerMatrices does N sets of angles at once and the Cached versions
+keep the matrices for inputs that rarely change, e.g. calibration and root.
+"""
+
+import math as m
+from functools import lru_cache
+import numpy as np
+
+CACHE_SIZE = 64
+
+
+def EulerMatrix (angles, out=None):
+    """ 3x3 rotation matrix for angles (x, y, z in degrees), written into out
+    if given """
+    r_x, r_y, r_z = m.radians (angles[0]), m.radians (angles[1]), m.radians (angles[2])
+    sx, cx = m.sin (r_x), m.cos (r_x)
+    sy, cy = m.sin (r_y), m.cos (r_y)
+    sz, cz = m.sin (r_z), m.cos (r_z)
+    if out is None:
+        out = np.empty ((3, 3))
+    out[0,0] = cy*cz
+    out[0,1] = -cy*sz
+    out[0,2] = sy
+    out[1,0] = sx*sy*cz + cx*sz
+    out[1,1] = cx*cz - sx*sy*sz
+    out[1,2] = -sx*cy
+    out[2,0] = sx*sz - cx*sy*cz
+    out[2,1] = cx*sy*sz + sx*cz
+    out[2,2] = cx*cy
+    return (out)
+
+def EulerMatrices (angles):
+    """ Rotation matrices, shape (N,3,3), for an (N,3) array of angles """
+    rad = np.radians (np.asarray (angles, dtype=np.float64))
+    sx, sy, sz = np.moveaxis (np.sin (rad), -1, 0)
+    cx, cy, cz = np.moveaxis (np.cos (rad), -1, 0)
+    rot = np.empty (rad.shape[:-1] + (3, 3))
+    rot[...,0,0] = cy*cz
+    rot[...,0,1] = -cy*sz
+    rot[...,0,2] = sy
+    rot[...,1,0] = sx*sy*cz + cx*sz
+    rot[...,1,1] = cx*cz - sx*sy*sz
+    rot[...,1,2] = -sx*cy
+    rot[...,2,0] = sx*sz - cx*sy*cz
+    rot[...,2,1] = cx*sy*sz + sx*cz
+    rot[...,2,2] = cx*cy
+    return (rot)
+
+def EulerQuaternions (angles):
+    """ Unit quaternions (w, x, y, z), shape (N,4), of the rotations given by
+    EulerMatrices for an (N,3) array of angles """
+    half = np.radians (np.asarray (angles, dtype=np.float64)) / 2
+    sx, sy, sz = np.moveaxis (np.sin (half), -1, 0)
+    cx, cy, cz = np.moveaxis (np.cos (half), -1, 0)
+    # qx * qy * qz to match Rx * Ry * Rz
+    quat = np.empty (half.shape[:-1] + (4,))
+    quat[...,0] = cx*cy*cz - sx*sy*sz
+    quat[...,1] = sx*cy*cz + cx*sy*sz
+    quat[...,2] = cx*sy*cz - sx*cy*sz
+    quat[...,3] = cx*cy*sz + sx*sy*cz
+    return (quat)
+
+@lru_cache (maxsize=CACHE_SIZE)
+def _CachedEuler (x, y, z):
+    rot = EulerMatrix ((x, y, z))
+    rot.flags.writeable = False
+    return (rot)
+
+def CachedEulerMatrix (angles):
+    """ EulerMatrix for angles that repeat, the matrix returned is shared so
+    is read only """
+    return (_CachedEuler (float(angles[0]), float(angles[1]), float(angles[2])))
+
+@lru_cache (maxsize=CACHE_SIZE)
+def _CachedRoot (rotate, calibrate):
+    rot = CachedEulerMatrix (calibrate).T @ CachedEulerMatrix (rotate)
+    rot.flags.writeable = False
+    return (rot)
+
+def CachedRootMatrix (rotate, calibrate):
+    """ Rotation of the body root, calibration rotation transposed times the
+    absolute rotation as in Body.Update. Read only and shared """
+    return (_CachedRoot (tuple (float(x) for x in rotate), tuple (float(x) for x in calibrate)))
+
+def IsRotationMatrix (R, tol=1e-6):
+    """ True if R transposed times R is the identity to within tol """
+    r = np.asarray (R, dtype=np.float64).tolist()
+    err = 0.0
+    for i in range (3):
+        for j in range (i, 3):
+            dot = r[0][i]*r[0][j] + r[1][i]*r[1][j] + r[2][i]*r[2][j] - (1.0 if i == j else 0.0)
+            err += dot*dot * (1.0 if i == j else 2.0)
+    return (m.sqrt (err) < tol)
+
+def MatrixToEuler (R):
+    """ Angles (x, y, z in radians) of rotation matrix R. The result is the
+    same as MATLAB except the order of the euler angles (x and z swapped) """
+    r  = np.asarray (R, dtype=np.float64).tolist()
+    sy = m.sqrt (r[0][0]*r[0][0] + r[1][0]*r[1][0])
+    if sy >= 1e-6:
+        x = m.atan2 (r[2][1], r[2][2])
+        y = m.atan2 (-r[2][0], sy)
+        z = m.atan2 (r[1][0], r[0][0])
+    else:
+        x = m.atan2 (-r[1][2], r[1][1])
+        y = m.atan2 (-r[2][0], sy)
+        z = 0
+    return (np.array ([x, y, z]))
+
+def MatricesToEuler (R):
+    """ MatrixToEuler for an (N,3,3) array, returns (N,3) """
+    R  = np.asarray (R, dtype=np.float64)
+    sy = np.hypot (R[:,0,0], R[:,1,0])
+    singular = sy < 1e-6
+    x = np.where (singular, np.arctan2 (-R[:,1,2], R[:,1,1]), np.arctan2 (R[:,2,1], R[:,2,2]))
+    y = np.arctan2 (-R[:,2,0], sy)
+    z = np.where (singular, 0.0, np.arctan2 (R[:,1,0], R[:,0,0]))
+    return (np.stack ([x, y, z], axis=1))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio version of StreamData.Sensors for running several garments (jacket,
+trousers, bat sensor...) at once. An event loop on its own thread owns a UDP
+endpoint per garment, so connecting, streaming and reading never block the GUI.
+Each garment has a supervisor task that makes the connection, restores
+streaming, and reconnects with a doubling backoff when the garment refuses or
+goes quiet. Datagrams go onto the connection's PacketQueue as for
+ApparelConnection, and ReadColumns merges the samples of all the garments into
+one TrackStore ordered by time (ReadData the same as a list of Elements).
+Classes are:
+    HubConnection - ApparelConnection driven by the hub's event loop
+    SensorHub     - the loop and its connections, used in place of Sensors
+"""
+
+import asyncio
+import threading
+import time
+import StreamData as sd
+import TrackStore as ts
+import PacketQueue as pq
+import WireProtocol as wp
+import Profiler as pf
+
+BACKOFF_START  = 0.25   # Seconds before the first reconnect
+BACKOFF_MAX    = 8.0    # Longest wait between reconnects
+SILENCE_TIMEOUT = 2.0   # Seconds without a packet before reconnecting
+CHECK_INTERVAL = 0.1    # How often the supervisor looks at the connection
+
+
+class _Protocol (asyncio.DatagramProtocol):
+    """ Hands datagrams for a HubConnection to its queue """
+    def __init__ (self, conn):
+        self.conn = conn
+
+    def datagram_received (self, data, addr):
+        self.conn.queue.Put (data)
+        self.conn.last_packet = time.perf_counter()
+
+    def error_received (self, exc):
+        # Usually connection refused, nothing listening at the garment's port
+        self.conn.errors += 1
+        self.conn.lost.set()
+
+    def connection_lost (self, exc):
+        self.conn.lost.set()
+
+
+class HubConnection (sd.ApparelConnection):
+    """ Connection whose socket belongs to the hub's event loop. Connect,
+    StreamData, StreamClose and CloseConnect return at once, the work being
+    done on the loop, and status shows how it is going """
+    def __init__ (self, hub, label, tcp_ip, port, buffer_size, queue_depth=pq.DEFAULT_DEPTH, protocol=wp.TEXT):
+        super().__init__ (label, tcp_ip, port, buffer_size, queue_depth, protocol)
+        self.hub         = hub
+        self.transport   = None
+        self.task        = None     # Supervisor task while connecting or connected
+        self.streaming   = False    # Streaming wanted, restored after a reconnect
+        self.last_packet = None
+        self.lost        = None     # asyncio.Event set when the endpoint fails
+        self.errors      = 0
+        self.reconnects  = 0
+
+    def Connect (self):
+        if self.task is None:
+            self.status = sd.ConStatus.CONNECTING
+            self.task   = self.hub.Submit (self._Supervise())
+
+    def SendMSG (self, msg):
+        if self.transport is not None:
+            self.hub.loop.call_soon_threadsafe (self._Send, msg)
+
+    def _Send (self, msg):
+        if self.transport is not None:
+            self.transport.sendto (msg.encode('ascii'))
+
+    def StreamData (self):
+        self.streaming = True
+        super().StreamData()
+
+    def StreamClose (self):
+        self.streaming = False
+        super().StreamClose()
+
+    def CloseConnect (self):
+        self.streaming = False
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.status = sd.ConStatus.DISCONNECTED
+
+    def QueueStats (self):
+        stats = super().QueueStats()
+        stats["errors"]     = self.errors
+        stats["reconnects"] = self.reconnects
+        return (stats)
+
+    async def _Open (self):
+        """ Make the endpoint and send the start messages """
+        loop = asyncio.get_running_loop()
+        self.lost = asyncio.Event()
+        self.transport, _ = await loop.create_datagram_endpoint (lambda: _Protocol (self),
+                                                                 remote_addr=(self.tcp_ip, self.port))
+        self.transport.sendto (b"Start")
+        if self.streaming:
+            self.transport.sendto (b"SA_SND_DAT")
+        self.status = sd.ConStatus.STREAMING if self.streaming else sd.ConStatus.CONNECTED
+
+    def _Shut (self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def _Quiet (self, opened):
+        """ True if data has stopped arriving. A garment that has not sent
+        anything since the connection was made is left alone """
+        if self.last_packet is None or self.last_packet < opened:
+            return (False)
+        return (time.perf_counter() - self.last_packet > SILENCE_TIMEOUT)
+
+    async def _Supervise (self):
+        """ Connect, watch and reconnect until cancelled """
+        backoff = BACKOFF_START
+        try:
+            while True:
+                try:
+                    await self._Open()
+                except OSError:
+                    self.errors += 1
+                    self.status = sd.ConStatus.ERROR_CONNECTING
+                else:
+                    opened = time.perf_counter()
+                    while not self.lost.is_set() and not self._Quiet (opened):
+                        try:
+                            await asyncio.wait_for (self.lost.wait(), CHECK_INTERVAL)
+                        except asyncio.TimeoutError:
+                            pass
+                    if self.last_packet is not None and self.last_packet >= opened:
+                        backoff = BACKOFF_START     # It was working, try again quickly
+                    self._Shut()
+                    self.status = sd.ConStatus.CONNECTING
+                self.reconnects += 1
+                await asyncio.sleep (backoff)
+                backoff = min (backoff * 2, BACKOFF_MAX)
+        finally:
+            if self.transport is not None:
+                self.transport.sendto (b"SA_STP_DAT")
+            self._Shut()
+
+
+class SensorHub ():
+    """ Drop in for Sensors, the garments being run on an event loop thread """
+    def __init__ (self):
+        self.sensoritems = {}
+        self.loop   = asyncio.new_event_loop()
+        self.thread = threading.Thread (target=self.loop.run_forever, name="SensorHub", daemon=True)
+        self.thread.start()
+
+    def Submit (self, coro):
+        """ Run coro on the hub's loop, returns a concurrent.futures.Future """
+        return (asyncio.run_coroutine_threadsafe (coro, self.loop))
+
+    def AddConTCP (self, label, tcp_ip, port, buffer_size, queue_depth=pq.DEFAULT_DEPTH, protocol=wp.TEXT):
+        if label in self.sensoritems:
+            self.sensoritems[label].CloseConnect()
+        self.sensoritems[label] = HubConnection (self, label, tcp_ip, port, buffer_size, queue_depth, protocol)
+
+    def Connect (self, label=None):
+        """ Start connecting label, or every connection not yet started """
+        for key, item in self.sensoritems.items():
+            if label is None or key == label:
+                item.Connect()
+
+    def StreamData (self):
+        for item in self.sensoritems.values():
+            item.StreamData()
+
+    def StreamClose (self):
+        for item in self.sensoritems.values():
+            item.StreamClose()
+
+    def ReadColumns (self):
+        """ TrackStore of the samples received from all the garments since the
+        last call, in time order """
+        with pf.Stage ("ReadData"):
+            blocks = [item.GetColumns() for item in self.sensoritems.values()]
+            blocks = [block for block in blocks if block is not None]
+            if len(blocks) == 1:
+                block = blocks[0]
+            else:
+                block = ts.TrackStore()
+                for new_block in blocks:
+                    block.ExtendStore (new_block)
+            block.SortOrder()       # UDP can reorder
+        pf.Count ("ReadData", block.count)
+        return (block)
+
+    def ReadData (self):
+        """ Elements received from all the garments since the last call, in
+        time order """
+        block = self.ReadColumns()
+        return (block.Elements (0, block.count))
+
+    def CloseDataCon (self):
+        for item in self.sensoritems.values():
+            item.CloseConnect()
+
+    def QueueStats (self):
+        """ Receive queue metrics for each connection, keyed by label """
+        return ({key:item.QueueStats() for key, item in self.sensoritems.items()})
+
+    def LinkStats (self):
+        """ LinkStats for each connection, keyed by label """
+        return ({key:item.LinkStats() for key, item in self.sensoritems.items()})
+
+    async def _Finish (self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather (*tasks, return_exceptions=True)
+
+    def Stop (self):
+        """ Close every connection and stop the loop """
+        self.CloseDataCon()
+        self.Submit (self._Finish()).result (1.0)
+        self.loop.call_soon_threadsafe (self.loop.stop)
+        self.thread.join (1.0)
+        self.loop.close()
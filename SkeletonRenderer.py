@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Draws players with vertex buffers and a shader rather than immediate mode.
+PlayerViewer.DrawRodSolid makes two gluCylinder and a gluSphere call, each
+with its own matrix pushes, for every rod, so the Python to GL calls grow
+with the number of joints and players. Here a unit cylinder (radius 1 along
+z from 0 to 1), its wire frame and a unit sphere are put in buffers once.
+Each frame the transform of every rod and joint of every player is worked
+out in one NumPy array, uploaded as per-instance data, and each mesh is
+drawn with a single instanced draw call.
+
+The shader uses the fixed function modelview and projection matrices, so
+the camera moves made with glTranslate and glRotatef by PlayerViewer still
+apply. Needs OpenGL 3.3 (instanced arrays), SkeletonRenderer raises
+RuntimeError when it is not there and the viewer keeps to immediate mode.
+Classes are:
+    SkeletonRenderer - instanced renderer for the bodies of players
+"""
+
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+
+ROD_RADIUS    = 2.0     # As the gluCylinder calls in Viewer
+JOINT_RADIUS  = 3.0     # As the gluSphere calls in Viewer
+CYL_SLICES    = 6
+CYL_STACKS    = 6
+SPHERE_SLICES = 30
+SPHERE_STACKS = 30
+ROD_COLOUR    = (200/255., 200/255., 200/255.)
+WIRE_COLOUR   = (2/255., 2/255., 2/255.)
+JOINT_COLOUR  = (250/255., 48/255., 250/255.)
+
+POSITION = 0            # Attribute locations
+MODEL    = 1            # Four of them, one per column of the model matrix
+
+VERTEX_SHADER = """
+#version 130
+in vec3 position;
+in vec4 model_0;
+in vec4 model_1;
+in vec4 model_2;
+in vec4 model_3;
+void main() {
+    mat4 model = mat4 (model_0, model_1, model_2, model_3);
+    gl_Position = gl_ModelViewProjectionMatrix * model * vec4 (position, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 130
+uniform vec3 colour;
+out vec4 frag_colour;
+void main() {
+    frag_colour = vec4 (colour, 1.0);
+}
+"""
+
+
+def CylinderMesh (slices, stacks):
+    """ Triangles of the side of a unit cylinder, as gluCylinder """
+    ang = 2 * np.pi * np.arange (slices + 1) / slices
+    z   = np.arange (stacks + 1) / stacks
+    ring = np.stack ((np.cos (ang), np.sin (ang)), axis=1)
+    tris = []
+    for k in range (stacks):
+        for i in range (slices):
+            a0 = (*ring[i], z[k])
+            a1 = (*ring[i+1], z[k])
+            b0 = (*ring[i], z[k+1])
+            b1 = (*ring[i+1], z[k+1])
+            tris.extend ((a0, a1, b1, a0, b1, b0))
+    return (np.array (tris, dtype=np.float32))
+
+def CylinderLines (slices, stacks):
+    """ Line pairs of the cylinder wire frame, the rings and the lines along
+    it, as gluCylinder with GLU_LINE """
+    ang  = 2 * np.pi * np.arange (slices + 1) / slices
+    z    = np.arange (stacks + 1) / stacks
+    ring = np.stack ((np.cos (ang), np.sin (ang)), axis=1)
+    lines = []
+    for k in range (stacks + 1):
+        for i in range (slices):
+            lines.extend (((*ring[i], z[k]), (*ring[i+1], z[k])))
+    for i in range (slices):
+        lines.extend (((*ring[i], 0.0), (*ring[i], 1.0)))
+    return (np.array (lines, dtype=np.float32))
+
+def SphereMesh (slices, stacks):
+    """ Triangles of a unit sphere """
+    theta = np.pi * np.arange (stacks + 1) / stacks
+    phi   = 2 * np.pi * np.arange (slices + 1) / slices
+    pts   = np.stack ((np.sin (theta)[:,None] * np.cos (phi)[None,:],
+                       np.sin (theta)[:,None] * np.sin (phi)[None,:],
+                       np.cos (theta)[:,None] * np.ones (len(phi))[None,:]), axis=2)
+    tris = []
+    for k in range (stacks):
+        for i in range (slices):
+            tris.extend ((pts[k,i], pts[k+1,i], pts[k+1,i+1], pts[k,i], pts[k+1,i+1], pts[k,i+1]))
+    return (np.array (tris, dtype=np.float32))
+
+def RodTransforms (start, end, radius=ROD_RADIUS):
+    """ (N,4,4) model matrices taking the unit cylinder to the rods from
+    start to end, each (N,3). The rotation is the half turn about the
+    halfway vector of z and the rod, as in DrawRodSolid """
+    vec  = end - start
+    mag  = np.sqrt ((vec * vec).sum (axis=1))
+    unit = vec / np.where (mag > 0, mag, 1.0)[:,None]
+    half = unit + np.array ([0.0, 0.0, 1.0])
+    size = np.sqrt ((half * half).sum (axis=1))
+    flip = size < 1e-9              # Rod pointing down z, turn about x
+    half[flip] = (1.0, 0.0, 0.0)
+    size[flip] = 1.0
+    half /= size[:,None]
+    rot = 2 * half[:,:,None] * half[:,None,:] - np.identity (3)
+    out = np.zeros ((len(start), 4, 4))
+    out[:,:3,:3] = rot * np.stack ((np.full (len(mag), radius), np.full (len(mag), radius), mag), axis=1)[:,None,:]
+    out[:,:3,3]  = start
+    out[:,3,3]   = 1.0
+    return (out)
+
+def JointTransforms (pos, radius=JOINT_RADIUS):
+    """ (N,4,4) model matrices taking the unit sphere to pos (N,3) """
+    out = np.zeros ((len(pos), 4, 4))
+    out[:,0,0] = out[:,1,1] = out[:,2,2] = radius
+    out[:,:3,3] = pos
+    out[:,3,3]  = 1.0
+    return (out)
+
+
+class _Layout ():
+    """ Rods of a body in depth first order with the matrix that sums the
+    offsets of each rod and the rods above it """
+    def __init__ (self, body):
+        self.body   = body
+        self.rods   = []
+        self.parent = []
+        for rod in body.root:
+            self._Add (rod, -1)
+        n = len(self.rods)
+        self.parent = np.array (self.parent, dtype=np.int64)
+        self.above  = np.zeros ((n, n))
+        for j in range (n):
+            k = j
+            while k >= 0:
+                self.above[j,k] = 1.0
+                k = self.parent[k]
+        # Joints drawn at the start of rods, once each, -1 being the root
+        self.joints = np.unique (self.parent)
+
+    def _Add (self, rod, parent):
+        self.rods.append (rod)
+        self.parent.append (parent)
+        j = len(self.rods) - 1
+        for item in rod.next:
+            self._Add (item, j)
+
+    def Segments (self):
+        """ Start and end of each rod as (rods,3) arrays, and the joints """
+        offsets = np.array ([rod.offset for rod in self.rods], dtype=np.float64)
+        tran  = np.asarray (self.body.tran, dtype=np.float64)
+        end   = tran + self.above @ offsets
+        start = np.where (self.parent[:,None] < 0, tran, end[self.parent])
+        joints = np.where (self.joints[:,None] < 0, tran, end[self.joints])
+        return (start, end, joints)
+
+
+class SkeletonRenderer ():
+    """ Instanced drawing of the bodies of players, make one after the GL
+    context exists """
+    def __init__ (self):
+        if not bool (glVertexAttribDivisor) or not bool (glDrawArraysInstanced):
+            raise RuntimeError ("OpenGL 3.3 instanced arrays not available")
+        self.program = self._Program ()
+        self.colour  = glGetUniformLocation (self.program, "colour")
+        self.layouts = {}
+        self.rod_inst   = glGenBuffers (1)
+        self.joint_inst = glGenBuffers (1)
+        self.line_buf   = glGenBuffers (1)
+        self.meshes = {}
+        for name, verts, inst in (("rod", CylinderMesh (CYL_SLICES, CYL_STACKS), self.rod_inst),
+                                  ("wire", CylinderLines (CYL_SLICES, CYL_STACKS), self.rod_inst),
+                                  ("joint", SphereMesh (SPHERE_SLICES, SPHERE_STACKS), self.joint_inst)):
+            self.meshes[name] = (self._Mesh (verts, inst), len(verts))
+        self.lines = self._Mesh (None, None)
+
+    def _Program (self):
+        program = glCreateProgram ()
+        for kind, source in ((GL_VERTEX_SHADER, VERTEX_SHADER), (GL_FRAGMENT_SHADER, FRAGMENT_SHADER)):
+            shader = glCreateShader (kind)
+            glShaderSource (shader, source)
+            glCompileShader (shader)
+            if not glGetShaderiv (shader, GL_COMPILE_STATUS):
+                raise RuntimeError ("Shader compile failed: " + str(glGetShaderInfoLog (shader)))
+            glAttachShader (program, shader)
+        glBindAttribLocation (program, POSITION, "position")
+        for k in range (4):
+            glBindAttribLocation (program, MODEL + k, "model_%d" % k)
+        glLinkProgram (program)
+        if not glGetProgramiv (program, GL_LINK_STATUS):
+            raise RuntimeError ("Shader link failed: " + str(glGetProgramInfoLog (program)))
+        return (program)
+
+    def _Mesh (self, verts, inst):
+        """ Vertex array for verts (uploaded once) drawn with the model
+        matrices in buffer inst. With no verts the vertex buffer is the line
+        buffer, filled each frame, and there are no model matrices """
+        vao = glGenVertexArrays (1)
+        glBindVertexArray (vao)
+        if verts is None:
+            glBindBuffer (GL_ARRAY_BUFFER, self.line_buf)
+        else:
+            glBindBuffer (GL_ARRAY_BUFFER, glGenBuffers (1))
+            glBufferData (GL_ARRAY_BUFFER, verts.nbytes, verts, GL_STATIC_DRAW)
+        glEnableVertexAttribArray (POSITION)
+        glVertexAttribPointer (POSITION, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p (0))
+        if inst is not None:
+            glBindBuffer (GL_ARRAY_BUFFER, inst)
+            for k in range (4):
+                glEnableVertexAttribArray (MODEL + k)
+                glVertexAttribPointer (MODEL + k, 4, GL_FLOAT, GL_FALSE, 64, ctypes.c_void_p (16 * k))
+                glVertexAttribDivisor (MODEL + k, 1)
+        glBindVertexArray (0)
+        glBindBuffer (GL_ARRAY_BUFFER, 0)
+        return (vao)
+
+    def Layout (self, body):
+        """ _Layout of body, made the first time it is drawn """
+        layout = self.layouts.get (id(body))
+        if layout is None or layout.body is not body:
+            layout = self.layouts[id(body)] = _Layout (body)
+        return (layout)
+
+    def Transforms (self, bodies):
+        """ Model matrices of every rod and joint of bodies, as (N,4,4) arrays """
+        rods, joints = [], []
+        for body in bodies:
+            start, end, pos = self.Layout (body).Segments ()
+            rods.append (RodTransforms (start, end))
+            joints.append (JointTransforms (pos))
+        return (np.concatenate (rods), np.concatenate (joints))
+
+    def _Upload (self, buf, data):
+        """ Matrices into buffer buf, columns first as GL wants them """
+        data = np.ascontiguousarray (data.transpose (0, 2, 1), dtype=np.float32)
+        glBindBuffer (GL_ARRAY_BUFFER, buf)
+        glBufferData (GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+
+    def _Draw (self, name, mode, count, colour):
+        vao, n_verts = self.meshes[name]
+        glUniform3f (self.colour, *colour)
+        glBindVertexArray (vao)
+        glDrawArraysInstanced (mode, 0, n_verts, count)
+
+    def DrawSolid (self, bodies):
+        """ Rods as filled and wire frame cylinders with spheres at the joints,
+        as PlayerViewer.DrawPlayerSolid, for all bodies at once """
+        rods, joints = self.Transforms (bodies)
+        glUseProgram (self.program)
+        self._Upload (self.rod_inst, rods)
+        self._Upload (self.joint_inst, joints)
+        self._Draw ("rod", GL_TRIANGLES, len(rods), ROD_COLOUR)
+        self._Draw ("wire", GL_LINES, len(rods), WIRE_COLOUR)
+        self._Draw ("joint", GL_TRIANGLES, len(joints), JOINT_COLOUR)
+        glBindVertexArray (0)
+        glBindBuffer (GL_ARRAY_BUFFER, 0)
+        glUseProgram (0)
+
+    def DrawLines (self, bodies, colour=ROD_COLOUR):
+        """ Rods as lines with a sphere at the end of the first rod, as
+        PlayerViewer.DrawPlayer """
+        segs, heads = [], []
+        for body in bodies:
+            start, end, _ = self.Layout (body).Segments ()
+            segs.append (np.stack ((start, end), axis=1).reshape (-1, 3))
+            heads.append (end[:1])
+        segs = np.ascontiguousarray (np.concatenate (segs), dtype=np.float32)
+        glUseProgram (self.program)
+        glBindBuffer (GL_ARRAY_BUFFER, self.line_buf)
+        glBufferData (GL_ARRAY_BUFFER, segs.nbytes, segs, GL_STREAM_DRAW)
+        glUniform3f (self.colour, *colour)
+        glBindVertexArray (self.lines)
+        for k in range (4):     # Identity model matrix, the lines are in world space
+            glVertexAttrib4f (MODEL + k, *(1.0 if i == k else 0.0 for i in range (4)))
+        glDrawArrays (GL_LINES, 0, len(segs))
+        heads = JointTransforms (np.concatenate (heads))
+        self._Upload (self.joint_inst, heads)
+        self._Draw ("joint", GL_TRIANGLES, len(heads), JOINT_COLOUR)
+        glBindVertexArray (0)
+        glBindBuffer (GL_ARRAY_BUFFER, 0)
+        glUseProgram (0)
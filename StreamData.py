@@ -4,7 +4,8 @@ Created on Tue Dec 12 22:27:30 2017
 
 Classes for handling streaming data, including receiving data over UDP stream. 
 Class are:
-    Element  - basic element in a time series contains data at a particular time
+    Element  - basic element in a time series contains data at a particular time,
+               now in Messages with the text decoding and kept here by name
     Track    - Contains time series, together with the player and other associated 
                information
     RecPlay  - Class to manage the record and playback of tracks
@@ -16,12 +17,31 @@ Class are:
 @author: Paul Gough
 """
 
+import io
+import os
 import socket
 from enum import Enum
 import datetime as dt
 import time
 import Player as pl
 import numpy as np
+import Messages as ms
+import TrackStore as ts
+import TrackText as tt
+import TrackBinary as tb
+import TrackIndex as ti
+import TrackRecorder as tr
+import TrackWriter as tw
+import PoseCache as pc
+import Kinematics as km
+import Rotation as rt
+import PacketQueue as pq
+import WireProtocol as wp
+import LinkStats as ls
+import Profiler as pf
+
+PLOT_CAPACITY = 1024    # Samples a PlotData starts with room for
+PLOT_BATCH    = 64      # Fewer samples than this for a plot are added one by one
 
 class PlayState(Enum):
     PLAY         = 1
@@ -30,54 +50,23 @@ class PlayState(Enum):
     STOP         = 4
     LIVE         = 5
 
-# Element is the basic element in our time series which consists of a list
-# of Elements. The dictionary can hold different types of data
-class Element ():
-    def __init__ (self, name, time, data_dict):
-        self.name      = name
-        self.time      = time       # Time in seconds
-        self.data_time = None       # Time in date_time form, not always filled in
-        self.data      = data_dict
-            
-    def Print (self):
-        print (self.name, self.time, self.data)
-        
-    def String (self):
-        return  (self.name + "," + str(self.time) + "," + dict_string (self.data))
-    
-    def Read (self, str_items):
-        """ Read and store element data using array of string items containing 
-        information"""   
-        length = len(str_items)
-        self.name = str_items [0]
-        self.time = float (str_items[1])
-        self.data = {}
-        for i in range (2, length, 2):
-            if (self.IsFloat(str_items[i])):
-                self.data[str_items[i]] = float (str_items[i+1])
-            elif (self.IsInt(str_items[i])):
-                self.data[str_items[i]] = int (str_items[i+1])
-            else:
-                print (str_items[i])
-                self.data[str_items[i]] = str_items[i+1]                
-        
-    def IsFloat (self, name):
-        fl_names = ["angle_X", "angle_Y", "angle_Z", "acc_X", "acc_Y", "acc_Z"]
-        return (name in fl_names)
-        
-    def IsInt (self, name):
-        int_names = ["sensor"]
-        return (name in int_names)
-        
+# Element and the text decoding are in Messages, the names are kept here
+Element        = ms.Element
+dict_string    = ms.dict_string
+DecodeError    = ms.DecodeError
+translate_elem = ms.translate_elem
+
 class Track ():
     """ A track is simply a time ordered sequence of elements
-    Read routine in RecPlay at the moment
+    Read routine in RecPlay at the moment. The data is held in columns (see
+    TrackStore), sequence gives the old list of Elements view onto it
     """
     def __init__ (self, name):
         self.name        = name
         self.t_len       = 0.0    # How long is the track in seconds
         self.start_time  = 0.0    # Date time at start of recording 
-        self.sequence    = []     # Track data sotred here as list of dict at each time point
+        self.store       = ts.TrackStore()               # Track data stored here as columns
+        self.sequence    = ts.SequenceView (self.store)  # Looks like a list of Elements
         self.calibrate   = None   # Used to capture calibration data relevant to sequence
         self.player      = None
         self.sensor_dict = {}
@@ -86,16 +75,18 @@ class Track ():
     def SetTimeLen (self):
         """ Determine how long (in sceonds) is the track time and reset sequence time
         so it starts at 0.0s """
-        start_time_s = self.sequence[0].time
-        end_time_s   = self.sequence[-1].time
+        times = self.store.Times()
+        if len(times) == 0:
+            self.t_len = 0.0
+            return
+        start_time_s = times[0]
+        end_time_s   = times.max()    # Samples need not be in time order
         
-        self.t_len = end_time_s - start_time_s
-        if self.t_len < 0.0 :
-            print ("Error, negative time for track length" )
+        self.t_len = float(end_time_s - start_time_s)
             
-        # Reset sequence time so it starts at 0.0
-        for item in self.sequence:
-            item.time -= start_time_s
+        # Reset sequence time so it starts at 0.0, then sort the times for playback
+        self.store.ShiftTime (start_time_s)
+        self.store.TimeOrder()
                
     def SetCalibrate (self, calibrate):
         self.calibrate = calibrate.copy()   # Calibrate dictionary
@@ -107,53 +98,52 @@ class Track ():
         self.sensor_dict = sensor_dict.copy()
         
     def Write (self, fp):
-        """ Write out track information to file pointer"""
+        """ Write out track information to file pointer. The sequence is
+        formatted a column at a time by TrackWriter """
+        tw.WriteTrack (self, fp)
+
+    def WriteHeader (self, fp):
+        """ Write the lines before the sequence """
         #Track name
         fp.write ("SA_Track," + self.name + '\n')
         # Plyaer data
-        fp.write ( self.player.String() + '\n')
+        if self.player is not None:
+            fp.write ( self.player.String() + '\n')
         # sensor dictionary
         fp.write ("SA_SensorDict," + dict_string(self.sensor_dict)  + '\n')
-        # Calibration Data
-        fp.write ("SA_Calibrate," + dict_string(self.calibrate)  + '\n')
+        # Calibration Data, not all tracks have it
+        if self.calibrate is not None:
+            fp.write ("SA_Calibrate," + dict_string(self.calibrate)  + '\n')
         # Time
         fp.write ("SA_Time," + str(self.start_time)  + '\n')
-        # Sequence
-        for ele in self.sequence:
-            s = ele.String()
-            if "SA_BNO_QEU" not in s:
-                fp.write ( s  + '\n' )
+
     def DataList (self, limb, qty):
         """ Generate a time series for the limb and quantity requested e.g.
         trk.DataList ("rightupperarm", "amgle_X" """
+        sensors = [sen for sen, name in self.sensor_dict.items() if name == limb]
         time = []
         y    = []
-        for ele in self.sequence:
-            if self.sensor_dict[ele.data["sensor"]] == limb:
-                if qty in ele.data:
-                    time.append (float(ele.time))
-                    y.append (float(ele.data[qty]))
-        return np.asarray(time), np.asarray(y)
+        for msg in self.store.columns.values():
+            if qty in msg.fields and msg.count > 0:
+                mask = np.isin (msg.Column("sensor"), sensors)
+                time.append (msg.Time()[mask])
+                y.append (msg.Column(qty)[mask].astype (np.float64))
+        if len(time) == 0:
+            return np.array([]), np.array([])
+        time = np.concatenate (time)
+        y    = np.concatenate (y)
+        order = np.argsort (time, kind="stable")
+        return time[order], y[order]
         
     def DeltaTimList (self, msg, sen_num):
         """ Route that generates two arrays of time(s) and delta time, that is 
         the time between message. The particular message and sensor for this list
-        are inputs - NOT TESTED"""
-        tim    = []
-        delta  = []
-        first = True
-        for ele in self.sequence:
-            if ele.name == msg and ele.data['sensor'] == sen_num:  
-
-                if (first):
-                    prev_time = ele.time
-                    first  = False
-                else:
-                    tim.append (ele.time)
-                    delta.append (1./(ele.time - prev_time))
-                    prev_time = ele.time
-                    
-        return tim, delta
+        are inputs """
+        if msg not in self.store.columns:
+            return np.array([]), np.array([])
+        cols = self.store.columns[msg]
+        tim  = cols.Time()[cols.Column("sensor") == sen_num]
+        return tim[1:], 1./np.diff (tim)
     
     def FindAnnotate (self, label):
         """ Under construction """
@@ -161,75 +151,46 @@ class Track ():
             if self.label == label:
                 return (self)
 
+    def Poses (self, times=None, body=None):
+        """ Joint positions over the whole track using the batched FK engine.
+        By default there is a frame for every SA_EUL_ANG sample in time order,
+        each frame using the latest angle of every limb. Returns the frame
+        times, the joint names and an (N, joints, 3) array of positions """
+        if body is None:
+            body = self.player.body
+        if self.calibrate:
+            body.UpdateCalibrate (self.calibrate)
+        if times is None:
+            _, times = ts.SortTimes (self.store.columns["SA_EUL_ANG"].Time())
+        skeleton = km.Skeleton (body)
+        pos = skeleton.Pose (km.TrackAngles (self, times), len(times))
+        return (times, skeleton.names, pos)
+
     def PosData (self, limb):
-        self.player.body.UpdateCalibrate (self.calibrate)
-        tim, x, y, z= [], [], [], [] 
-
-        for ele in self.sequence:
-            updates = {}
-            updates = pl.UpdateLimbPos ( [ele], updates, self.sensor_dict)
-            self.player.body.Update (updates)
-            if limb in updates:  
-                pos_dict = self.player.body.OutputPos()
-                pos = pos_dict[limb]
-                x.append (pos[0])
-                y.append (pos[1])
-                z.append (pos[2])
-                tim.append (ele.time)
-        #    print (ele.time)
-        return (tim, x, y, z)
+        """ Position of the end of limb at each sample from the sensor on it,
+        returned as arrays of time, x, y and z in time order """
+        sensors = [sen for sen, name in self.sensor_dict.items() if name == limb]
+        cols    = self.store.columns["SA_EUL_ANG"]
+        _, times = ts.SortTimes (cols.Time()[np.isin (cols.Column ("sensor"), sensors)])
+        times, names, pos = self.Poses (times)
+        if limb not in names:
+            return (times, np.array([]), np.array([]), np.array([]))
+        j = names.index (limb)
+        return (times, pos[:,j,0], pos[:,j,1], pos[:,j,2])
         
     def TrackDetails (self):
         """ return an array of data describing the track """
-        begin = self.sequence[0].time
-        end   = self.sequence[-1].time
+        times = self.store.Times()
+        begin = times[0]
+        end   = times[-1]
         diff = end - begin
         return (np.array ([begin, end, diff]))
        
 def ReadTrackList ( fp ):
     """ Function to read a list of tracks from a file. Why is this not a class?
-    did not want to have a class simply being a list of Tracks """
-    tracklist = [] 
-    new_track = None
-    for line in fp:
-        # -1 used to eliminate the \n character
-        # split string into elements, striping out \n and leading and trailing 
-        # white spaces
-        items =  [x.strip() for x in line[:-1].split(',')]
-        
-        if items[0] == "SA_Track":
-            if new_track:               # Save previous track
-                new_track.SetTimeLen()
-                tracklist.append (new_track)
-            new_track = Track (items[1])
-        elif (items[0] == "SA_Player"):
-            new_track.player = pl.Player (items[1], items[2], float(items[3]))
-        elif (items[0] == "SA_Calibrate"):
-            cal = {}
-            for i in range (1, len(items), 2):
-                xyz = items[i+1][1:-1].split()
-                cal[items[i]] = np.array ([float(xyz[0]), float(xyz[1]), float(xyz[2])])
-            new_track.calibrate = cal
-        elif (items[0] == "SA_SensorDict"):
-            for i in range (1,len(items), 2) :
-                new_track.sensor_dict[int(items[i])] = items[i+1]
-        elif (items[0] == "SA_Time"):         # Not sure this is used
-            pass
-        elif (items[0] == "SA_Annotate"):
-            labels = Annotate()
-            labels.ReadAnnotate ( items, 1)
-            
-        else:
-            new_ele = Element (None, None, None)
-            new_ele.Read (items)
-            new_track.sequence.append (new_ele)
-                    
-    # Store away last track read
-    if (new_track):
-        new_track.SetTimeLen()
-        tracklist.append (new_track)
-        
-    return (tracklist)
+    did not want to have a class simply being a list of Tracks. The parsing is
+    done in bulk by TrackText """
+    return (tt.ReadTracks (fp))
 
 class Annotate():
     """ Simple class to give a name to an activity, for example bowling. An activity
@@ -278,6 +239,13 @@ class RecPlay ():
         self.delta          = 0.0
         self.state          = PlayState.STOP
         self.state_change   = False # Set true when state changes - this is how we communicate to top level
+        self.memory_budget  = ti.DEFAULT_BUDGET  # Bytes of loaded tracks kept from a text track file
+        self.pose_interval  = pc.DEFAULT_INTERVAL # Seconds between pose cache keyframes, None for no cache
+        self.pose_cache     = None
+        self.record_folder  = None  # Folder to record tracks to, None to record in memory
+        self.record_format  = tb.EXTENSION   # tb.EXTENSION or ".sat"
+        self.recorder       = None
+        self.clock          = time.perf_counter  # Playback clock, the scheduler's Time in the GUI
         
     def SetState (self, state):
         """ If the new state is different than current state, update and set
@@ -318,81 +286,150 @@ class RecPlay ():
         """ Go back to the beginning"""
         self.cur_time   = 0.0   # How far into a track is the playback (in seconds)
         self.cur_pos    = 0     # How far in track_list is the playback (integer)
-        self.start_play_time = time.time()
+        self.start_play_time = self.clock()
         self.start_track_time = self.cur_track.sequence[0].time  # Not needed now as track should start at zero
         
 
     def Record (self, elements):
+        """ Add elements, a list of Elements or a TrackStore block of samples,
+        to the track being recorded """
+        if self.recorder:
+            self.recorder.Write (elements)
+            return
+        if isinstance (elements, ts.TrackStore):
+            self.cur_track.store.ExtendStore (elements)
+            return
         for item in elements:
             self.cur_track.sequence.append (item)
             
+    def RecordTail (self, depth):
+        """ The last depth elements recorded, when recording to disk only these
+        are held in memory """
+        if self.recorder:
+            return (self.recorder.Tail (depth))
+        return ([self.cur_track.sequence[i] for i in range (max (len(self.cur_track.sequence) - depth, 0), len(self.cur_track.sequence))])
+            
     def InitialiseRecord (self) :
-        """ Give the track a name and start data time"""
+        """ Give the track a name and start data time. With a record_folder
+        the track is written to a file there as it is recorded """
         self.cur_track = Track( "Track_" + str(self.track_name_num))
         self.track_name_num += 1
         self.cur_track.start_time = dt.datetime.now()
+        if self.record_folder:
+            os.makedirs (self.record_folder, exist_ok=True)
+            filename = self.cur_track.name + self.cur_track.start_time.strftime ("_%Y%m%d_%H%M%S") + self.record_format
+            self.recorder = tr.TrackRecorder (self.cur_track, os.path.join (self.record_folder, filename))
         
     def EndRecord (self) :
         """ Work out length of track in seconds, and ensure that time is set 
-        relative to first element on the list"""
+        relative to first element on the list. A track recorded to disk is
+        replaced by the one read back from its file """
+        if self.recorder:
+            recorded = self.recorder.Close()
+            self.recorder = None
+            if recorded is None:
+                return
+            recorded.name = self.cur_track.name
+            self.cur_track = recorded
         self.cur_track.SetTimeLen()
         self.track_list.append (self.cur_track)
         
     def Play (self):
         """ Returns data from the position it was last called up to the current
         elapsed time. Can handles pauses and the effect of a slider (which is just
-        treated as a pause) 
+        treated as a pause). cur_pos is the next sample to deliver in time order,
+        the samples up to the current time are found with a binary search on the
+        sorted track times
         """
-        ret_data = []
         if self.state == PlayState.PAUSE:
-            self.start_play_time = time.time() - self.delta
+            self.start_play_time = self.clock() - self.delta
             ret_data = self.GetLastElemData (10)
             return (ret_data)
        
-        self.cur_time = time.time() - self.start_play_time
+        self.cur_time = self.clock() - self.start_play_time
         start_pos = self.cur_pos
+        times     = self.cur_track.store.Times()
         
-        #Check if already at end
+        #Check if already at end, in which case deliver whatever is left
         if self.cur_time > self.cur_track.t_len:
             self.cur_time = self.cur_track.t_len
             self.SetState (PlayState.PAUSE)
+            end_pos = len(times)
+        else:
+            end_pos = self.TimeIndex (self.cur_time, "left")
             
-        # Not at end so handle play
-        for i in range (start_pos, len(self.cur_track.sequence)):
-            self.delta = self.cur_track.sequence[i].time - self.cur_track.sequence[0].time
-            if self.delta < self.cur_time:
-                ret_data.append (self.cur_track.sequence[i])
-                self.cur_pos = i
-            else:
-                return (ret_data)
-                
-        return (ret_data)
+        self.delta   = self.cur_time
+        self.cur_pos = max (start_pos, end_pos)
+        return (self.cur_track.store.TimeElements (start_pos, self.cur_pos))
             
     def GetLastElemData (self, depth):
         """ This is a bit of a kludge, delivers a set of elements before time point self.cur_time.
         does check if the depth is too long"""
-        ret_data = []
-        for i in range (0,len(self.cur_track.sequence)):
-            self.delta = self.cur_track.sequence[i].time - self.cur_track.sequence[0].time
-            if self.delta > self.cur_time:
-                break                
-        end = i
-        if end < depth:
-            start = 0
-        else:
-            start = end - depth
-        for i in range (start, end):
-            ret_data.append (self.cur_track.sequence[i])
+        end   = self.TimeIndex (self.cur_time, "right")
+        start = max (0, end - depth)
+        self.delta = self.cur_time
         
         # Needed to work with slider
-        self.cur_pos = end-1
+        self.cur_pos = end
 
-        return (ret_data)
+        return (self.cur_track.store.TimeElements (start, end))
  
+    def GetPoseState (self, sensor_dict):
+        """ Latest angles of every limb at cur_time, from the pose cache of the
+        current track. None if the cache is turned off or there is no track """
+        cache = self.PoseCache()
+        if cache is None:
+            return (None)
+        return (cache.LimbState (self.cur_time, sensor_dict))
+
+    def GetPosePositions (self, body):
+        """ Joint names and (joints,3) positions of body at cur_time, from the
+        keyframe positions of the pose cache. None if the cache is turned off
+        or there is no track """
+        cache = self.PoseCache (body)
+        if cache is None:
+            return (None)
+        return (cache.skeleton.names, cache.Positions (self.cur_time))
+
+    def PoseCache (self, body=None):
+        """ The pose cache of the current track, built again when the track,
+        its samples or the interval change or positions are wanted for
+        another body """
+        if self.pose_interval is None or self.cur_track is None or len(self.cur_track.sequence) == 0:
+            return (None)
+        cache = self.pose_cache
+        if (cache is None or cache.track is not self.cur_track or cache.count != self.cur_track.store.count
+                or cache.interval != self.pose_interval or (body is not None and cache.body is not body)):
+            cache = self.pose_cache = pc.PoseCache (self.cur_track, self.pose_interval, body)
+        return (cache)
+
+    def TimeIndex (self, cur_time, side):
+        """ Position in time order of the first sample of the current track
+        later than cur_time (side "right"), or at or after it (side "left").
+        Times are relative to the first sample recorded """
+        store    = self.cur_track.store
+        _, times = store.TimeOrder()
+        if len(times) == 0:
+            return (0)
+        return (int (np.searchsorted (times, store.Times()[0] + cur_time, side=side)))
+        
     def LoadTracklist (self, fp):
         """ Reads in track from file pointer fp. 
-        Used to be a bigger method but replace with function  call"""
-        self.track_list = ReadTrackList (fp)
+        Used to be a bigger method but replace with function  call. fp can also
+        be a file name, binary track files (.sab) are memory mapped and the
+        tracks in text files are read as they are selected"""
+        # The file of a lazily loaded list is let go, its parsed tracks stay valid
+        if isinstance (self.track_list, ti.LazyTrackList):
+            self.track_list.Close()
+        if tb.IsBinary (fp):
+            self.track_list = tb.ReadTracks (fp)
+            return
+        # Text files on disk are indexed and each track parsed when it is used
+        filename = fp if isinstance (fp, str) else getattr (fp, "name", None)
+        if isinstance (filename, str) and os.path.isfile (filename):
+            self.track_list = ti.LazyTrackList (filename, self.memory_budget)
+        else:
+            self.track_list = ReadTrackList (fp)
 # =============================================================================
 
 #         new_track = None
@@ -425,10 +462,19 @@ class RecPlay ():
 #             self.track_list.append (new_track)
 # =============================================================================
                     
+    def TrackNames (self):
+        """ Names of the tracks in track_list, without loading them """
+        if isinstance (self.track_list, ti.LazyTrackList):
+            return (self.track_list.Names())
+        return ([trk.name for trk in self.track_list])
+
     def WriteTracklist (self, fp):
-        """ fp is file pointer """
-        for trk in self.track_list:
-            trk.Write (fp)
+        """ fp is file pointer, a file opened in binary mode gets the binary
+        track format (.sab) """
+        if not isinstance (fp, io.TextIOBase):
+            tb.WriteTracks (self.track_list, fp)
+            return
+        tw.WriteTracks (self.track_list, fp)
     
 
             
@@ -439,8 +485,8 @@ class Sensors ():
     def __init__ (self):
         self.sensoritems = {}   # List of items sending data
     
-    def AddConTCP (self, label, tcp_ip, port, buffer_size ):
-        newcon = ApparelConnection (label, tcp_ip, port, buffer_size )
+    def AddConTCP (self, label, tcp_ip, port, buffer_size, protocol=wp.TEXT ):
+        newcon = ApparelConnection (label, tcp_ip, port, buffer_size, protocol=protocol )
         self.sensoritems[label] = newcon
  
     # At the moment this trys to connect everything
@@ -460,9 +506,27 @@ class Sensors ():
                     buff.append(elem)
         return (buff)
     
+    def ReadColumns (self):
+        """ TrackStore of the samples from all the connected devices since the
+        last call """
+        block = ts.TrackStore()
+        for key, item in self.sensoritems.items():
+            new_block = item.GetColumns ()
+            if new_block is not None:
+                block.ExtendStore (new_block)
+        return (block)
+    
     def CloseDataCon (self):
         for key, item in self.sensoritems.items():
             item.CloseConnect()
+
+    def QueueStats (self):
+        """ Receive queue metrics for each connection, keyed by label """
+        return ({key:item.QueueStats() for key, item in self.sensoritems.items()})
+
+    def LinkStats (self):
+        """ LinkStats for each connection, keyed by label """
+        return ({key:item.LinkStats() for key, item in self.sensoritems.items()})
         
 
 class ConStatus (Enum):
@@ -474,13 +538,20 @@ class ConStatus (Enum):
 #
 #    
 class ApparelConnection ():
-    def __init__ (self, label, tcp_ip, port, buffer_size ):
+    """ UDP connection to a garment. Once connected a Receiver thread keeps the
+    socket drained into a PacketQueue, so nothing backs up in the socket
+    buffer between GUI ticks, and GetData hands back everything received """
+    def __init__ (self, label, tcp_ip, port, buffer_size, queue_depth=pq.DEFAULT_DEPTH, protocol=wp.TEXT ):
         self.label  = label  # Name for connection e.g. jacket
         self.tcp_ip = tcp_ip
         self.port   = port
         self.buffer_size = buffer_size
         self.status      = ConStatus.DISCONNECTED
-        self.socket      = None
+        self.sock        = None
+        self.queue       = pq.PacketQueue (queue_depth)  # (receive time, datagram)
+        self.receiver    = None
+        self.protocol    = protocol     # wp.TEXT or wp.BINARY, binary falls back to text
+        self.stats       = ls.LinkStats ()
   #      self.buf         = []
 
     def Connect (self):
@@ -489,11 +560,13 @@ class ApparelConnection ():
 #            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)   # TCP 
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)   # UDP
             self.sock.connect((self.tcp_ip, self.port))
-            self.sock.setblocking (0)                                    # Non blocking
             self.sock.sendto(bytes("Start", "utf-8"), (self.tcp_ip, self.port))
             self.status = ConStatus.CONNECTED
         except:
             self.status = ConStatus.ERROR_CONNECTING
+            return
+        self.receiver = pq.Receiver (self.sock, self.queue, self.buffer_size, "Receive " + self.label)
+        self.receiver.start()
             
     def SendMSG (self, msg):
         if self.status in  [ConStatus.CONNECTED, ConStatus.STREAMING]:
@@ -504,15 +577,43 @@ class ApparelConnection ():
         self.SendMSG (string)
         self.status = ConStatus.STREAMING
         
+    def GetPackets (self):
+        """ All the datagrams received since the last call, as a list of
+        (receive time, bytes) with time from time.perf_counter """
+        return (self.queue.GetAll())
+        
+    def GetColumns (self):
+        """ TrackStore of the samples in all the datagrams received since the
+        last call, in the order they came, None if there were none. Binary
+        datagrams go in as columns without an Element per sample """
+        block = ts.TrackStore()
+        for stamp, data in self.queue.GetAll():
+            start = block.count
+            with pf.Stage ("translate_elem"):
+                wp.DecodeInto (block, data, self.protocol, self.stats.errors)
+            pf.Count ("translate_elem", block.count - start)
+            self.stats.Packet (stamp, len(data))
+            self.stats.Block (stamp, block, start)
+        if block.count == 0:
+            return (None)
+        return (block)
+
     def GetData (self):
-        try:
-            data, addr = self.sock.recvfrom(self.buffer_size)
-            buff = data.decode('utf-8')
-#            print (buff)
-        except:
- #           print ("Error reading socket data")
+        """ Elements from all the datagrams received since the last call, None
+        if there were none """
+        block = self.GetColumns()
+        if block is None:
             return (None)
-        return (translate_elem (buff))
+        return (block.Elements (0, block.count))
+
+    def QueueStats (self):
+        """ Depth of the receive queue and packets received and dropped """
+        return (self.queue.Stats())
+
+    def LinkStats (self):
+        """ Arrival rate, jitter, loss, reorder, duplicate and decode error
+        counts for the connection and each of its sensors """
+        return (self.stats.Stats())
 
     def StreamClose (self):
         string = 'SA_STP_DAT'       
@@ -520,13 +621,21 @@ class ApparelConnection ():
         self.status = ConStatus.CONNECTED
         
     def CloseConnect (self):
-        self.socket.close()
+        if self.receiver:
+            self.receiver.Stop()
+            self.receiver = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
         self.status = ConStatus.DISCONNECTED
 
         
 class PlotView ():
     """ Class to filter data from input and mantain a list of items
     that will be identified and returned. Used for plotting RT data.
+    The selected plots are compiled by UpdatePlotList into routes, a dict
+    keyed by (message name, sensor) of the (field, PlotData) pairs each
+    element feeds, so an element is dispatched with one lookup.
     """
     def __init__ (self, index):
         self.optionslist  = []  # Items selected to be selected from
@@ -534,15 +643,23 @@ class PlotView ():
         self.index = index      # Dict for converting sensor number to a name
         self.buffersize = 5.0   # Size in seconds of time 
         self.datanames = ["SA_EUL_ANG", "SA_ACC_LIN"]
+        self.kinds  = {"angle":"SA_EUL_ANG", "acc":"SA_ACC_LIN"}  # Message for each kind of plot
+        self.routes = {}        # (msg name, sensor) : [(field, PlotData)]
+        self.known  = set()     # (msg name, sensor) already in optionslist
         
     def ClearList (self):
         """ Empty optionlist and filterlist """
         self.optionslist = []  # List of items to select from
         self.plotlist    = []  # Items selected to be returned
+        self.routes = {}
+        self.known  = set()
 
     def RefreshList (self, item ):
         """ Element check to see if item is already on the list of options
         """
+        key = (item.name, item.data.get ("sensor"))
+        if key in self.known:
+            return (False)
         #convert name
         if item.name == "SA_EUL_ANG":
             limb = self.index[item.data["sensor"]]
@@ -566,6 +683,7 @@ class PlotView ():
                 self.optionslist.append (limb_y)
                 self.optionslist.append (limb_z)
                 return (True)
+        self.known.add (key)
         return(False)
             
     def UpdatePlotList (self, selecteditems):
@@ -582,69 +700,185 @@ class PlotView ():
             if item not in selecteditems:
                 self.plotlist = [x for x in self.plotlist if x.name != item]
         print ([x.name for x in self.plotlist])       
+        self.Route ()
+
+    def Route (self):
+        """ Compile plotlist into routes. A plot name is limb_kind_axis, such
+        as Spine_angle_X, the field of the element being kind_axis """
+        sensors = {}
+        for sensor, limb in self.index.items():
+            sensors.setdefault (limb, []).append (sensor)
+        self.routes = {}
+        for plot in self.plotlist:
+            ind   = plot.name.find ('_')
+            field = plot.name[ind+1:]
+            msg   = self.kinds.get (field[:-2])
+            if msg is None:
+                continue
+            for sensor in sensors.get (plot.name[0:ind], []):
+                self.routes.setdefault ((msg, sensor), []).append ((field, plot))
                 
-    def UpdatePlot (self, ele, selecteditems):
-        """ update plot with data contained in ele if it is relevant 
-        First check that the ele is piece of data we are interested in 
-        plotting"""
+    def UpdatePlot (self, ele):
+        """ update plot with data contained in ele if it is relevant """
+        route = self.routes.get ((ele.name, ele.data.get ("sensor")))
+        if route:
+            for field, plot in route:
+                plot.Append (ele.time, ele.data[field])
 
-        if ele.name not in self.datanames:
-            return
-        
-        for item in selecteditems:     
-            # Find if limbs match
-            ind = item.find('_')
-            if item[0:ind] ==  self.index[ele.data["sensor"]]:  # Check name like spine
-                if (item[ind+1:-2] == 'angle' and ele.name == 'SA_EUL_ANG') or (item[ind+1:-2] == 'acc'and ele.name == 'SA_ACC_LIN'): # This is messy
-                    for plot in self.plotlist:
-                        if plot.name == item:
-                            plot.x = np.append (plot.x, ele.time)
-                            plot.y = np.append (plot.y, ele.data[item[ind+1:]])
-                          
-                            diff = plot.x[-1] - plot.x[0]
-                            if (diff > self.buffersize):
-                                for i in range (0, len(plot.x)):
-                                    if (plot.x[-1] - plot.x[i]) < self.buffersize:
-                                        break
-                                plot.x = plot.x[i:]
-                                plot.y = plot.y[i:]
+    def UpdatePlots (self, ele_list):
+        """ UpdatePlot for a batch of elements, those for each route are
+        gathered and added to the plots as arrays """
+        routes = self.routes
+        batch  = {}
+        for ele in ele_list:
+            key = (ele.name, ele.data.get ("sensor"))
+            if key in routes:
+                batch.setdefault (key, []).append (ele)
+        for key, elements in batch.items():
+            if len(elements) < PLOT_BATCH:
+                for ele in elements:
+                    for field, plot in routes[key]:
+                        plot.Append (ele.time, ele.data[field])
+                continue
+            times = np.fromiter ((ele.time for ele in elements), dtype=np.float64, count=len(elements))
+            for field, plot in routes[key]:
+                plot.Extend (times, np.fromiter ((ele.data[field] for ele in elements),
+                                                 dtype=np.float64, count=len(elements)))
+                        
+
+    def UpdatePlotColumns (self, store):
+        """ UpdatePlots for a TrackStore block of samples, those for each
+        route are picked out of the columns with a mask on the sensor """
+        for (name, sensor), route in self.routes.items():
+            msg = store.columns.get (name)
+            if msg is None or msg.count == 0:
+                continue
+            pick = msg.Column ("sensor") == sensor
+            if not pick.any():
+                continue
+            order, times = ts.SortTimes (msg.Time()[pick])
+            for field, plot in route:
+                values = msg.Column (field)[pick]
+                plot.Extend (times, values if order is None else values[order])
                         
 
 class PlotData ():
-    """ Data to be plotted"""
-    def __init__ (self, name, xwin):
+    """ Data to be plotted, the last xwin seconds of one channel. Samples are
+    kept in a ring buffer that is written twice, at i and i + capacity, so the
+    newest samples are always one contiguous slice and can be handed out as
+    views. The buffer doubles when the window holds more than it has room for.
+    Times are expected to arrive in order """
+    def __init__ (self, name, xwin, capacity=PLOT_CAPACITY):
         self.name = name
-        self.x   = np.array ([])
-        self.y   = np.array ([])
         self.timewin = xwin
-        
-    def GetPlotData (self):
-        if len (self.x) > 0:
-            x = self.x - self.x[-1]
-            rx = x[(x > -5.0)]
-            ry = self.y[(x > -5.0)]
+        self.Clear (capacity)
+
+    def Clear (self, capacity=None):
+        """ Empty the buffer, keeping its size unless capacity is given """
+        if capacity is not None:
+            self.capacity = capacity
+            self.buf_x = np.zeros (2 * capacity)
+            self.buf_y = np.zeros (2 * capacity)
+            self.rel_x = np.zeros (capacity)    # Times relative to the newest, for GetPlotData
+        self.head  = 0      # Where the next sample goes, 0 to capacity-1
+        self.count = 0
+
+    def Append (self, x, y):
+        """ Add a sample, dropping the oldest if it is out of the window """
+        cap  = self.capacity
+        head = self.head
+        if self.count == cap:
+            if x - self.buf_x[head] < self.timewin:     # Oldest still wanted
+                self._Grow ()
+                cap  = self.capacity
+                head = self.head
         else:
-            x = np.array([0.])
-            rx = x
-            ry = x
+            self.count += 1
+        self.buf_x[head] = self.buf_x[head + cap] = x
+        self.buf_y[head] = self.buf_y[head + cap] = y
+        self.head = head + 1 if head + 1 < cap else 0
+
+    def Extend (self, x, y):
+        """ Add arrays of samples, as Append for each in turn """
+        n = len(x)
+        if n == 0:
+            return
+        # Room for every sample that will still be in the window
+        old_x, _ = self.Window ()
+        limit  = x[-1] - self.timewin
+        wanted = (len(old_x) - np.searchsorted (old_x, limit, side='right') +
+                  n - np.searchsorted (x, limit, side='right'))
+        while self.capacity < wanted:
+            self._Grow ()
+        cap = self.capacity
+        if n > cap:
+            x, y, n = x[-cap:], y[-cap:], cap
+        at = self.head + np.arange (n)
+        at[at >= cap] -= cap
+        for buf, val in ((self.buf_x, x), (self.buf_y, y)):
+            buf[at] = val
+            buf[at + cap] = val
+        self.head  = (self.head + n) % cap
+        self.count = min (self.count + n, cap)
+
+    def _Grow (self):
+        old_x, old_y = self.Window ()      # Views of the old buffers, which Clear replaces
+        n = len(old_x)
+        self.Clear (2 * self.capacity)
+        for buf, old in ((self.buf_x, old_x), (self.buf_y, old_y)):
+            buf[:n] = old
+            buf[self.capacity:self.capacity + n] = old
+        self.head  = n
+        self.count = n
 
-        return (rx, ry)
+    def Window (self):
+        """ Views of the times and values held, oldest first """
+        end = self.head + self.capacity
+        return (self.buf_x[end - self.count:end], self.buf_y[end - self.count:end])
+
+    def GetPlotData (self):
+        """ Times (relative to the newest) and values of the last timewin
+        seconds. Both are views into buffers kept by the PlotData, good
+        until the next call """
+        if self.count == 0:
+            x = np.array([0.])
+            return (x, x)
+        x, y = self.Window ()
+        last  = x[-1]
+        start = np.searchsorted (x, last - self.timewin, side='right')
+        rx = np.subtract (x[start:], last, out=self.rel_x[:len(x) - start])
+        return (rx, y[start:])
 
 class DataView ():
     """ Class to fitler data from input and mantain a list of items
-    that will be identified and returned. Used for dataview
+    that will be identified and returned. Used for dataview.
+    Each (message name, sensor) is checked against the filter once, the
+    table row it goes in (or None) being kept in routes
     """
     def __init__ (self):
         self.optionslist = []  # List of items to select from
         self.filterlist  = []  # Items selected to be returned
         self.max_datapoints = 400 
+        self.routes = {}       # (msg name, sensor) : table row or None
+        self.rowkeys = []      # (msg name, sensor) in each table row
+        self.known  = set()    # (msg name, sensor) already in optionslist
         
     def ClearList (self):
         """ Empty optionlist and filterlist """
         self.optionslist = []  # List of items to select from
         self.filterlist  = []  # Items selected to be returned
+        self.ClearRows ()
+        self.known  = set()
+
+    def ClearRows (self):
+        """ Forget the table rows, they are given out again as elements arrive """
+        self.routes  = {}
+        self.rowkeys = []
         
     def RefreshList (self, item):
+        key = (item.name, item.data.get ("sensor"))
+        if key in self.known:
+            return (False)
         if item.name not in self.optionslist:
             self.optionslist.append (item.name)
             return (True)
@@ -653,97 +887,43 @@ class DataView ():
             if sen not in self.optionslist:
                 self.optionslist.append (sen)
                 return (True)
+        self.known.add (key)
         return (False)
                 
     def SetFilter (self, item):
         if item not in self.filterlist:
             self.filterlist = [item]  # Currently only allow one item for filtering
+            self.ClearRows ()
         else:
             print ("Warning, item already in DataView list")
             
     def CheckDataView (self, elem):
-        if elem:
-            name = elem.name
-            snum = "Sensor_" + str(elem.data["sensor"])
-            if name in self.filterlist:
-                return (elem)
-            elif snum in self.filterlist:
-                return (elem)
-        
+        if elem and self.Route (elem) is not None:
+            return (elem)
         return (None)
-            
-#
-# Reads data string from sensor and returns a list of elements for processing
-# NOT COMPLETE Still needs to be worked on
-def translate_elem ( item ):
-    lines = item.split (';')
-    ele_list = []
-    for line in lines[:-1]:   # Don't include blank item
-        li = line.split (',')
-        if li[0] == 'SQ':
-            if len (li) == 7:
-                name = "SA_BNO_QUA"
-                sensor = int (li[1])
-                time   = float(li[2])/1000.
-                data   = {"sensor":sensor, "qw":float(li[3]), "qx":float(li[4]), "qy":float(li[5]), "qz":float(li[6])}
-                new_elem = Element (name, time, data)
-                ele_list.append (new_elem)
-            else:
-                print ("Wrong number of parameters for SQ, expecting 7 got ", len(li))
-                print (li)
- 
-        elif li[0] == 'SE':
-            if len (li) == 6:
-                name = "SA_EUL_ANG"
-                sensor = int (li[1])
-                time   = float(li[2])/1000.
-                data   = {"sensor":sensor, "angle_X":float(li[3]), "angle_Y":float(li[4]), "angle_Z":float(li[5])}
-                new_elem = Element (name, time, data)
-                ele_list.append (new_elem)
-            else:
-                print ("Wrong number of parameters for SE, expecting 6 got ", len(li))
-                print (li)
-                
-        elif li[0] == 'SO':
-            if len (li) == 6:
-                name = "SA_BNO_EUL"
-                sensor = int (li[1])
-                time   = float(li[2])/1000.
-                data   = {"sensor":sensor, "angle_x":float(li[3]), "angle_y":float(li[4]), "angle_z":float(li[5])}
-                new_elem = Element (name, time, data)
-                ele_list.append (new_elem)
-            else:
-                print ("Wrong number of parameters for SE, expecting 6 got ", len(li))
-                print (li)
-                
-        elif li[0] == 'CL':
-            if len(li) == 4:
-                name = "SA_BNO_CAL"
-                sensor = int (li[1])
-                time   = float(li[2])/1000.
-                data   = {"sensor":sensor, "cal":int(li[3])}
-                new_elem = Element (name, time, data)
-                ele_list.append (new_elem)
-            else:
-                print ("Wrong number of parameters for CL, expecting 2 got ", len(li))
-                print (li)
-                
-        elif li[0] == 'AC':
-            if len(li) == 6:
-                name = "SA_ACC_LIN"
-                sensor = int (li[1])
-                time   = float(li[2])/1000.
-                data   = {"sensor":sensor, "acc_X":float(li[3]), "acc_Y":float(li[4]), "acc_Z":float(li[5])}
-                new_elem = Element (name, time, data)
-                ele_list.append (new_elem)
-            else:
-                print ("Wrong number of parameters for CL, expecting 2 got ", len(li))
-                print (li)
-        else:
-            print ("Unknown item: ", item )
-        
-    return (ele_list)
 
+    def Route (self, elem):
+        """ Table row for elem, None if it is not selected by the filter """
+        key = (elem.name, elem.data.get ("sensor"))
+        if key in self.routes:
+            return (self.routes[key])
+        row = None
+        if elem.name in self.filterlist or "Sensor_" + str(key[1]) in self.filterlist:
+            row = len(self.rowkeys)
+            self.rowkeys.append (key)
+        self.routes[key] = row
+        return (row)
+
+    def Rows (self, ele_list):
+        """ The newest element for each table row in ele_list, as a dict
+        keyed by row """
+        rows = {}
+        for ele in ele_list:
+            row = self.Route (ele)
+            if row is not None:
+                rows[row] = ele
+        return (rows)
+            
 def TrackListDetails (tracklist):
     print ("Hello")
     """ Go through tracklist and extract basic information 
@@ -764,16 +944,14 @@ def ConvertToEarthCoord (sx, sy, sz, ang_x, ang_y, ang_z):
         print ("Warning dimensions of arrays different")
         return (new_sx, new_sy, new_sz)
     
-    for i in range (0, len(sx)):
-        vec = np.array([sx[i], sy[i], sz[i]]).reshape((3,1))
-        ang = np.array ([ang_x[i], ang_y[i], ang_z[i]])
-        rot = pl.RotationMat (ang)
-        new_vec = rot.T * vec
-        new_sx = np.append (new_sx, new_vec[0])
-        new_sy = np.append (new_sy, new_vec[1])
-        new_sz = np.append (new_sz, new_vec[2])
-        
-    return (new_sx, new_sy, new_sz)
+    if len(sx) == 0:
+        return (new_sx, new_sy, new_sz)
+    
+    # Rotate every vector by the transpose of its rotation matrix in one go
+    vec = np.stack ([sx, sy, sz], axis=1).astype (np.float64)
+    rot = rt.EulerMatrices (np.stack ([ang_x, ang_y, ang_z], axis=1))
+    new_vec = np.einsum ('nji,nj->ni', rot, vec)
+    return (new_vec[:,0], new_vec[:,1], new_vec[:,2])
 
 def CumulativeIntegration (x, t):
     """ Cumulative Sum integrating the variable x in time, using central trapizodal integration """
@@ -822,18 +1000,6 @@ def Velocity (x, y, z, t, conv):
     
     return (vx, vy, vz, sp)
         
-def dict_string ( dct ):
-    """ Convert dictionary to string
-    """
-    line = ""
-    for key, value in dct.items():
-        line += str(key) + "," + str(value) + ","
-        
-    if len(line) > 0:
-        return (line[0:-1])   # Don't include final commma
-    else:
-        return (line)
-        
 def TidyUpAngles ( angle_list ):
     """ Function that changing angles are continous without sudden changes of sign
     e.g. prevents 180 degree going to -180 degree """
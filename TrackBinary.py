@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Binary track container (.sab). Holds the same tracks as the text .sat format
+but keeps the TrackStore columns as raw arrays, so nothing is lost to
+formatting and opening a file is a matter of memory mapping it. Layout is:
+    prefix  - MAGIC, version, length of the header and offset of the data
+    header  - JSON: per track the name, player, sensor dict, calibration,
+              start time and where each array is, relative to the data offset
+    data    - the arrays of every track, little endian, each starting on an
+              ALIGN byte boundary
+On loading the whole file is mapped copy on write and the columns are views
+onto it, so only pages that are used are read from disk.
+
+Also converts between the two formats without loss, e.g.
+    python TrackBinary.py Examples/testset.sat testset.sab
+"""
+
+import io
+import json
+import struct
+import sys
+import numpy as np
+import StreamData as sd
+import Messages as ms
+import Player as pl
+
+MAGIC     = b"SA_BIN\r\n"
+VERSION   = 1
+PREFIX    = struct.Struct ("<8sIIQ")     # magic, version, header length, data offset
+ALIGN     = 64
+EXTENSION = ".sab"
+
+
+def IsBinary (fp):
+    """ True if fp, a file name or file pointer, holds a binary track file. File
+    pointers have to be opened in binary mode to be binary track files """
+    if isinstance (fp, str):
+        if fp.lower().endswith (EXTENSION):
+            return (True)
+        with open (fp, "rb") as f:
+            return (f.read (len(MAGIC)) == MAGIC)
+    if isinstance (fp, io.TextIOBase):
+        return (False)
+    pos   = fp.tell()
+    magic = fp.read (len(MAGIC))
+    fp.seek (pos)
+    return (magic == MAGIC)
+
+def _Align (offset):
+    return ((offset + ALIGN - 1) // ALIGN * ALIGN)
+
+def _Number (val):
+    """ JSON default for numpy scalars in Element data """
+    if isinstance (val, np.integer):
+        return (int(val))
+    return (float(val))
+
+
+class _Layout ():
+    """ Collects the arrays to be written and where each one goes """
+    def __init__ (self):
+        self.arrays = []
+        self.offset = 0
+
+    def Add (self, arr):
+        arr = np.ascontiguousarray (arr, dtype=np.asarray(arr).dtype.newbyteorder ("<"))
+        entry = {"offset":self.offset, "dtype":arr.dtype.str, "count":len(arr)}
+        self.arrays.append ((self.offset, arr))
+        self.offset = _Align (self.offset + arr.nbytes)
+        return (entry)
+
+
+def TrackHeader (trk, layout):
+    """ Header dict for track trk, its arrays are added to layout """
+    store = trk.store
+    head  = {"name":trk.name, "t_len":trk.t_len, "start_time":str(trk.start_time)}
+    head["player"] = None
+    if trk.player is not None:
+        head["player"] = [trk.player.name, trk.player.model, trk.player.height]
+    head["sensor_dict"] = {str(k):v for k, v in trk.sensor_dict.items()}
+    head["calibrate"] = None
+    if trk.calibrate is not None:
+        head["calibrate"] = {k:[float(x) for x in v] for k, v in trk.calibrate.items()}
+
+    n = store.count
+    head["order"] = {"time":layout.Add (store.time[:n]),
+                     "kind":layout.Add (store.kind[:n]),
+                     "row" :layout.Add (store.row[:n])}
+    head["columns"] = {}
+    for name, msg in store.columns.items():
+        if msg.count == 0:
+            continue
+        head["columns"][name] = {"time"  :layout.Add (msg.Time()),
+                                 "fields":{f:layout.Add (msg.Column (f)) for f in msg.fields}}
+    head["other"] = [[ele.name, ele.time, ele.data] for ele in store.other]
+    return (head)
+
+def WriteTracks (tracklist, fp, progress=None):
+    """ Write the list of tracks to fp, a file pointer opened in binary mode.
+    progress, if given, is called with the bytes of array data written and the
+    total after each array """
+    layout = _Layout()
+    header = {"version":VERSION, "tracks":[TrackHeader (trk, layout) for trk in tracklist]}
+    text   = json.dumps (header, default=_Number).encode ("utf-8")
+    data   = _Align (PREFIX.size + len(text))
+
+    fp.write (PREFIX.pack (MAGIC, VERSION, len(text), data))
+    fp.write (text)
+    pos = PREFIX.size + len(text)
+    total = layout.arrays[-1][0] + layout.arrays[-1][1].nbytes if layout.arrays else 0
+    for offset, arr in layout.arrays:
+        fp.write (b'\0' * (data + offset - pos))
+        fp.write (memoryview (arr).cast ("B"))
+        pos = data + offset + arr.nbytes
+        if progress:
+            progress (pos - data, total)
+
+def _MapFile (fp):
+    """ Whole file as a uint8 array, memory mapped where possible """
+    if isinstance (fp, str):
+        return (np.memmap (fp, dtype=np.uint8, mode='c'))
+    try:
+        fp.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fp.seek (0)
+        return (np.frombuffer (fp.read(), dtype=np.uint8))
+    return (np.memmap (fp, dtype=np.uint8, mode='c'))
+
+def _View (mem, data, entry):
+    """ Array described by header entry, as a view onto mem """
+    dtype = np.dtype (entry["dtype"])
+    start = data + entry["offset"]
+    return (mem[start:start + dtype.itemsize*entry["count"]].view (dtype))
+
+def ReadTracks (fp):
+    """ Read all the tracks from fp, a file name or a file pointer opened in
+    binary mode. Returns a list of Tracks whose data is memory mapped """
+    mem = _MapFile (fp)
+    if len(mem) < PREFIX.size:
+        print ("Error, binary track file too short")
+        return ([])
+    magic, version, length, data = PREFIX.unpack (mem[:PREFIX.size].tobytes())
+    if magic != MAGIC or version > VERSION:
+        print ("Error, not a binary track file or version not supported", version)
+        return ([])
+    header = json.loads (mem[PREFIX.size:PREFIX.size + length].tobytes().decode ("utf-8"))
+
+    tracklist = []
+    for head in header["tracks"]:
+        trk = sd.Track (head["name"])
+        trk.t_len      = head["t_len"]
+        trk.start_time = head["start_time"]
+        if head["player"] is not None:
+            trk.player = pl.Player (*head["player"])
+        trk.sensor_dict = {int(k):v for k, v in head["sensor_dict"].items()}
+        if head["calibrate"] is not None:
+            trk.calibrate = {k:np.array (v) for k, v in head["calibrate"].items()}
+
+        order   = head["order"]
+        columns = {}
+        for name, col in head["columns"].items():
+            columns[name] = (_View (mem, data, col["time"]),
+                             {f:_View (mem, data, e) for f, e in col["fields"].items()})
+        other = [ms.Element (name, tim, dat) for name, tim, dat in head["other"]]
+        trk.store.Attach (_View (mem, data, order["time"]), _View (mem, data, order["kind"]),
+                          _View (mem, data, order["row"]), columns, other)
+        tracklist.append (trk)
+    return (tracklist)
+
+def ReadTrackFile (filename):
+    """ Read the tracks in filename, either format """
+    if IsBinary (filename):
+        return (ReadTracks (filename))
+    with open (filename, "r") as fp:
+        return (sd.ReadTrackList (fp))
+
+def WriteTrackFile (tracklist, filename):
+    """ Write the tracks to filename, binary if it ends in EXTENSION """
+    if filename.lower().endswith (EXTENSION):
+        with open (filename, "wb") as fp:
+            WriteTracks (tracklist, fp)
+    else:
+        with open (filename, "w") as fp:
+            for trk in tracklist:
+                trk.Write (fp)
+
+def Convert (src, dst):
+    """ Convert track file src to dst, the format of each is given by its
+    extension. Times and values are carried over exactly """
+    tracklist = ReadTrackFile (src)
+    WriteTrackFile (tracklist, dst)
+    return (len(tracklist))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print ("Usage: python TrackBinary.py <in.sat|in.sab> <out.sat|out.sab>")
+    else:
+        print ("Converted", Convert (sys.argv[1], sys.argv[2]), "tracks")
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy loading of the tracks in a text track file (.sat). The file is scanned
+once for the SA_Track records, giving the byte offset, number of samples and
+duration of each track without parsing the samples. The index is cached in a
+sidecar file next to the track file (name.sat.idx) and reused while the track
+file is unchanged. A track is only parsed when it is asked for, and parsed
+tracks are dropped, least recently used first, when they take more memory than
+the budget allows. The list can be used from more than one thread, e.g. while
+SaveThread writes it out, and the file saved over with Replace.
+Classes are:
+    TrackEntry    - index entry for one track in the file
+    LazyTrackList - list of tracks that parses each track on demand
+"""
+
+import os
+import json
+import mmap
+import threading
+from collections import OrderedDict
+import TrackText as tt
+
+INDEX_EXTENSION = ".idx"
+INDEX_VERSION   = 1
+DEFAULT_BUDGET  = 256 * 1024 * 1024    # Bytes of parsed track data kept in memory
+
+
+class TrackEntry ():
+    """ Where a track is in the file and what it holds. count is the number of
+    data lines, which is the number of samples unless some are malformed """
+    def __init__ (self, name, offset, end, count, t_len):
+        self.name   = name
+        self.offset = offset    # Byte offset of the SA_Track line
+        self.end    = end       # Byte offset just past the track
+        self.count  = count
+        self.t_len  = t_len
+
+    def Dict (self):
+        return ({"name":self.name, "offset":self.offset, "end":self.end,
+                 "count":self.count, "t_len":self.t_len})
+
+
+def LineTime (line):
+    """ Time held in a data line, None if there is not one """
+    items = line.split (b',', 2)
+    try:
+        return (float (items[1]))
+    except (IndexError, ValueError):
+        return (None)
+
+def ScanTrack (data, start, end):
+    """ Build the TrackEntry for the track in data[start:end] without parsing
+    the samples, only the header and the first and last data lines are read """
+    lines = []      # First line after the headers, and so on
+    pos   = start
+    while pos < end:
+        nl = data.find (b'\n', pos, end)
+        nl = end if nl < 0 else nl
+        line = data[pos:nl]
+        if line.split (b',', 1)[0].strip().decode ('utf-8') not in tt.HEADER_NAMES:
+            lines.append (line)
+            break
+        if pos == start:
+            name = line.decode ('utf-8').split (',')[1].strip()
+        pos = nl + 1
+
+    # Every line left is a sample, bar any blank ones
+    block = data[pos:end]
+    count = block.count (b'\n') - block.count (b'\n\n') - block.count (b'\n\r\n')
+    if block and not block.endswith (b'\n'):
+        count += 1
+
+    # Duration from the times in the first and last lines
+    t_len = 0.0
+    if count > 0:
+        lines.append (block[-4096:].strip().split (b'\n')[-1])
+        times = [LineTime (ln) for ln in lines]
+        if None not in times:
+            t_len = times[-1] - times[0]
+    return (TrackEntry (name, start, end, max (count, 0), t_len))
+
+def BuildIndex (data):
+    """ List of TrackEntry for every track in the bytes like data """
+    entries = []
+    start = tt.FindTrack (data, 0)
+    while start >= 0:
+        end = tt.FindTrack (data, start + 1)
+        entries.append (ScanTrack (data, start, end if end >= 0 else len(data)))
+        start = end
+    return (entries)
+
+def ReadIndex (filename):
+    """ Entries from the sidecar index of filename, None if there is no index
+    or it is out of date """
+    try:
+        with open (filename + INDEX_EXTENSION, "r") as fp:
+            index = json.load (fp)
+    except (OSError, ValueError):
+        return (None)
+    stat = os.stat (filename)
+    if (index.get ("version") != INDEX_VERSION or index.get ("size") != stat.st_size
+            or index.get ("mtime") != stat.st_mtime):
+        return (None)
+    return ([TrackEntry (**ent) for ent in index["tracks"]])
+
+def WriteIndex (filename, entries):
+    """ Save the entries as the sidecar index of filename. Not being able to
+    write it (e.g. a read only directory) is not an error """
+    stat  = os.stat (filename)
+    index = {"version":INDEX_VERSION, "size":stat.st_size, "mtime":stat.st_mtime,
+             "tracks":[ent.Dict() for ent in entries]}
+    try:
+        with open (filename + INDEX_EXTENSION, "w") as fp:
+            json.dump (index, fp)
+    except OSError:
+        pass
+
+
+class LazyTrackList ():
+    """ Behaves like the list of Tracks that RecPlay.track_list holds, but the
+    tracks in the file are parsed when first used. Tracks appended (e.g. new
+    recordings) are held in memory for good """
+    def __init__ (self, filename, budget=DEFAULT_BUDGET):
+        self.filename = filename
+        self.budget   = budget
+        self.loaded   = OrderedDict()   # Index: Track, most recently used last
+        self.used     = 0               # Bytes held by the tracks in loaded
+        self.data     = None
+        self.entries  = []
+        self.extra    = []              # Tracks appended, not in the file
+        self.lock     = threading.RLock()
+        self.Open()
+
+    def __len__ (self):
+        return (len(self.entries) + len(self.extra))
+
+    def __getitem__ (self, index):
+        with self.lock:
+            if index < 0:
+                index += len(self)
+            if index < 0 or index >= len(self):
+                raise IndexError ("track index out of range")
+            if index >= len(self.entries):
+                return (self.extra[index - len(self.entries)])
+            if index in self.loaded:
+                self.loaded.move_to_end (index)
+                return (self.loaded[index])
+            track = self.Load (index)
+            self.loaded[index] = track
+            self.used += track.store.nbytes()
+            self.Evict()
+            return (track)
+
+    def __iter__ (self):
+        for i in range (0, len(self)):
+            yield self[i]
+
+    def append (self, track):
+        with self.lock:
+            self.extra.append (track)
+
+    def Open (self):
+        """ Map the file and read its index, building it if need be """
+        with open (self.filename, "rb") as fp:
+            if os.fstat (fp.fileno()).st_size > 0:
+                self.data = mmap.mmap (fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = []
+        if self.data is not None:
+            self.entries = ReadIndex (self.filename)
+            if self.entries is None:
+                self.entries = BuildIndex (self.data)
+                WriteIndex (self.filename, self.entries)
+
+    def Replace (self, src, saved):
+        """ Move the file src, holding the first saved tracks of the list, over
+        the file of the list. The file is unmapped while it is replaced, as
+        Windows will not replace a mapped file, then mapped and indexed again.
+        Tracks appended after the first saved are kept """
+        with self.lock:
+            self.Close()
+            try:
+                os.replace (src, self.filename)
+            except OSError:
+                self.Open()
+                raise
+            self.extra  = self.extra[max (saved - len(self.entries), 0):]
+            self.loaded = OrderedDict()
+            self.used   = 0
+            self.Open()
+
+    def Names (self):
+        """ Names of all the tracks, without loading any of them """
+        return ([ent.name for ent in self.entries] + [trk.name for trk in self.extra])
+
+    def Counts (self):
+        """ Number of samples in each track, without loading any of them """
+        with self.lock:
+            return ([ent.count for ent in self.entries] + [trk.store.count for trk in self.extra])
+
+    def Load (self, index):
+        """ Parse track index from the file """
+        ent   = self.entries[index]
+        block = self.data[ent.offset:ent.end]
+        if b'\r' in block:
+            block = block.replace (b'\r\n', b'\n').replace (b'\r', b'\n')
+        track = tt.ParseTrack (block, 0, len(block))
+        ent.count = len(track.sequence)
+        return (track)
+
+    def Evict (self):
+        """ Drop least recently used tracks until within budget, the track used
+        last is always kept """
+        while self.used > self.budget and len(self.loaded) > 1:
+            _, track = self.loaded.popitem (last=False)
+            self.used -= track.store.nbytes()
+
+    def Close (self):
+        with self.lock:
+            if self.data is not None:
+                self.data.close()
+                self.data = None
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Records a track straight to disk while it is being captured, so a long
+session does not grow in memory and a crash does not lose it. Elements, or
+TrackStore blocks of samples as they are received, are handed to a writer
+thread which writes them out in chunks, flushing every FLUSH_INTERVAL and
+syncing to disk every SYNC_INTERVAL seconds. Only about the last TAIL_LENGTH
+samples are kept in memory, for the live views.
+Two formats:
+    .sat - text lines appended to the file as Track.Write writes them,
+           the track is read back through TrackIndex.LazyTrackList
+    .sab - the TrackStore columns are appended as raw arrays to spool files,
+           one per array, in a folder next to the track. When recording ends
+           the spool files are memory mapped as the store of a Track and
+           written as a .sab file by TrackBinary, which is then memory mapped
+           for playback. Times are stored relative to the first element.
+A spool left behind by a crash can be turned into a .sab file with Recover.
+Classes are:
+    TrackRecorder - writer thread for one track
+"""
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+import numpy as np
+import StreamData as sd
+import Messages as ms
+import TrackStore as ts
+import TrackBinary as tb
+import TrackIndex as ti
+import TrackWriter as tw
+import Player as pl
+
+TEXT_EXTENSION = ".sat"
+SPOOL_EXTENSION = ".spool"
+CHUNK_ELEMENTS = 4096   # Elements written in one go
+FLUSH_INTERVAL = 0.5    # Seconds between flushes of the file buffers
+SYNC_INTERVAL  = 2.0    # Seconds between os.fsync
+TAIL_LENGTH    = 8192   # Samples kept in memory
+META_FILE      = "meta.json"
+OTHER_FILE     = "other.json"
+
+
+def _SpoolName (name, field=None):
+    """ File in the spool for an order array (name is time, kind or row) or
+    for a message column """
+    return (name + ".bin" if field is None else name + "." + field + ".bin")
+
+def _Meta (track, t0):
+    """ Track details kept in the spool """
+    meta = {"name":track.name, "start_time":str(track.start_time), "t0":t0,
+            "sensor_dict":{str(k):v for k, v in track.sensor_dict.items()}}
+    meta["player"] = None
+    if track.player is not None:
+        meta["player"] = [track.player.name, track.player.model, track.player.height]
+    meta["calibrate"] = None
+    if track.calibrate is not None:
+        meta["calibrate"] = {k:[float(x) for x in v] for k, v in track.calibrate.items()}
+    return (meta)
+
+
+class TrackRecorder (threading.Thread):
+    """ Records track to filename, the format being given by the extension.
+    The track details (player, sensor dict, calibration) are taken when the
+    first elements arrive """
+    def __init__ (self, track, filename):
+        super().__init__ (name="TrackRecorder", daemon=True)
+        self.track    = track
+        self.filename = filename
+        self.binary   = filename.lower().endswith (tb.EXTENSION)
+        self.spool    = filename + SPOOL_EXTENSION
+        self.pending  = queue.Queue()
+        self.tail     = deque()     # Lists of Elements and blocks written last
+        self.in_tail  = 0           # Samples in them
+        self.count    = 0       # Elements written
+        self.error    = None
+        self.files    = {}
+        self.t0       = None
+        self.rows     = {name:0 for name in ts.MSG_NAMES}
+        self.n_other  = 0       # Elements of unknown types written
+        self.last_flush = time.perf_counter()
+        self.last_sync  = self.last_flush
+        self.start()
+
+    def Write (self, elements):
+        """ Queue elements, a list of Elements or a TrackStore block, to be
+        written, called from the GUI thread. A block must not be changed after """
+        if len(elements):
+            if not isinstance (elements, ts.TrackStore):
+                elements = list (elements)
+            self.tail.append (elements)
+            self.in_tail += len(elements)
+            while self.in_tail - len(self.tail[0]) >= TAIL_LENGTH:
+                self.in_tail -= len(self.tail.popleft())
+            self.pending.put (elements)
+
+    def Tail (self, depth):
+        """ The last depth elements written, at most about TAIL_LENGTH """
+        out = []
+        for item in reversed (self.tail):
+            need = depth - len(out)
+            if need <= 0:
+                break
+            n = len(item)
+            part = item.Elements (max (n - need, 0), n) if isinstance (item, ts.TrackStore) else item[-need:]
+            out = part + out
+        return (out)
+
+    def Close (self):
+        """ Write everything queued, finish the file and return the recorded
+        Track, memory mapped from the file. None if nothing was recorded """
+        self.pending.put (None)
+        self.join()
+        if self.error is not None:
+            print ("Error recording track", self.filename, self.error)
+        if self.count == 0:
+            return (None)
+        if self.binary:
+            return (Recover (self.spool, self.filename))
+        tracklist = ti.LazyTrackList (self.filename)
+        return (tracklist[0] if len(tracklist) else None)
+
+    def run (self):
+        chunk = []      # Lists of Elements and blocks
+        size  = 0       # Samples in them
+        done  = False
+        while not done:
+            try:
+                item = self.pending.get (timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                item = []
+            if item is None:
+                done = True
+            elif len(item):
+                chunk.append (item)
+                size += len(item)
+            if chunk and (done or size >= CHUNK_ELEMENTS or
+                          time.perf_counter() - self.last_flush >= FLUSH_INTERVAL):
+                try:
+                    self._WriteChunk (chunk)
+                except OSError as err:
+                    self.error = err
+                chunk = []
+                size  = 0
+            self._Flush (done)
+        for fp in self.files.values():
+            fp.close()
+        self.files = {}
+
+    def _Open (self, name, mode="ab"):
+        if name not in self.files:
+            path = self.filename if not self.binary else os.path.join (self.spool, name)
+            self.files[name] = open (path, mode)
+        return (self.files[name])
+
+    def _Start (self, t0):
+        """ Begin the file when the first samples arrive, t0 the first time """
+        self.t0 = t0
+        if self.binary:
+            os.makedirs (self.spool, exist_ok=True)
+            with open (os.path.join (self.spool, META_FILE), "w") as fp:
+                json.dump (_Meta (self.track, self.t0), fp)
+        else:
+            fp = self._Open (TEXT_EXTENSION, "w")
+            self.track.WriteHeader (fp)
+
+    def _WriteChunk (self, chunk):
+        store = ts.TrackStore()
+        for item in chunk:
+            if isinstance (item, ts.TrackStore):
+                store.ExtendStore (item)
+            else:
+                for ele in item:
+                    store.Append (ele)
+        n = store.count
+        if self.t0 is None:
+            self._Start (float (store.time[0]))
+        if not self.binary:
+            self._Open (TEXT_EXTENSION).write (tw.StoreLines (store, 0, n).decode ('utf-8'))
+            self.count += n
+            return
+
+        # Columns for the chunk, rows then offset by what is already written
+        kind = store.kind[:n]
+        row  = store.row[:n].copy()
+        for name, msg in store.columns.items():
+            if msg.count == 0:
+                continue
+            row[kind == ts.MSG_CODE[name]] += self.rows[name]
+            self.rows[name] += msg.count
+            self._Open (_SpoolName (name, "time")).write (memoryview (msg.Time() - self.t0).cast ("B"))
+            for f in msg.fields:
+                self._Open (_SpoolName (name, f)).write (memoryview (msg.Column (f)).cast ("B"))
+        if store.other:
+            row[kind == ts.OTHER_CODE] += self.n_other
+            self.n_other += len(store.other)
+            fp = self._Open (OTHER_FILE, "a")
+            for ele in store.other:
+                fp.write (json.dumps ([ele.name, ele.time - self.t0, ele.data], default=float) + '\n')
+        # Order arrays last, so a crash part way leaves them no longer than the columns
+        self._Open (_SpoolName ("time")).write (memoryview (store.time[:n] - self.t0).cast ("B"))
+        self._Open (_SpoolName ("kind")).write (memoryview (np.ascontiguousarray (kind)).cast ("B"))
+        self._Open (_SpoolName ("row")).write (memoryview (row).cast ("B"))
+        self.count += n
+
+    def _Flush (self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_flush < FLUSH_INTERVAL:
+            return
+        for fp in self.files.values():
+            fp.flush()
+        self.last_flush = now
+        if force or now - self.last_sync >= SYNC_INTERVAL:
+            for fp in self.files.values():
+                os.fsync (fp.fileno())
+            self.last_sync = now
+
+
+def _SpoolArray (spool, name, dtype, count=None):
+    """ Spool file as a memory mapped array of whole items, at most count """
+    path = os.path.join (spool, name)
+    dtype = np.dtype (dtype)
+    items = os.path.getsize (path) // dtype.itemsize if os.path.exists (path) else 0
+    if count is not None:
+        items = min (items, count)
+    if items == 0:
+        return (np.empty (0, dtype=dtype))
+    return (np.memmap (path, dtype=dtype, mode='r', shape=(items,)))
+
+def Recover (spool, filename=None):
+    """ Turn a .sab spool folder into a .sab file (the spool name without
+    SPOOL_EXTENSION unless filename is given), then remove the spool. Returns
+    the Track memory mapped from the new file """
+    if filename is None:
+        filename = spool[:-len(SPOOL_EXTENSION)]
+    with open (os.path.join (spool, META_FILE), "r") as fp:
+        meta = json.load (fp)
+    trk = sd.Track (meta["name"])
+    trk.start_time  = meta["start_time"]
+    trk.sensor_dict = {int(k):v for k, v in meta["sensor_dict"].items()}
+    if meta["player"] is not None:
+        trk.player = pl.Player (*meta["player"])
+    if meta["calibrate"] is not None:
+        trk.calibrate = {k:np.array (v) for k, v in meta["calibrate"].items()}
+
+    # Columns cut to the rows every one of their arrays has, after a crash
+    # the last chunk may be part written
+    columns = {}
+    for name, fields in ts.MSG_FIELDS.items():
+        count = None
+        for f, dtype in ((("time", np.float64),) + fields):
+            count = len(_SpoolArray (spool, _SpoolName (name, f), dtype, count))
+        if count == 0:
+            continue
+        columns[name] = (_SpoolArray (spool, _SpoolName (name, "time"), np.float64, count),
+                         {f:_SpoolArray (spool, _SpoolName (name, f), dtype, count) for f, dtype in fields})
+    other = []
+    if os.path.exists (os.path.join (spool, OTHER_FILE)):
+        with open (os.path.join (spool, OTHER_FILE), "r") as fp:
+            for line in fp:
+                try:
+                    name, tim, data = json.loads (line)
+                except ValueError:
+                    break
+                other.append (ms.Element (name, tim, data))
+    count = None
+    for name, dtype in (("time", np.float64), ("kind", np.uint8), ("row", np.uint32)):
+        count = len(_SpoolArray (spool, _SpoolName (name), dtype, count))
+    order = [_SpoolArray (spool, _SpoolName (name), dtype, count)
+             for name, dtype in (("time", np.float64), ("kind", np.uint8), ("row", np.uint32))]
+    # Drop samples whose row did not make it into the columns
+    keep = np.ones (count, dtype=bool)
+    for code, name in enumerate (ts.MSG_NAMES):
+        rows = len(columns[name][0]) if name in columns else 0
+        keep &= ~((order[1] == code) & (order[2] >= rows))
+    keep &= ~((order[1] == ts.OTHER_CODE) & (order[2] >= len(other)))
+    if not keep.all():
+        order = [arr[keep] for arr in order]
+    trk.store.Attach (order[0], order[1], order[2], columns, other)
+    times = trk.store.Times()
+    trk.t_len = float(times[-1] - times[0]) if len(times) else 0.0
+
+    with open (filename, "wb") as fp:
+        tb.WriteTracks ([trk], fp)
+    del trk, columns, order
+    shutil.rmtree (spool, ignore_errors=True)
+    tracklist = tb.ReadTracks (filename)
+    return (tracklist[0] if tracklist else None)
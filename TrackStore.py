@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage for the time series held in a Track. Rather than keeping a
+Python list with one Element (and one dict) per sample, the data for each
+message type is held as a struct of arrays, e.g. SA_EUL_ANG is stored as
+contiguous time, sensor, angle_X, angle_Y and angle_Z arrays.
+Classes are:
+    MsgColumns   - growable struct of arrays for a single message type
+    TrackStore   - all the columns for a track together with the order in which
+                   the samples arrived
+    SequenceView - list like view of a TrackStore that hands out Elements, so
+                   code written against Track.sequence keeps working
+"""
+
+import numpy as np
+import Messages as ms
+
+# The message tables are in Messages, the names are kept here
+MSG_FIELDS = ms.MSG_FIELDS
+MSG_NAMES  = ms.MSG_NAMES
+MSG_CODE   = ms.MSG_CODE
+OTHER_CODE = ms.OTHER_CODE
+
+MIN_CAPACITY = 1024
+
+
+def _Grow (arr, count, need):
+    """ Return an array with room for at least need items, keeping the first
+    count items of arr. Capacity doubles so appends are amortised O(1) """
+    if need <= len(arr):
+        return (arr)
+    new = np.empty (max (need, 2*len(arr), MIN_CAPACITY), dtype=arr.dtype)
+    new[:count] = arr[:count]
+    return (new)
+
+
+class MsgColumns ():
+    """ Struct of arrays for one message type """
+    def __init__ (self, name, fields):
+        self.name   = name
+        self.fields = [f for f, _ in fields]
+        self.count  = 0
+        self.time   = np.empty (0, dtype=np.float64)
+        self.cols   = {f:np.empty (0, dtype=t) for f, t in fields}
+
+    def Reserve (self, need):
+        self.time = _Grow (self.time, self.count, need)
+        for f in self.fields:
+            self.cols[f] = _Grow (self.cols[f], self.count, need)
+
+    def Append (self, time, data):
+        """ Add a single sample, data is the Element data dict. Fields missing
+        from the dict are stored as 0 """
+        self.Reserve (self.count + 1)
+        i = self.count
+        self.time[i] = time
+        for f in self.fields:
+            self.cols[f][i] = data.get (f, 0)
+        self.count += 1
+        return (i)
+
+    def Extend (self, time, cols):
+        """ Add a block of samples, cols is a dict of arrays keyed by field """
+        n = len(time)
+        self.Reserve (self.count + n)
+        self.time[self.count:self.count+n] = time
+        for f in self.fields:
+            self.cols[f][self.count:self.count+n] = cols[f]
+        self.count += n
+
+    def Attach (self, time, cols):
+        """ Use the arrays given as the columns without copying them, e.g. arrays
+        memory mapped from a file. They are copied if samples are appended """
+        self.count = len(time)
+        self.time  = time
+        for f in self.fields:
+            self.cols[f] = cols[f]
+
+    def Time (self):
+        return (self.time[:self.count])
+
+    def Column (self, field):
+        return (self.cols[field][:self.count])
+
+    def Element (self, i):
+        data = {}
+        for f in self.fields:
+            val = self.cols[f][i]
+            data[f] = int(val) if f == "sensor" else val
+        return (ms.Element (self.name, float(self.time[i]), data))
+
+    def nbytes (self):
+        return (self.time[:self.count].nbytes + sum ([self.cols[f][:self.count].nbytes for f in self.fields]))
+
+
+def SortTimes (times):
+    """ Stable sort of times as (order, sorted times), order is None and times
+    are given back as they are when they are in order already """
+    if len(times) < 2 or (times[1:] >= times[:-1]).all():
+        return (None, times)
+    order = np.argsort (times, kind="stable")
+    return (order, times[order])
+
+
+class TrackStore ():
+    """ Columnar store for a track. As well as the columns for each message type
+    three order arrays are kept (time, kind and row) so that the samples can be
+    handed back in the order they were recorded """
+    def __init__ (self):
+        self.count   = 0
+        self.time    = np.empty (0, dtype=np.float64)  # Time of every sample
+        self.kind    = np.empty (0, dtype=np.uint8)    # Index into MSG_NAMES or OTHER_CODE
+        self.row     = np.empty (0, dtype=np.uint32)   # Row within the columns for that kind
+        self.columns = {name:MsgColumns (name, fields) for name, fields in MSG_FIELDS.items()}
+        self.other   = []                              # Elements for unknown message types
+        self.sorted  = None                            # (count, order, times) for TimeOrder
+
+    def __len__ (self):
+        return (self.count)
+
+    def _ReserveOrder (self, need):
+        self.time = _Grow (self.time, self.count, need)
+        self.kind = _Grow (self.kind, self.count, need)
+        self.row  = _Grow (self.row,  self.count, need)
+
+    def Append (self, ele):
+        """ Add a single Element to the end of the store """
+        self._ReserveOrder (self.count + 1)
+        if ele.name in self.columns:
+            kind = MSG_CODE[ele.name]
+            row  = self.columns[ele.name].Append (ele.time, ele.data)
+        else:
+            kind = OTHER_CODE
+            row  = len(self.other)
+            self.other.append (ele)
+        i = self.count
+        self.time[i] = ele.time
+        self.kind[i] = kind
+        self.row[i]  = row
+        self.count  += 1
+
+    def Extend (self, kind, row, columns, others=[]):
+        """ Add a block of samples. kind and row give the order of the samples,
+        with row counted from the start of this block for each kind. columns is
+        a dict keyed by message name of (time, dict of field arrays) and others a
+        list of Elements for the OTHER_CODE samples """
+        n = len(kind)
+        if n == 0:
+            return
+        kind = np.asarray (kind, dtype=np.uint8)
+        row  = np.asarray (row, dtype=np.uint32).copy()
+        time = np.empty (n, dtype=np.float64)
+
+        # Offset rows by what is already stored, and gather the time of each sample
+        for name, (tim, cols) in columns.items():
+            msg   = self.columns[name]
+            mask  = kind == MSG_CODE[name]
+            time[mask] = np.asarray (tim)[row[mask]]
+            row[mask] += msg.count
+            msg.Extend (tim, cols)
+        if others:
+            mask = kind == OTHER_CODE
+            time[mask] = [ele.time for ele in others]
+            row[mask] += len(self.other)
+            self.other.extend (others)
+
+        self._ReserveOrder (self.count + n)
+        self.time[self.count:self.count+n] = time
+        self.kind[self.count:self.count+n] = kind
+        self.row[self.count:self.count+n]  = row
+        self.count += n
+
+    def ExtendStore (self, store):
+        """ Add all the samples of another TrackStore. Its Elements of unknown
+        types are copied, as ShiftTime changes them in place """
+        n = store.count
+        columns = {name:(msg.Time(), {f:msg.Column (f) for f in msg.fields})
+                   for name, msg in store.columns.items() if msg.count}
+        others  = [ms.Element (ele.name, ele.time, dict (ele.data)) for ele in store.other]
+        self.Extend (store.kind[:n], store.row[:n], columns, others)
+
+    def SortOrder (self):
+        """ Put the samples in time order, equal times keeping their order. The
+        columns are left as they are """
+        order, _ = self.TimeOrder()
+        if order is None:
+            return
+        for name in ("time", "kind", "row"):
+            arr = getattr (self, name)
+            arr[:self.count] = arr[:self.count][order]
+        self.sorted = None
+
+    def Attach (self, time, kind, row, columns, other):
+        """ Use the arrays given as the store without copying them, columns is a
+        dict keyed by message name of (time, dict of field arrays). Message
+        types missing from columns are left empty """
+        self.count = len(time)
+        self.time  = time
+        self.kind  = kind
+        self.row   = row
+        for name, (tim, cols) in columns.items():
+            self.columns[name].Attach (tim, cols)
+        self.other  = list (other)
+        self.sorted = None
+
+    def Times (self):
+        """ Time of every sample in recorded order """
+        return (self.time[:self.count])
+
+    def ShiftTime (self, offset):
+        """ Subtract offset from every time in the store """
+        if offset == 0.0:
+            return
+        self.sorted = None
+        self.time[:self.count] -= offset
+        for msg in self.columns.values():
+            msg.time[:msg.count] -= offset
+        for ele in self.other:
+            ele.time -= offset
+
+    def TimeOrder (self):
+        """ The samples in time order, as (order, times) from SortTimes. Samples
+        need not be recorded in time order (e.g. packets arriving out of order),
+        so searches by time go through this. Built once and kept until samples
+        are added """
+        if self.sorted is None or self.sorted[0] != self.count:
+            self.sorted = (self.count,) + SortTimes (self.Times())
+        return (self.sorted[1:])
+
+    def Element (self, i):
+        """ Build an Element for sample i """
+        kind = self.kind[i]
+        row  = self.row[i]
+        if kind == OTHER_CODE:
+            return (self.other[row])
+        return (self.columns[MSG_NAMES[kind]].Element (row))
+
+    def Elements (self, start, end):
+        """ List of Elements for samples start to end-1 """
+        return ([self.Element (i) for i in range (start, end)])
+
+    def Latest (self):
+        """ The newest Element of each message type and sensor, in time order.
+        These are all a view that only shows the latest values (a table, the
+        pose) needs from a block of samples """
+        latest = []
+        for msg in self.columns.values():
+            if msg.count == 0:
+                continue
+            # Last of each sensor once sorted by sensor then time
+            sen  = msg.Column ("sensor")
+            tim  = msg.Time()
+            rows = np.lexsort ((np.arange (msg.count), tim, sen))
+            last = rows[np.append (sen[rows][1:] != sen[rows][:-1], True)]
+            latest.extend (msg.Element (i) for i in last.tolist())
+        newest = {}
+        for ele in self.other:
+            newest[(ele.name, ele.data.get ("sensor"))] = ele
+        latest.extend (newest.values())
+        latest.sort (key=lambda ele: ele.time)
+        return (latest)
+
+    def TimeElements (self, start, end):
+        """ List of Elements for samples start to end-1 of the time order """
+        order, _ = self.TimeOrder()
+        if order is None:
+            return (self.Elements (start, end))
+        return ([self.Element (i) for i in order[start:end].tolist()])
+
+    def nbytes (self):
+        size = self.time[:self.count].nbytes + self.kind[:self.count].nbytes + self.row[:self.count].nbytes
+        for msg in self.columns.values():
+            size += msg.nbytes()
+        return (size)
+
+
+class SequenceView ():
+    """ Gives a TrackStore the look of the list of Elements that Track.sequence
+    used to be. Elements are built on demand, so hold on to them only as long
+    as needed """
+    def __init__ (self, store):
+        self.store = store
+
+    def __len__ (self):
+        return (self.store.count)
+
+    def __getitem__ (self, index):
+        if isinstance (index, slice):
+            return ([self.store.Element (i) for i in range (*index.indices (self.store.count))])
+        if index < 0:
+            index += self.store.count
+        if index < 0 or index >= self.store.count:
+            raise IndexError ("sequence index out of range")
+        return (self.store.Element (index))
+
+    def __iter__ (self):
+        for i in range (0, self.store.count):
+            yield self.store.Element (i)
+
+    def append (self, ele):
+        self.store.Append (ele)
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Reading of the text track format (.sat). Rather than splitting each line and
+building an Element, the data lines are converted a chunk at a time with a
+tokenizer that works on the bytes of the file using NumPy:
+    - the separators give the start and end of every token, so a block of
+      lines with the same number of fields becomes a table of tokens
+    - the block is also viewed as an unaligned 64 bit integer starting at
+      every byte, so the first or last 8 bytes of any token are one lookup
+    - message names and field keys are matched on their length and the
+      integers holding their first 16 bytes
+    - numbers of up to 8 bytes are converted from the integer holding their
+      last 8 bytes, all the digits at once (SWAR, SIMD within a register),
+      longer ones are lined up on their last byte and converted with lookup
+      tables and a matrix product
+    - spaces and tabs around tokens are trimmed, a token with one inside it
+      is not a key or a number
+The columns for each message type then go straight into the TrackStore of the
+track. Lines that do not have the fixed shape of their message type (missing
+fields, unknown names, odd numbers) fall back to Element.Read.
+"""
+
+import numpy as np
+import StreamData as sd
+import Messages as ms
+import TrackStore as ts
+import Player as pl
+
+HEADER_NAMES = ("SA_Track", "SA_Player", "SA_SensorDict", "SA_Calibrate", "SA_Time", "SA_Annotate")
+CHUNK_SIZE   = 1 << 22      # Bytes of data lines converted at a time
+SKIP_CODE    = 254          # Kind for lines that do not end up in the store
+MAX_DIGITS   = 15           # More digits than this and a number is converted by float()
+WINDOW       = 24           # Bytes of padding either side of a block of lines
+POWER_10F    = 10.0 ** np.arange (WINDOW + 1)
+
+COMMA, NEWLINE, SPACE, TAB = ord(','), ord('\n'), ord(' '), ord('\t')
+DOT, MINUS, PLUS, ZERO     = ord('.'), ord('-'), ord('+'), ord('0')
+
+# Tables used by the long number conversion, indexed by byte. CHAR_COUNT packs
+# counts of digits, points, signs and anything else into one number. The
+# padding in front of a token is byte 0, which counts as nothing
+DIGIT_VALUE = np.zeros (256)
+DIGIT_VALUE[ZERO:ZERO+10] = np.arange (10)
+CHAR_POINT  = np.zeros (256)
+CHAR_POINT[DOT] = 1
+CHAR_COUNT  = np.full (256, 1 << 15, dtype=np.float64)
+CHAR_COUNT[ZERO:ZERO+10] = 1
+CHAR_COUNT[DOT]   = 1 << 5
+CHAR_COUNT[[MINUS, PLUS]] = 1 << 10
+CHAR_COUNT[0]     = 0
+BLANK = np.zeros (256, dtype=bool)
+BLANK[[SPACE, TAB]] = True
+
+# Constants for the 8 byte words, byte i of a word is the i'th byte of the
+# text, so the last byte of a token is the top byte of the word ending on it
+def Repeat (b):
+    """ 64 bit word with every byte b """
+    return (np.uint64 (int.from_bytes (bytes ([b]) * 8, 'little')))
+
+ZEROS, POINTS, LOW7, HIGH4, SIX = Repeat (ZERO), Repeat (DOT ^ ZERO), Repeat (0x7f), Repeat (0xf0), Repeat (0x06)
+KEEP  = np.array ([(1 << 64) - (1 << 8*(8-n)) for n in range (9)], dtype=np.uint64)    # Top n bytes
+MASK  = np.array ([(1 << 8*n) - 1 for n in range (9)], dtype=np.uint64)                 # Bottom n bytes
+# Removing the point at byte p moves the bytes below it up one, no point is p = 8
+ABOVE = np.array ([(1 << 64) - (1 << 8*(p+1)) for p in range (8)] + [(1 << 64) - 1], dtype=np.uint64)
+BELOW = np.array ([(1 << 8*p) - 1 for p in range (8)] + [0], dtype=np.uint64)
+# Divisor of the mantissa for each p, then the same negated for a minus sign
+SCALE = np.array ([10.0**(7 - p) for p in range (8)] + [1.0])
+SCALE = np.concatenate ((SCALE, -SCALE))
+U8    = np.uint64 (8)
+U7, U56 = np.uint64 (7), np.uint64 (56)
+ONES  = Repeat (0x01)   # Times a word of 0 or 1 bytes gives their sum in the top byte
+KEY_WORDS = {}      # KeyWords of each key matched so far
+COMBINE = [(np.uint64 (s), np.uint64 (m), np.uint64 (k)) for s, m, k in
+           ((8, 10, 0x00ff00ff00ff00ff), (16, 100, 0x0000ffff0000ffff), (32, 10000, 0xffffffff))]
+
+
+def ReadTracks (fp):
+    """ Read all the tracks from file pointer fp, returns a list of Tracks """
+    data = fp.read()
+    if isinstance (data, str):
+        data = data.encode ('utf-8')
+    return (ReadTracksBytes (data))
+
+def ReadTracksBytes (data):
+    """ Read all the tracks held in the bytes data """
+    if b'\r' in data:
+        data = data.replace (b'\r\n', b'\n').replace (b'\r', b'\n')
+
+    tracklist = []
+    start = FindTrack (data, 0)
+    while start >= 0:
+        end = FindTrack (data, start + 1)
+        tracklist.append (ParseTrack (data, start, end if end >= 0 else len(data)))
+        start = end
+    return (tracklist)
+
+def FindTrack (data, pos):
+    """ Position of the next SA_Track line at or after pos, -1 if none """
+    if pos == 0 and data[:9] == b"SA_Track,":
+        return (0)
+    ind = data.find (b"\nSA_Track,", max (pos - 1, 0))
+    return (ind + 1 if ind >= 0 else -1)
+
+def ParseTrack (data, start, end):
+    """ Parse one track, data[start:end] starts with the SA_Track line """
+    track = None
+    pos   = start
+    # Header records, the data starts at the first line that is not one
+    while pos < end:
+        nl = data.find (b'\n', pos, end)
+        if nl < 0:
+            nl = end
+        line = data[pos:nl].decode ('utf-8')
+        name = line.split (',', 1)[0].strip()
+        if name not in HEADER_NAMES:
+            break
+        items = [x.strip() for x in line.split(',')]
+        if name == "SA_Track":
+            track = sd.Track (items[1])
+        else:
+            ReadHeader (track, items)
+        pos = nl + 1
+
+    ParseData (track, data, pos, end)
+    track.SetTimeLen()
+    return (track)
+
+def ReadHeader (track, items):
+    """ Store header record held in the list of strings items in track """
+    if (items[0] == "SA_Player"):
+        track.player = pl.Player (items[1], items[2], float(items[3]))
+    elif (items[0] == "SA_Calibrate"):
+        cal = {}
+        for i in range (1, len(items), 2):
+            xyz = items[i+1][1:-1].split()
+            cal[items[i]] = np.array ([float(xyz[0]), float(xyz[1]), float(xyz[2])])
+        track.calibrate = cal
+    elif (items[0] == "SA_SensorDict"):
+        for i in range (1,len(items), 2) :
+            track.sensor_dict[int(items[i])] = items[i+1]
+    elif (items[0] == "SA_Time"):
+        track.start_time = ",".join (items[1:])
+    elif (items[0] == "SA_Annotate"):   # Annotations still under construction
+        pass
+
+def ParseData (track, data, start, end):
+    """ Parse the data lines in data[start:end] a chunk at a time """
+    pos = start
+    while pos < end:
+        stop = min (pos + CHUNK_SIZE, end)
+        if stop < end:
+            nl = data.find (b'\n', stop, end)
+            stop = end if nl < 0 else nl + 1
+        chunk = data[pos:stop].strip (b'\n')
+        if chunk:
+            ParseChunk (track, chunk)
+        pos = stop
+
+def ParseChunk (track, chunk):
+    """ Parse a block of data lines (no trailing new line) into track """
+    n_lines = chunk.count (b'\n') + 1
+    commas  = chunk.count (b',')
+    lines   = None
+    parsed  = {}    # name: list of (line index, time, dict of columns)
+    slow    = []    # line indices that need the line by line parser
+
+    # Common case, every line has the same number of fields
+    done = None
+    if commas % n_lines == 0:
+        done = ParseTable (chunk, commas // n_lines + 1, np.arange (n_lines), parsed)
+    if done is not None:
+        slow = np.flatnonzero (~done).tolist()
+    else:
+        # Group lines by number of fields, each group is a table of tokens
+        lines  = chunk.split (b'\n')
+        widths = np.fromiter ((ln.count (b',') for ln in lines), dtype=np.int64, count=len(lines)) + 1
+        for width in np.unique (widths):
+            index = np.flatnonzero (widths == width)
+            done  = ParseTable (b"\n".join ([lines[i] for i in index]), width, index, parsed)
+            slow.extend (index[~done].tolist())
+    kind = np.full (n_lines, SKIP_CODE, dtype=np.uint8)
+
+    if slow:
+        if lines is None:
+            lines = chunk.split (b'\n')
+        ParseSlow (track, lines, sorted(slow), parsed)
+
+    # Combine everything for each message type, in line order
+    row     = np.zeros (n_lines, dtype=np.uint32)
+    columns = {}
+    others  = []
+    for name, parts in parsed.items():
+        index = np.concatenate ([p[0] for p in parts])
+        order = np.argsort (index, kind='stable')
+        index = index[order]
+        if name is None:
+            kind[index] = ts.OTHER_CODE
+            row[index]  = np.arange (len(index))
+            elements    = [e for p in parts for e in p[1]]
+            others      = [elements[i] for i in order]
+            continue
+        kind[index] = ts.MSG_CODE[name]
+        row[index]  = np.arange (len(index))
+        if len(parts) == 1:
+            # One table, already in line order
+            columns[name] = parts[0][1:]
+            continue
+        tim  = np.concatenate ([p[1] for p in parts])[order]
+        cols = {f:np.concatenate ([p[2][f] for p in parts])[order] for f in parts[0][2]}
+        columns[name] = (tim, cols)
+
+    keep = kind != SKIP_CODE
+    if keep.all():
+        track.store.Extend (kind, row, columns, others)
+    else:
+        track.store.Extend (kind[keep], row[keep], columns, others)
+
+def ParseTable (block, width, index, parsed):
+    """ Convert the lines in block, each of which has width fields, that have the
+    fixed layout of their message type. index is the line number of each line,
+    results are added to parsed. Returns a boolean array of the lines converted,
+    or None if not every line has width fields """
+    n_rows = len(index)
+    done   = np.zeros (n_rows, dtype=bool)
+    names  = [name for name, fields in ts.MSG_FIELDS.items()
+              if width == 2 + 2*len(fields) and fields[0][0] == "sensor"]
+
+    # Padding so every token has WINDOW bytes before and after it
+    buf  = np.frombuffer (b'\0'*WINDOW + block + b'\0'*WINDOW, dtype=np.uint8)
+    seps = np.flatnonzero ((buf == COMMA) | (buf == NEWLINE)) - WINDOW
+    if len(seps) != n_rows*width - 1 or not (buf[seps[width-1::width] + WINDOW] == NEWLINE).all():
+        return (None)
+    if not names:
+        return (done)
+    starts = np.empty (n_rows*width, dtype=np.int64)
+    ends   = np.empty (n_rows*width, dtype=np.int64)
+    starts[0]  = 0
+    starts[1:] = seps + 1
+    ends[:-1]  = seps
+    ends[-1]   = len(block)
+    if b' ' in block or b'\t' in block:
+        TrimTokens (buf, starts, ends)
+    starts = starts.reshape (n_rows, width)
+    ends   = ends.reshape (n_rows, width)
+    words  = Words (buf)
+
+    # Keys are in slots 0 (name), 2 (sensor), 4, 6... and numbers in the odd slots
+    keys   = {k:TokenWords (words, starts[:,k], ends[:,k]) for k in range (0, width, 2)}
+    values = {}
+    for name in names:
+        rows = MatchToken (keys[0], name)
+        if not rows.any():
+            continue
+        rows &= MatchToken (keys[2], "sensor")
+        fields = ts.MSG_FIELDS[name]
+        # Value fields may come in any order, find each one in the key slots.
+        # A field in the same slot on every row is kept as that slot number
+        slot = {}
+        for f, _ in fields[1:]:
+            slot[f] = np.full (n_rows, -1, dtype=np.int64)
+            for k in range (4, width, 2):
+                match = MatchToken (keys[k], f)
+                if match.all():
+                    slot[f] = k + 1
+                    break
+                slot[f][match] = k + 1
+            else:
+                rows &= slot[f] >= 0
+        if not rows.any():
+            continue
+        if not values:
+            nums   = ParseNumbers (block, buf, words, starts[:,1::2], ends[:,1::2])
+            values = {k:nums[:,k//2] for k in range (1, width, 2)}
+        rows &= ~np.isnan (values[1]) & (values[3] == np.trunc (values[3]))
+        for k in range (5, width, 2):
+            rows &= ~np.isnan (values[k])
+        if not rows.any():
+            continue
+
+        take = slice (None) if rows.all() else rows
+        cols = {"sensor":values[3][take].astype (fields[0][1])}
+        for f, dtype in fields[1:]:
+            if isinstance (slot[f], int):
+                cols[f] = values[slot[f]][take].astype (dtype)
+                continue
+            pick = slot[f][take]
+            val  = np.empty (len(pick), dtype=np.float64)
+            for k in range (5, width, 2):
+                sel = pick == k
+                val[sel] = values[k][take][sel]
+            cols[f] = val.astype (dtype)
+        parsed.setdefault (name, []).append ((index[take], values[1][take], cols))
+        done |= rows
+    return (done)
+
+def TrimTokens (buf, starts, ends):
+    """ Move starts and ends in past any spaces or tabs around each token. One
+    left inside a token stops it being a key or a number. buf is the block
+    with WINDOW bytes of padding """
+    for pos, edge, step in ((starts, WINDOW, 1), (ends, WINDOW - 1, -1)):
+        trim = np.flatnonzero (BLANK.take (buf.take (pos + edge)) & (starts < ends))
+        while len(trim):
+            pos[trim] += step
+            trim = trim[BLANK.take (buf.take (pos[trim] + edge)) & (starts[trim] < ends[trim])]
+
+def Words (buf):
+    """ View of buf as the 64 bit little endian integer starting at each byte """
+    return (np.ndarray ((len(buf) - 7,), dtype='<u8', buffer=buf, strides=(1,)))
+
+def TokenWords (words, starts, ends):
+    """ Length and the word holding the first 8 bytes of each token, words is
+    the Words of the block with WINDOW bytes of padding. The bytes past the
+    end of a token are left in, MatchToken masks them, and gets the word
+    holding the next 8 bytes ("high") the first time a long token needs it """
+    return ({"length":ends - starts, "low":words[starts + WINDOW], "starts":starts, "words":words})
+
+def KeyWords (token):
+    """ Length of token in bytes, with the masks and words MatchToken compares
+    its first and next 8 bytes with, or None if it is longer than 16 bytes """
+    if token not in KEY_WORDS:
+        raw  = token.encode ('utf-8')
+        word = int.from_bytes (raw.ljust (16, b'\0'), 'little')
+        KEY_WORDS[token] = None if len(raw) > 16 else (len(raw),
+                    MASK[min (len(raw), 8)], np.uint64 (word & 0xffffffffffffffff),
+                    MASK[max (len(raw) - 8, 0)], np.uint64 (word >> 64))
+    return (KEY_WORDS[token])
+
+def MatchToken (keys, token):
+    """ Boolean array of the tokens (given as TokenWords) equal to token """
+    key = KeyWords (token)
+    if key is None:
+        return (np.zeros (len(keys["length"]), dtype=bool))
+    length, low_mask, low, high_mask, high = key
+    match = keys["length"] == length
+    match &= (keys["low"] & low_mask) == low
+    if length > 8:
+        if "high" not in keys:
+            keys["high"] = keys["words"][keys["starts"] + (WINDOW + 8)]
+        match &= (keys["high"] & high_mask) == high
+    return (match)
+
+def ParseNumbers (block, buf, words, starts, ends):
+    """ Convert the number held in each token to float64, tokens that are not
+    numbers give NaN. Tokens of up to 8 bytes go through ParseShort, longer
+    ones through ParseLong. buf is block with WINDOW bytes of padding and
+    words its Words """
+    length = ends - starts
+    values = np.full (length.shape, np.nan)
+    short  = (length > 0) & (length <= 8)
+    if short.all():
+        ok = ParseShort (words, length, ends, values)
+    else:
+        pick = np.flatnonzero (short)
+        part = np.full (len(pick), np.nan)
+        ok   = np.zeros (length.shape, dtype=bool)
+        ok.flat[pick] = ParseShort (words, length.flat[pick], ends.flat[pick], part)
+        values.flat[pick] = part
+    rest = np.flatnonzero (~ok & (length > 0))
+    if len(rest):
+        values.flat[rest] = ParseLong (block, buf, starts.flat[rest], ends.flat[rest])
+    return (values)
+
+def ParseShort (words, length, ends, values):
+    """ Convert tokens of 1 to 8 bytes that are decimals with an optional sign
+    and point into values. Each byte of the word ending on the token is xor'd
+    with '0', so digits become their value, the bytes in front of the token
+    and the sign are set to 0 and the digits in front of the point are moved
+    up a byte over it. Then every byte is checked to be a digit and the eight
+    are combined into the mantissa with three multiplies. Exact, as there are
+    at most 8 digits. Returns a boolean array of the tokens converted """
+    digit = words[ends + (WINDOW - 8)]
+    digit ^= ZEROS
+    digit &= KEEP.take (length)
+    shift = ((8 - length) << 3).astype (np.uint64)
+    first = (digit >> shift) & np.uint64 (0xff)
+    minus = first == (MINUS ^ ZERO)
+    sign  = minus | (first == (PLUS ^ ZERO))
+    first *= sign
+    digit ^= first << shift
+
+    # Bytes that were a point get their top bit set. The bits below the
+    # lowest fill the bytes under it, counting those gives its byte, or 8 if
+    # there is none
+    point  = digit ^ POINTS
+    point  = ~(((point & LOW7) + LOW7) | point | LOW7)
+    points = ((point >> U7) * ONES) >> U56
+    below  = point - np.uint64 (1)
+    below &= ~point
+    below >>= U7
+    below &= ONES
+    below *= ONES
+    below >>= U56
+    p      = below.astype (np.intp)
+    point  = digit & BELOW.take (p)
+    point <<= U8
+    digit &= ABOVE.take (p)
+    digit |= point
+
+    # A digit has nothing in its top four bits, even after adding 6
+    ok  = ((digit | (digit + SIX)) & HIGH4) == 0
+    ok &= (points <= 1) & (length > points + sign)
+
+    # Pairs of digits, then fours, then all eight
+    for shift, scale, mask in COMBINE:
+        np.right_shift (digit, shift, out=point)
+        digit *= scale
+        digit += point
+        digit &= mask
+    value = digit.astype (np.float64)
+    p += 9*minus
+    value /= SCALE.take (p)
+    np.copyto (values, value, where=ok)
+    return (ok)
+
+def ParseLong (block, buf, starts, ends):
+    """ Convert the number held in each token to float64. The tokens are lined
+    up on their last byte so every column has a fixed power of ten, which
+    turns the digits into an integer mantissa with a matrix product. The same
+    trick counts the digits, points, signs and bad bytes in each token and
+    finds the point. This is exact while the digits, with those before the
+    point one column too far left, fit in 53 bits. Tokens that are not, or
+    are not simple decimals, go through float(), tokens that are not numbers
+    at all give NaN. buf is block with WINDOW bytes of padding """
+    length = ends - starts
+    width  = min (int (length.max()), MAX_DIGITS + 1)
+
+    # Bytes of each token right aligned, the bytes in front of it are taken
+    # from the padding at the start of buf
+    col   = np.arange (width)
+    index = (ends + (WINDOW - width))[:,None] + col
+    index *= col >= (width - length)[:,None]
+    chars = buf.take (index).astype (np.intp)
+    power = POWER_10F[width-1::-1]
+    raw   = DIGIT_VALUE.take (chars) @ power
+    frac  = (CHAR_POINT.take (chars) @ col[::-1]).astype (np.int64)
+    count = (CHAR_COUNT.take (chars) @ np.ones (width)).astype (np.int64)
+
+    # Digits before the point were read one column too far left
+    digits, points, signs, bad = [(count >> s) & 31 for s in (0, 5, 10, 15)]
+    right  = np.where (points > 0, np.fmod (raw, POWER_10F[frac]), raw)
+    values = (right + (raw - right) / 10) / POWER_10F[frac]
+    first  = buf[starts + WINDOW]
+    values[first == MINUS] *= -1
+    # A sign has to be the first byte
+    simple = (bad == 0) & (points <= 1) & (signs == ((first == MINUS) | (first == PLUS))) & \
+             (digits > 0) & (length <= width) & (raw < 2.0**53)
+    for i in np.flatnonzero (~simple):
+        try:
+            values[i] = float (block[starts[i]:ends[i]])
+        except ValueError:
+            values[i] = np.nan
+    return (values)
+
+def ParseSlow (track, lines, slow, parsed):
+    """ Line by line parse of data lines that did not fit a fixed layout """
+    for i in slow:
+        line  = lines[i].decode ('utf-8')
+        items = [x.strip() for x in line.split(',')]
+        if len(items) < 2 or items[0] == "":
+            continue
+        if items[0] in HEADER_NAMES:
+            ReadHeader (track, items)
+            continue
+        try:
+            ele = ms.Element (None, None, None)
+            ele.Read (items)
+        except (ValueError, IndexError):
+            print ("Error reading line ", line)
+            continue
+        if ele.name in ts.MSG_FIELDS:
+            fields = ts.MSG_FIELDS[ele.name]
+            cols = {f:np.array ([ele.data.get (f, 0)], dtype=t) for f, t in fields}
+            parsed.setdefault (ele.name, []).append ((np.array ([i]), np.array ([ele.time]), cols))
+        else:
+            parsed.setdefault (None, []).append ((np.array ([i]), [ele]))
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk writer for text track files (.sat). Track.Write used to build every line
+with Element.String, one element and one fp.write at a time. Here the lines
+for a block of samples are made from the TrackStore columns all at once:
+each number column is formatted into a byte matrix with numpy and the pieces
+of every line are scattered into a single buffer, which is written in one go.
+The text is the same, character for character, as Element.String gives:
+times as str() of a float, fields as str() of the stored float32 (the
+shortest digits that read back to the same value) and integers plainly.
+Numbers with long decimals or in exponent form, and anything that is not
+finite, are left to numpy's own conversion to text, which matches str().
+Saving can be run on a thread, with progress, by SaveThread. It writes to a
+temporary file next to the one asked for and moves it over at the end, so a
+file being saved over is never truncated under a memory map of it (a lazily
+loaded .sat or a .sab).
+Classes are:
+    SaveThread - writes a list of tracks to a file in the background
+"""
+
+import os
+import threading
+import numpy as np
+import TrackStore as ts
+import TrackBinary as tb
+
+CHUNK_LINES = 65536     # Lines made and written in one go
+FAST_DECIMALS = 8      # Most decimals tried before leaving a value to numpy
+EXACT_LIMIT  = 2.0**53  # Integers above this are not exact in a float64
+POSITIONAL_32 = 1e6     # str() of a float32 this big or more has an exponent
+SKIP_NAME    = "SA_BNO_QEU"   # Messages left out of text files as in Track.Write
+TEMP_EXTENSION = ".part"      # Added to the name of the file while it is saved
+
+CHAR_0     = ord ('0')
+CHAR_POINT = ord ('.')
+CHAR_MINUS = ord ('-')
+
+
+def _Digits (mag, d, neg, point):
+    """ Right aligned byte matrix and lengths for integers mag with the point
+    d digits from the right (if point) and a minus sign where neg """
+    n_dig = np.ones (len(mag), dtype=np.int64)
+    big   = mag >= 10
+    power = 10
+    while big.any():
+        n_dig += big
+        power *= 10
+        big = mag >= power if power <= 10**18 else np.zeros (len(mag), dtype=bool)
+    if point:
+        n_dig = np.maximum (n_dig, d + 1)     # At least one digit before the point
+    length = n_dig + point + neg
+    width  = int(length.max()) if len(length) else 0
+    out  = np.full ((len(mag), width), ord (' '), dtype=np.uint8)
+    rest = mag.copy()
+    for j in range (width):
+        col = width - 1 - j
+        if point:
+            at_point = d == j
+            digit_j  = j - (j > d)      # Which digit of mag this column is
+        else:
+            at_point = np.zeros (len(mag), dtype=bool)
+            digit_j  = j
+        is_digit = ~at_point & (digit_j < n_dig)
+        # Take the next digit off rest only where this column holds one
+        out[is_digit,col] = CHAR_0 + (rest[is_digit] % 10)
+        rest[is_digit] //= 10
+        out[at_point,col] = CHAR_POINT
+        out[neg & (j == n_dig + point),col] = CHAR_MINUS
+    return (out, length)
+
+def FormatInts (values):
+    """ Byte matrix and lengths of str() of each integer """
+    values = np.asarray (values).astype (np.int64)
+    return (_Digits (np.abs (values), None, values < 0, False))
+
+def FormatFloats (values):
+    """ Byte matrix and lengths of str() of each value, str() of a float32 for
+    float32 arrays and of a float otherwise """
+    values = np.asarray (values)
+    single = values.dtype == np.float32
+    exact  = values if single else values.astype (np.float64)
+    mag    = np.abs (exact).astype (np.float64)
+    neg    = np.signbit (exact)
+    # Values with a few decimals are done as integers, str() is positional
+    # from 1e-4 up to 1e16 (1e6 for a float32)
+    todo = np.isfinite (mag) & ((mag >= 1e-4) | (mag == 0)) & (mag < (POSITIONAL_32 if single else 1e15))
+    digits   = np.zeros (len(values), dtype=np.int64)
+    decimals = np.zeros (len(values), dtype=np.int64)
+    for d in range (1, FAST_DECIMALS + 1):
+        idx = np.flatnonzero (todo)
+        if len(idx) == 0:
+            break
+        cand = np.rint (mag[idx] * 10.0**d)
+        back = cand / 10.0**d
+        good = (back.astype (np.float32) == exact[idx]) if single else (back == mag[idx])
+        good &= cand < EXACT_LIMIT
+        digits[idx[good]]   = cand[good]
+        decimals[idx[good]] = d
+        todo[idx[good]] = False
+    out, length = _Digits (digits, np.maximum (decimals, 1), neg, True)
+    slow = np.flatnonzero (decimals == 0)
+    if len(slow):
+        # The rest (long decimals, exponent form, nan and inf) are formatted by
+        # numpy, which gives the same text as str()
+        text  = exact[slow].astype ("S32")
+        chars = text.view (np.uint8).reshape (len(slow), -1)
+        n_chr = np.char.str_len (text)
+        width = max (out.shape[1], int(n_chr.max()))
+        if width > out.shape[1]:
+            out = np.concatenate ((np.full ((len(out), width - out.shape[1]), ord (' '), dtype=np.uint8), out), axis=1)
+        cols = np.arange (chars.shape[1])
+        used = cols[None,:] < n_chr[:,None]
+        dest = np.full ((len(slow), width), ord (' '), dtype=np.uint8)
+        rows = np.broadcast_to (np.arange (len(slow))[:,None], used.shape)
+        dest[rows[used], (cols[None,:] + (width - n_chr)[:,None])[used]] = chars[used]
+        out[slow] = dest
+        length[slow] = n_chr
+    return (out, length)
+
+def _Constant (text):
+    return (np.frombuffer (text.encode ('ascii'), dtype=np.uint8))
+
+def _Pieces (msg, rows):
+    """ The pieces of the lines for samples rows of MsgColumns msg, each a
+    byte array the same for every line or a (matrix, lengths) pair """
+    pieces = [_Constant (msg.name + ","), FormatFloats (msg.Time()[rows].astype (np.float64))]
+    for f in msg.fields:
+        pieces.append (_Constant ("," + f + ","))
+        col = msg.Column (f)[rows]
+        pieces.append (FormatInts (col) if np.issubdtype (col.dtype, np.integer) else FormatFloats (col))
+    pieces.append (_Constant ("\n"))
+    return (pieces)
+
+def _Length (pieces, n):
+    length = np.zeros (n, dtype=np.int64)
+    for piece in pieces:
+        length += len(piece) if isinstance (piece, np.ndarray) else piece[1]
+    return (length)
+
+def _Scatter (buf, start, pieces):
+    """ Copy the pieces of lines starting at start into buf """
+    pos = start.copy()
+    for piece in pieces:
+        if isinstance (piece, np.ndarray):
+            buf[pos[:,None] + np.arange (len(piece))] = piece
+            pos += len(piece)
+        else:
+            chars, length = piece
+            width = chars.shape[1]
+            cols  = np.arange (width)
+            first = width - length                  # First used column of each row
+            valid = cols[None,:] >= first[:,None]
+            buf[(pos[:,None] + cols[None,:] - first[:,None])[valid]] = chars[valid]
+            pos += length
+
+def StoreLines (store, start, end):
+    """ Bytes of the lines for samples start to end of store, in the order
+    they were recorded """
+    kind = store.kind[start:end]
+    row  = store.row[start:end]
+    n    = end - start
+    length = np.zeros (n, dtype=np.int64)
+    parts  = []
+    for name, msg in store.columns.items():
+        at = np.flatnonzero (kind == ts.MSG_CODE[name])
+        if len(at) == 0:
+            continue
+        pieces = _Pieces (msg, row[at])
+        length[at] = _Length (pieces, len(at))
+        parts.append ((at, pieces))
+    other = []
+    for at in np.flatnonzero (kind == ts.OTHER_CODE).tolist():
+        text = store.other[row[at]].String()
+        if SKIP_NAME not in text:
+            text = (text + "\n").encode ('utf-8')
+            other.append ((at, text))
+            length[at] = len(text)
+    begin = np.concatenate (([0], np.cumsum (length)))
+    buf   = np.empty (int(begin[-1]), dtype=np.uint8)
+    for at, pieces in parts:
+        _Scatter (buf, begin[at], pieces)
+    for at, text in other:
+        buf[begin[at]:begin[at+1]] = np.frombuffer (text, dtype=np.uint8)
+    return (buf.tobytes())
+
+def WriteTrack (trk, fp, progress=None, done=0, total=None):
+    """ Write track trk to fp as Track.Write does. progress, if given, is
+    called with the number of lines written (counting from done) and total
+    after each chunk """
+    trk.WriteHeader (fp)
+    store = trk.store
+    total = store.count if total is None else total
+    text  = not hasattr (fp, "mode") or "b" not in fp.mode
+    for start in range (0, store.count, CHUNK_LINES):
+        end  = min (start + CHUNK_LINES, store.count)
+        data = StoreLines (store, start, end)
+        fp.write (data.decode ('utf-8') if text else data)
+        if progress:
+            progress (done + end, total)
+    return (done + store.count)
+
+def Counts (tracklist, n):
+    """ Number of samples in each of the first n tracks of tracklist, without
+    loading the tracks of a lazy list """
+    if hasattr (tracklist, "Counts"):
+        return (tracklist.Counts()[:n])
+    return ([trk.store.count for trk in tracklist[:n]])
+
+def WriteTracks (tracklist, fp, progress=None):
+    """ Write every track in tracklist to fp """
+    total = sum (Counts (tracklist, len(tracklist)))
+    done  = 0
+    for trk in tracklist:
+        done = WriteTrack (trk, fp, progress, done, total)
+
+
+class SaveThread (threading.Thread):
+    """ Saves the tracks in tracklist to filename (binary if it ends in
+    tb.EXTENSION) off the GUI thread. The tracks are taken from the list on the
+    thread, so a TrackIndex.LazyTrackList only parses a track when it comes to
+    be written, and if the list is of filename it is re-opened on the new file.
+    Tracks appended once the save has started are left out. progress goes
+    from 0 to 1, counting the samples loaded and then written, done is set at
+    the end and error holds any exception """
+    def __init__ (self, tracklist, filename):
+        super().__init__ (name="SaveThread", daemon=True)
+        self.tracklist = tracklist
+        self.filename  = filename
+        self.saved     = len(tracklist)
+        self.counts    = Counts (tracklist, self.saved)
+        self.total     = 2 * sum (self.counts)
+        self.lines     = 0      # Samples loaded and written so far
+        self.progress  = 0.0
+        self.done      = False
+        self.error     = None
+
+    def Progress (self, done, total):
+        self.progress = min (done / total, 1.0) if total else 1.0
+
+    def Load (self, index):
+        """ Track index of the list, parsed here if the list is lazy """
+        trk = self.tracklist[index]
+        # Counts from an index can be out by any malformed lines
+        self.total += 2 * (trk.store.count - self.counts[index])
+        self.lines += trk.store.count
+        self.Progress (self.lines, self.total)
+        return (trk)
+
+    def run (self):
+        temp = self.filename + TEMP_EXTENSION
+        try:
+            if self.filename.lower().endswith (tb.EXTENSION):
+                # The header, written first, says where every array goes so
+                # all the tracks are held until the end
+                tracks = [self.Load (i) for i in range (self.saved)]
+                start  = self.lines
+                left   = self.total - start
+                with open (temp, "wb") as fp:
+                    tb.WriteTracks (tracks, fp, lambda done, total: self.Progress (start + left * done / total, self.total))
+            else:
+                with open (temp, "w") as fp:
+                    for i in range (self.saved):
+                        self.lines = WriteTrack (self.Load (i), fp, self.Progress, self.lines, self.total)
+            self.Replace (temp)
+        except Exception as err:
+            self.error = err
+            if os.path.exists (temp):
+                os.remove (temp)
+        self.progress = 1.0
+        self.done     = True
+
+    def Replace (self, temp):
+        """ Move the saved file temp over filename """
+        source = getattr (self.tracklist, "filename", None)
+        if (hasattr (self.tracklist, "Replace") and os.path.exists (self.filename)
+                and os.path.samefile (source, self.filename)):
+            self.tracklist.Replace (temp, self.saved)
+        else:
+            os.replace (temp, self.filename)
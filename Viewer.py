@@ -18,6 +18,7 @@ from enum import Enum
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import StreamData as sd
+import SkeletonRenderer as sr
 #from OpenGL.GLUT import *
 
 import Player as pl
@@ -38,6 +39,8 @@ gl_stime     = 0
 gl_caldict   = {}
 gl_calibrate = False
 
+AXIS_LENGTH = 50    # Length of the x, y, z axes drawn on the floor
+
 
 class PlayerViewer ():
 
@@ -48,6 +51,11 @@ class PlayerViewer ():
         self.display     = display
         self.solid_floor = True
         self.grid_floor  = True
+        self.show_axes   = False
+        self.ground_min  = -500
+        self.ground_max  =  500
+        self.ground_lines = 10     # Grid lines each way
+        self.static      = {}      # Display lists of the static scene, name: (list, key)
         self.quadric     = gluNewQuadric()
         self.lbut        = False
         pg.display.set_mode (display, DOUBLEBUF | OPENGL )
@@ -56,6 +64,12 @@ class PlayerViewer ():
         glRotatef ( 0, 0, 0, 0 )
         # TEst code
         glEnable(GL_DEPTH_TEST)
+        # Instanced drawing of the players, immediate mode if the GL is too old
+        try:
+            self.renderer = sr.SkeletonRenderer()
+        except Exception as err:
+            print ("Drawing players in immediate mode:", err)
+            self.renderer = None
 
 
     #
@@ -63,6 +77,9 @@ class PlayerViewer ():
     #
     def DrawPlayer(self, index):
         player = self.players[index].body
+        if self.renderer:
+            self.renderer.DrawLines ([player])
+            return
         self.DrawSphere (player.root[0].offset + player.tran)
 
 
@@ -80,9 +97,20 @@ class PlayerViewer ():
 
     def DrawPlayerSolid (self, index):
         player = self.players[index].body
+        if self.renderer:
+            self.renderer.DrawSolid ([player])
+            return
 
         self.DrawRodSolid (player.root, player.tran)
 
+    def DrawPlayersSolid (self):
+        """ Every player, in one go with the renderer """
+        if self.renderer:
+            self.renderer.DrawSolid ([player.body for player in self.players])
+            return
+        for index in range (len(self.players)):
+            self.DrawPlayerSolid (index)
+
     def DrawRod (self, rod, prev_point):
         if rod == []:
             return
@@ -132,9 +160,32 @@ class PlayerViewer ():
         glDisable(GL_LIGHT0)
 
     def DrawGround (self):
-        max_g =  500
-        min_g = -500
-        diff   = 10
+        """ Floor and grid from a display list, compiled again only when
+        solid_floor, grid_floor, show_axes or the extents change """
+        key = (self.solid_floor, self.grid_floor, self.show_axes,
+               self.ground_min, self.ground_max, self.ground_lines)
+        self.DrawStatic ("ground", key, self.EmitGround)
+
+    def DrawStatic (self, name, key, emit):
+        """ Call the display list for the static scene part name, made by
+        emit() and kept until key changes """
+        list_id, old_key = self.static.get (name, (None, None))
+        if list_id is None or key != old_key:
+            if list_id is not None:
+                glDeleteLists (list_id, 1)
+            list_id = glGenLists (1)
+            glNewList (list_id, GL_COMPILE)
+            emit ()
+            glEndList ()
+            self.static[name] = (list_id, key)
+        glCallList (list_id)
+
+    def EmitGround (self):
+        """ GL calls for the floor, grid and axes, as DrawGround made every
+        frame before it was cached """
+        max_g = self.ground_max
+        min_g = self.ground_min
+        diff  = self.ground_lines
         del_g = max_g - min_g
 
         # Create filled floor if require
@@ -160,6 +211,18 @@ class PlayerViewer ():
 
             glEnd()
 
+        if self.show_axes:
+            glBegin(GL_LINES)
+            for axis in range (3):
+                colour = [0.0, 0.0, 0.0]
+                colour[axis] = 1.0
+                end = [0, 0.1, 0]
+                end[axis] += AXIS_LENGTH
+                glColor3fv (colour)
+                glVertex3fv ((0, 0.1, 0))
+                glVertex3fv (end)
+            glEnd()
+
     def DrawSphere (self, pos):
         glPushMatrix()
         glTranslatef(pos[0], pos[1], pos[2])
@@ -194,6 +257,12 @@ class PlayerViewer ():
                     gl_logfile = None
                 else:
                     gl_logfile = open('log.txt', 'w')
+            elif event.key == pg.K_f:   # Floor, grid and axes on and off
+                self.solid_floor = not self.solid_floor
+            elif event.key == pg.K_g:
+                self.grid_floor = not self.grid_floor
+            elif event.key == pg.K_a:
+                self.show_axes = not self.show_axes
             elif event.key == pg.K_c:   # Calibrate
                 gl_vstate = ViewStates.CALIBRATE
                 gl_stime = time.time()
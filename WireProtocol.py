@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Binary form of the garment messages decoded by Messages.translate_elem.
+A datagram is a 4 byte header followed by fixed size little-endian records:
+
+    header  magic  2 bytes  b"\\xb5\\x01" (0xb5 never starts UTF-8 text)
+            count  uint16   number of records
+    record  code   uint8    1 SQ, 2 SE, 3 SO, 4 CL, 5 AC
+            sensor uint8
+            spare  uint16
+            time   uint32   ms, as the second item of the text records
+            value  4 x float32  qw qx qy qz / x y z / cal in value[0]
+
+The records are read with np.frombuffer straight over the received bytes
+and split into columns, one set of arrays per message type, which go into a
+TrackStore with one Extend (DecodeInto), with no Python loop over the samples.
+Text datagrams are still decoded with translate_elem. Which form is used is
+set per connection, and a binary connection falls back to text for any
+datagram without the magic.
+"""
+
+import numpy as np
+import Messages as ms
+
+TEXT   = "text"
+BINARY = "binary"
+
+MAGIC  = b"\xb5\x01"
+HEADER = np.dtype ([("magic", "S2"), ("count", "<u2")])
+RECORD = np.dtype ([("code", "u1"), ("sensor", "u1"), ("spare", "<u2"),
+                    ("time", "<u4"), ("value", "<f4", (4,))])
+
+# Code: message name, text tag and the fields held in value
+CODES = {
+    1 : ("SA_BNO_QUA", "SQ", ("qw", "qx", "qy", "qz")),
+    2 : ("SA_EUL_ANG", "SE", ("angle_X", "angle_Y", "angle_Z")),
+    3 : ("SA_BNO_EUL", "SO", ("angle_x", "angle_y", "angle_z")),
+    4 : ("SA_BNO_CAL", "CL", ("cal",)),
+    5 : ("SA_ACC_LIN", "AC", ("acc_X", "acc_Y", "acc_Z")),
+    }
+MSG_CODE = {name:code for code, (name, tag, fields) in CODES.items()}
+TAG_CODE = {tag:code for code, (name, tag, fields) in CODES.items()}
+INT_FIELDS = ("cal",)
+KIND = np.full (256, ms.OTHER_CODE, dtype=np.uint8)     # TrackStore kind of each code
+for code, (name, tag, fields) in CODES.items():
+    KIND[code] = ms.MSG_CODE[name]
+
+
+def IsBinary (data):
+    return (data[:2] == MAGIC)
+
+def Records (data):
+    """ Structured array view of the records in a binary datagram, None if
+    the datagram is short or its count does not match its length """
+    if len(data) < HEADER.itemsize:
+        return (None)
+    head = np.frombuffer (data, dtype=HEADER, count=1)[0]
+    if head["magic"] != MAGIC or len(data) != HEADER.itemsize + int(head["count"]) * RECORD.itemsize:
+        return (None)
+    return (np.frombuffer (data, dtype=RECORD, offset=HEADER.itemsize))
+
+def DecodeColumns (data, errors=None):
+    """ The records of a binary datagram as TrackStore.Extend takes them: the
+    kind and row (within its type) of each record, in order, and a dict of
+    message name: (time in seconds, dict of "sensor" and field arrays). When
+    the datagram holds one message type the columns are views of data, else
+    each type is picked out with a mask on the code. None if the datagram is
+    bad, problems are counted in errors as for translate_elem """
+    rec = Records (data)
+    if rec is None:
+        ms.DecodeError (errors, "binary length", "Bad binary datagram, length ", len(data))
+        return (None)
+    code  = rec["code"]
+    kind  = KIND.take (code)
+    known = kind != ms.OTHER_CODE
+    if not known.all():
+        for c in code[~known].tolist():
+            ms.DecodeError (errors, "unknown", "Unknown record code: ", c)
+        rec, code, kind = rec[known], code[known], kind[known]
+    row     = np.empty (len(rec), dtype=np.uint32)
+    tim     = rec["time"] / 1000.
+    present = np.unique (code).tolist()
+    columns = {}
+    for c in present:
+        name, tag, fields = CODES[c]
+        sel   = slice (None) if len(present) == 1 else code == c
+        value = rec["value"][sel]
+        cols  = {"sensor":rec["sensor"][sel]}
+        for k, f in enumerate (fields):
+            cols[f] = value[:,k]
+        row[sel] = np.arange (len(value))
+        columns[name] = (tim[sel], cols)
+    return (kind, row, columns)
+
+def DecodeElements (data, errors=None):
+    """ Elements for a binary datagram in record order, as translate_elem
+    gives for text. Kept for code that takes Elements, DecodeColumns is the
+    way in for a TrackStore """
+    block = DecodeColumns (data, errors)
+    if block is None:
+        return ([])
+    kind, row, columns = block
+    made = {}
+    for name, (tim, cols) in columns.items():
+        fields = CODES[MSG_CODE[name]][2]
+        values = [cols[f].tolist() for f in fields]
+        made[ms.MSG_CODE[name]] = [ms.Element (name, t, dict (zip (("sensor",) + fields,
+                                   [sen] + [int(v) if f in INT_FIELDS else v for f, v in zip (fields, vals)])))
+                                   for t, sen, *vals in zip (tim.tolist(), cols["sensor"].tolist(), *values)]
+    return ([made[k][r] for k, r in zip (kind.tolist(), row.tolist())])
+
+def Decode (data, protocol=TEXT, errors=None):
+    """ Elements for a datagram received on a connection using protocol """
+    if protocol == BINARY and IsBinary (data):
+        return (DecodeElements (data, errors))
+    try:
+        buff = data.decode ('utf-8')
+    except UnicodeDecodeError:
+        ms.DecodeError (errors, "not text", "Datagram is not text")
+        return ([])
+    return (ms.translate_elem (buff, errors))
+
+def DecodeInto (store, data, protocol=TEXT, errors=None):
+    """ Add the samples of a datagram received on a connection using protocol
+    to the end of a TrackStore. Binary records go in as columns with one
+    Extend, text is decoded by translate_elem and appended Element by Element """
+    if protocol == BINARY and IsBinary (data):
+        block = DecodeColumns (data, errors)
+        if block is not None:
+            store.Extend (*block)
+        return
+    for ele in Decode (data, TEXT, errors):
+        store.Append (ele)
+
+def Encode (codes, sensors, times, values):
+    """ Binary datagram for arrays of codes, sensors, times (ms) and values
+    (N,4), the inverse of Records """
+    n   = len(codes)
+    out = np.zeros (n, dtype=RECORD)
+    out["code"]   = codes
+    out["sensor"] = sensors
+    out["time"]   = times
+    out["value"]  = values
+    head = np.array ([(MAGIC, n)], dtype=HEADER)
+    return (head.tobytes() + out.tobytes())
+
+def EncodeElements (elements):
+    """ Binary datagram holding a list of Elements of the known types """
+    elements = [elem for elem in elements if elem.name in MSG_CODE]
+    values = np.zeros ((len(elements), 4), dtype=np.float32)
+    codes  = []
+    for i, elem in enumerate (elements):
+        code = MSG_CODE[elem.name]
+        codes.append (code)
+        for k, f in enumerate (CODES[code][2]):
+            values[i,k] = elem.data[f]
+    return (Encode (codes, [elem.data["sensor"] for elem in elements],
+                    [round (elem.time * 1000.) for elem in elements], values))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of forward kinematics, Body.Update plus OutputPos one frame at a
+time against Kinematics.Skeleton working out all the frames at once. Every
+frame has an angle for every limb.
+
+    python benchmarks/bench_fk.py [frames]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import Player as pl
+import Kinematics as km
+
+
+def Run (frames=20000, legacy_frames=500):
+    """ Frames per second of both, returns a dict of the results """
+    body  = pl.Player ("Bench", "standard", 1.6).body
+    skel  = km.Skeleton (body)
+    rng   = np.random.default_rng (1)
+    limbs = {name:rng.uniform (-90.0, 90.0, (frames, 3)) for name in skel.names}
+
+    start = time.perf_counter()
+    skel.Pose (limbs, frames)
+    new = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range (legacy_frames):
+        body.Update ({name:ang[i] for name, ang in limbs.items()})
+        body.OutputPos()
+    old = time.perf_counter() - start
+
+    return ({"name":"fk", "joints":len(skel), "legacy_frames_per_s":legacy_frames / old,
+             "new_frames_per_s":frames / new, "speedup":(frames / new) / (legacy_frames / old)})
+
+
+if __name__ == '__main__':
+    result = Run (int (sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    for key, val in result.items():
+        print ("%-22s %s" % (key, val))
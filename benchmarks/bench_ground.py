@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Frame time of drawing the ground with and without the display list cache.
+A PlayerViewer window is opened and frames are drawn as mainUpdate draws
+them (clear, ground, player, flip), first with the ground sent vertex by
+vertex every frame (EmitGround) and then from the cached display list
+(DrawGround). glFinish is called before each frame is timed. Needs a display
+with OpenGL.
+
+    python benchmarks/bench_ground.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pygame as pg
+from OpenGL.GL import *
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import Player as pl
+import Viewer as vw
+
+
+def Frames (viewer, ground, count):
+    """ Frame times in seconds, ground() drawing the ground """
+    times = np.empty (count)
+    for i in range (count):
+        glFinish ()
+        start = time.perf_counter()
+        glClearColor (0.2, 0.2, 0.2, 0)
+        glClear (GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glLineWidth (1)
+        ground ()
+        glLineWidth (3)
+        viewer.DrawPlayerSolid (0)
+        glFinish ()
+        times[i] = time.perf_counter() - start
+        pg.display.flip()
+        pg.event.pump()
+    return (times)
+
+def Run (count=500, lines=10):
+    """ Mean and 95th percentile frame times in ms, ground drawn each frame
+    and cached. lines is the number of grid lines each way """
+    player = pl.Player ("Bench", "standard", 1.6)
+    viewer = vw.PlayerViewer ([player], (800, 800))
+    viewer.ground_lines = lines
+    res = {"name":"ground", "frames":count, "grid_lines":lines}
+    for key, ground in (("immediate", viewer.EmitGround), ("cached", viewer.DrawGround)):
+        times = Frames (viewer, ground, count) * 1000.0
+        res[key + "_mean_ms"] = float (times.mean())
+        res[key + "_p95_ms"]  = float (np.percentile (times, 95))
+    pg.quit()
+    return (res)
+
+
+if __name__ == '__main__':
+    for key, val in Run().items():
+        print ("%-22s %s" % (key, val))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of taking in garment data, end to end over UDP on this machine.
+GarmentSim streams to an ApparelConnection and a loop standing in for the
+GUI calls GetColumns every tick. Reported are the samples per second taken in,
+the share lost, the time GetColumns takes per sample and the latency from a
+sample's sensor time to it being handed to the GUI, which includes the
+datagram filling up, any jitter and the tick.
+
+    python benchmarks/bench_ingest.py [sensors] [rate] [text|binary]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import StreamData as sd
+import GarmentSim as gs
+import WireProtocol as wp
+
+
+def Run (sensors=15, rate=200., protocol=wp.TEXT, kinds=("SE",), records=15, loss=0.0,
+         jitter=0.0, duration=3.0, tick=0.01):
+    """ Stream for duration seconds, returns a dict of the results """
+    sim = gs.GarmentSim (0, sensors=sensors, rate=rate, kinds=kinds, records=records,
+                         loss=loss, jitter=jitter, protocol=protocol, seed=1)
+    sim.start()
+    con = sd.ApparelConnection ("Bench", "127.0.0.1", sim.port, 65535, protocol=protocol)
+    con.Connect()
+    count   = 0
+    busy    = 0.0
+    latency = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        time.sleep (tick)
+        start = time.perf_counter()
+        block = con.GetColumns()
+        now = time.perf_counter()
+        busy += now - start
+        if block is None:
+            continue
+        count += block.count
+        latency.append (now - (sim.t0 + block.Times()))
+    con.CloseConnect()
+    sim.Stop()
+    sent = sim.Stats()
+    link = con.LinkStats()
+    lat  = np.percentile (np.concatenate (latency), [50, 95, 99]) * 1000 if latency else [np.nan] * 3
+    return ({"name":"ingest", "protocol":protocol, "sensors":sensors, "rate":rate,
+             "offered_per_s":sent["records_per_s"], "elements_per_s":count / duration,
+             "lost_fraction":1 - count / max (sent["records"], 1),
+             "getdata_us_per_elem":1e6 * busy / max (count, 1),
+             "latency_p50_ms":lat[0], "latency_p95_ms":lat[1], "latency_p99_ms":lat[2],
+             "queue_dropped":con.QueueStats()["dropped"], "decode_errors":link["decode_errors"]})
+
+
+if __name__ == '__main__':
+    result = Run (int (sys.argv[1]) if len(sys.argv) > 1 else 15,
+                  float (sys.argv[2]) if len(sys.argv) > 2 else 200.,
+                  sys.argv[3] if len(sys.argv) > 3 else wp.TEXT)
+    for key, val in result.items():
+        print ("%-22s %s" % (key, val))
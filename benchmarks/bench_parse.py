@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of reading .sat track files. Compares TrackText, used by
+ReadTrackList, against the line by line reader it replaced, which is kept
+here as LegacyReadTrackList. The input is the Examples/testset.sat file
+repeated until it is the size asked for.
+
+    python benchmarks/bench_parse.py [MB]
+"""
+
+import io
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import StreamData as sd
+import Player as pl
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+
+
+class LegacyElement ():
+    """ Element as it was before TrackStore, a dict of the data of one line """
+    def __init__ (self, name, time, data_dict):
+        self.name      = name
+        self.time      = time
+        self.data_time = None
+        self.data      = data_dict
+
+    def Read (self, str_items):
+        length = len(str_items)
+        self.name = str_items [0]
+        self.time = float (str_items[1])
+        self.data = {}
+        for i in range (2, length, 2):
+            if (self.IsFloat(str_items[i])):
+                self.data[str_items[i]] = float (str_items[i+1])
+            elif (self.IsInt(str_items[i])):
+                self.data[str_items[i]] = int (str_items[i+1])
+            else:
+                print (str_items[i])
+                self.data[str_items[i]] = str_items[i+1]
+
+    def IsFloat (self, name):
+        fl_names = ["angle_X", "angle_Y", "angle_Z", "acc_X", "acc_Y", "acc_Z"]
+        return (name in fl_names)
+
+    def IsInt (self, name):
+        int_names = ["sensor"]
+        return (name in int_names)
+
+class LegacyTrack ():
+    """ Track as it was before TrackStore, the sequence a list of Elements """
+    def __init__ (self, name):
+        self.name        = name
+        self.t_len       = 0.0
+        self.start_time  = 0.0
+        self.sequence    = []
+        self.calibrate   = None
+        self.player      = None
+        self.sensor_dict = {}
+        self.annotate    = []
+
+    def SetTimeLen (self):
+        start_time_s = self.sequence[0].time
+        end_time_s   = self.sequence[-1].time
+        self.t_len = end_time_s - start_time_s
+        if self.t_len < 0.0 :
+            print ("Error, negative time for track length" )
+        for item in self.sequence:
+            item.time -= start_time_s
+
+def LegacyReadTrackList (fp):
+    """ The line by line reader ReadTrackList used before TrackText, an Element
+    is built for every line and appended to a list. A copy of the old code,
+    with its own Track and Element, so none of the newer code is timed """
+    tracklist = []
+    new_track = None
+    for line in fp:
+        items =  [x.strip() for x in line[:-1].split(',')]
+        if items[0] == "SA_Track":
+            if new_track:
+                new_track.SetTimeLen()
+                tracklist.append (new_track)
+            new_track = LegacyTrack (items[1])
+        elif (items[0] == "SA_Player"):
+            new_track.player = pl.Player (items[1], items[2], float(items[3]))
+        elif (items[0] == "SA_Calibrate"):
+            cal = {}
+            for i in range (1, len(items), 2):
+                xyz = items[i+1][1:-1].split()
+                cal[items[i]] = np.array ([float(xyz[0]), float(xyz[1]), float(xyz[2])])
+            new_track.calibrate = cal
+        elif (items[0] == "SA_SensorDict"):
+            for i in range (1,len(items), 2) :
+                new_track.sensor_dict[int(items[i])] = items[i+1]
+        elif (items[0] in ("SA_Time", "SA_Annotate")):
+            pass
+        else:
+            new_ele = LegacyElement (None, None, None)
+            new_ele.Read (items)
+            new_track.sequence.append (new_ele)
+    if (new_track):
+        new_track.SetTimeLen()
+        tracklist.append (new_track)
+    return (tracklist)
+
+def MakeText (mbytes):
+    """ Text of testset.sat repeated to about mbytes MB """
+    with open (TESTSET, "r") as fp:
+        text = fp.read()
+    repeat = max (1, int (mbytes * 1e6 / len(text)))
+    return (text * repeat)
+
+def Time (func, text, repeat):
+    best = None
+    for _ in range (repeat):
+        start = time.perf_counter()
+        tracks = func (io.StringIO (text))
+        took = time.perf_counter() - start
+        best = took if best is None else min (best, took)
+    return (best, tracks)
+
+def Run (mbytes=20.0, repeat=3):
+    """ Time both readers, returns a dict of the results """
+    text    = MakeText (mbytes)
+    samples = sum ([len(t.sequence) for t in sd.ReadTrackList (io.StringIO (text))])
+    new, _  = Time (sd.ReadTrackList, text, repeat)
+    old, _  = Time (LegacyReadTrackList, text, repeat)
+    return ({"name":"parse", "mbytes":len(text) / 1e6, "samples":samples,
+             "legacy_s":old, "new_s":new,
+             "legacy_samples_per_s":samples / old, "new_samples_per_s":samples / new,
+             "speedup":old / new})
+
+
+if __name__ == '__main__':
+    result = Run (float (sys.argv[1]) if len(sys.argv) > 1 else 20.0)
+    for key, val in result.items():
+        print ("%-22s %s" % (key, val))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the real-time graph buffers. Streams of SA_EUL_ANG elements are
+fed to a PlotView with four plots selected, and GetPlotData is called for
+each plot once a frame, as RTGraph does. Elements are routed one at a time
+(UpdatePlot) and a frame at a time (UpdatePlots). The string matching
+UpdatePlot and np.append PlotData used before are kept here (Legacy...),
+timed against the current ones and checked to give the same plot data.
+
+    python benchmarks/bench_plot.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import StreamData as sd
+
+SENSOR_DICT = {1:"Spine", 2:"RightUpperarm", 3:"RightLowerarm", 4:"LeftUpperarm", 5:"LeftLowerarm"}
+PLOTS = ["Spine_angle_X", "Spine_angle_Y", "RightUpperarm_angle_Z", "LeftLowerarm_angle_X"]
+
+
+class LegacyPlotData ():
+    """ PlotData as it was """
+    def __init__ (self, name, xwin):
+        self.name = name
+        self.x   = np.array ([])
+        self.y   = np.array ([])
+        self.timewin = xwin
+
+    def Append (self, x, y):
+        self.x = np.append (self.x, x)
+        self.y = np.append (self.y, y)
+        diff = self.x[-1] - self.x[0]
+        if (diff > self.timewin):
+            for i in range (0, len(self.x)):
+                if (self.x[-1] - self.x[i]) < self.timewin:
+                    break
+            self.x = self.x[i:]
+            self.y = self.y[i:]
+
+    def GetPlotData (self):
+        if len (self.x) > 0:
+            x = self.x - self.x[-1]
+            rx = x[(x > -5.0)]
+            ry = self.y[(x > -5.0)]
+        else:
+            x = np.array([0.])
+            rx = x
+            ry = x
+        return (rx, ry)
+
+def LegacyUpdatePlot (view, ele, selecteditems):
+    """ PlotView.UpdatePlot as it was """
+    if ele.name not in view.datanames:
+        return
+    for item in selecteditems:
+        ind = item.find('_')
+        if item[0:ind] ==  view.index[ele.data["sensor"]]:
+            if (item[ind+1:-2] == 'angle' and ele.name == 'SA_EUL_ANG') or (item[ind+1:-2] == 'acc'and ele.name == 'SA_ACC_LIN'):
+                for plot in view.plotlist:
+                    if plot.name == item:
+                        plot.Append (ele.time, ele.data[item[ind+1:]])
+
+def Stream (seconds, rate):
+    """ SA_EUL_ANG elements for every sensor at rate Hz """
+    rng  = np.random.default_rng (3)
+    out  = []
+    for i in range (int (seconds * rate)):
+        for sensor in SENSOR_DICT:
+            ang = rng.uniform (-180.0, 180.0, 3)
+            out.append (sd.Element ("SA_EUL_ANG", i / rate, {"sensor":sensor, "angle_X":ang[0],
+                                                              "angle_Y":ang[1], "angle_Z":ang[2]}))
+    return (out)
+
+def Replay (view, elements, frame, feed):
+    """ feed(view, elements) a frame at a time, getting the plot data after
+    each frame. Returns elements per second and the last plot data """
+    start = time.perf_counter()
+    for i in range (0, len(elements), frame):
+        feed (view, elements[i:i + frame])
+        data = [plot.GetPlotData() for plot in view.plotlist]
+    return (len(elements) / (time.perf_counter() - start), data)
+
+def Run (seconds=30.0, rate=200.0, fps=50.0):
+    """ Elements a second through the old and new plot routing and buffers """
+    elements = Stream (seconds, rate)
+    frame    = max (1, int (len(SENSOR_DICT) * rate / fps))
+    res = {"name":"plot", "elements":len(elements), "frame_elements":frame}
+
+    def Single (view, batch):
+        for ele in batch:
+            view.UpdatePlot (ele)
+
+    def Legacy (view, batch):
+        for ele in batch:
+            LegacyUpdatePlot (view, ele, PLOTS)
+
+    legacy = sd.PlotView (SENSOR_DICT)
+    legacy.plotlist = [LegacyPlotData (name, legacy.buffersize) for name in PLOTS]
+    res["legacy_elements_per_s"], old = Replay (legacy, elements, frame, Legacy)
+    for key, feed in (("elements_per_s", Single), ("batch_elements_per_s", sd.PlotView.UpdatePlots)):
+        view = sd.PlotView (SENSOR_DICT)
+        view.UpdatePlotList (PLOTS)
+        res[key], new = Replay (view, elements, frame, feed)
+        for (nx, ny), (ox, oy) in zip (new, old):
+            assert np.array_equal (nx, ox) and np.array_equal (ny, oy)
+    return (res)
+
+
+if __name__ == '__main__':
+    for key, val in Run().items():
+        print ("%-22s %s" % (key, val))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the rotation code. The np.matrix versions of RotationMat,
+Body.Update and ConvertToEarthCoord that were used before Rotation are kept
+here (Legacy...) and timed against the current ones, which they are also
+checked against.
+
+    python benchmarks/bench_rotation.py
+"""
+
+import os
+import sys
+import time
+import math as m
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import Player as pl
+import StreamData as sd
+import Rotation as rt
+
+
+def LegacyRotationMat (rotate_angles):
+    r_x = m.radians( rotate_angles[0] )
+    r_y = m.radians( rotate_angles[1] )
+    r_z = m.radians( rotate_angles[2] )
+    rot_z = np.matrix ([[m.cos(r_z), -m.sin(r_z), 0.], [m.sin(r_z), m.cos(r_z), 0.], [0., 0., 1.]])
+    rot_y = np.matrix ([[m.cos(r_y), 0., m.sin(r_y)], [0., 1., 0.], [-m.sin(r_y), 0., m.cos(r_y)]])
+    rot_x = np.matrix ([[1., 0., 0.], [0., m.cos(r_x), -m.sin(r_x)], [0, m.sin(r_x), m.cos(r_x)]])
+    return (rot_x * rot_y * rot_z)
+
+def LegacyUpdateRod (rod, updates, rot_prev, out):
+    if rod.name in updates:
+        rotm = LegacyRotationMat (updates[rod.name]) * rot_prev
+    else:
+        rotm = rot_prev
+    out[rod.name] = np.squeeze (np.array (rotm * rod.orig.reshape(3,1)))
+    for item in rod.next:
+        LegacyUpdateRod (item, updates, rotm, out)
+
+def LegacyBodyUpdate (body, updates):
+    """ Body.Update as it was, returns the rod offsets """
+    rotm = LegacyRotationMat (body.calibrate).T * LegacyRotationMat (body.rotate)
+    out  = {}
+    for limb in body.root:
+        LegacyUpdateRod (limb, updates, rotm, out)
+    return (out)
+
+def LegacyConvertToEarthCoord (sx, sy, sz, ang_x, ang_y, ang_z):
+    new_sx, new_sy, new_sz = np.array([]), np.array([]), np.array([])
+    for i in range (0, len(sx)):
+        vec = np.array([sx[i], sy[i], sz[i]]).reshape((3,1))
+        rot = LegacyRotationMat (np.array ([ang_x[i], ang_y[i], ang_z[i]]))
+        new_vec = rot.T * vec
+        new_sx = np.append (new_sx, new_vec[0])
+        new_sy = np.append (new_sy, new_vec[1])
+        new_sz = np.append (new_sz, new_vec[2])
+    return (new_sx, new_sy, new_sz)
+
+def Rate (func, count):
+    """ Calls of func(i) a second """
+    start = time.perf_counter()
+    for i in range (count):
+        func (i)
+    return (count / (time.perf_counter() - start))
+
+def Run (count=5000):
+    """ Calls a second of the old and new versions, returns a dict """
+    rng    = np.random.default_rng (1)
+    angles = rng.uniform (-180.0, 180.0, (count, 3))
+    body   = pl.Player ("Bench", "standard", 1.6).body
+    names  = [name for name, _ in body.OutputPos().items()]
+    frames = [{name:angles[(i + k) % count] for k, name in enumerate (names)} for i in range (count // 10)]
+    vec    = rng.normal (size=(count, 3))
+
+    # Check the new code gives the same answers
+    assert np.allclose (rt.EulerMatrix (angles[0]), LegacyRotationMat (angles[0]))
+    body.Update (frames[0])
+    old = LegacyBodyUpdate (body, frames[0])
+    assert all ([np.allclose (body.GetRod (name).offset, old[name]) for name in names])
+    new = sd.ConvertToEarthCoord (*vec.T, *angles.T)
+    assert np.allclose (np.stack (new, axis=1)[:100], np.stack (LegacyConvertToEarthCoord (*vec[:100].T, *angles[:100].T), axis=1))
+
+    res = {"name":"rotation"}
+    res["legacy_rotation_per_s"] = Rate (lambda i: LegacyRotationMat (angles[i]), count)
+    res["rotation_per_s"]        = Rate (lambda i: rt.EulerMatrix (angles[i]), count)
+    res["legacy_body_update_per_s"] = Rate (lambda i: LegacyBodyUpdate (body, frames[i]), len(frames))
+    res["body_update_per_s"]        = Rate (lambda i: body.Update (frames[i]), len(frames))
+    start = time.perf_counter()
+    LegacyConvertToEarthCoord (*vec.T, *angles.T)
+    res["legacy_earth_coord_per_s"] = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    sd.ConvertToEarthCoord (*vec.T, *angles.T)
+    res["earth_coord_per_s"] = count / (time.perf_counter() - start)
+    return (res)
+
+
+if __name__ == '__main__':
+    for key, val in Run().items():
+        print ("%-26s %s" % (key, val))
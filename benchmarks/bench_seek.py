@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the per frame cost of RecPlay playback. For tracks of 1k to 10M
+samples it times a playing frame (Play delivering the next 10 ms of samples)
+and a paused frame or slider seek (GetLastElemData at a random time), which
+should both be flat with track length. The scanning versions used before the
+binary search are timed as well, up to LEGACY_MAX samples.
+
+    python benchmarks/bench_seek.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import StreamData as sd
+import TrackStore as ts
+
+SIZES      = (1000, 10000, 100000, 1000000, 10000000)
+RATE       = 1000.0     # Samples a second in the test track
+FRAME      = 0.01       # Seconds of playback per frame
+LEGACY_MAX = 100000
+
+
+def MakeTrack (n):
+    """ Track of n SA_EUL_ANG samples at RATE, built straight into the store """
+    trk  = sd.Track ("Bench_%d" % n)
+    tim  = np.arange (n) / RATE
+    cols = {"sensor":np.arange (n) % 15, "angle_X":np.zeros (n), "angle_Y":np.zeros (n), "angle_Z":np.zeros (n)}
+    trk.store.Extend (np.full (n, ts.MSG_CODE["SA_EUL_ANG"]), np.arange (n), {"SA_EUL_ANG":(tim, cols)})
+    trk.SetTimeLen()
+    return (trk)
+
+def LegacyPlay (rp):
+    """ Forward scan that Play used before """
+    ret_data = []
+    for i in range (rp.cur_pos, len(rp.cur_track.sequence)):
+        delta = rp.cur_track.sequence[i].time - rp.cur_track.sequence[0].time
+        if delta < rp.cur_time:
+            ret_data.append (rp.cur_track.sequence[i])
+            rp.cur_pos = i
+        else:
+            break
+    return (ret_data)
+
+def LegacyGetLastElemData (rp, depth):
+    """ Scan from the start that GetLastElemData used before """
+    for i in range (0, len(rp.cur_track.sequence)):
+        delta = rp.cur_track.sequence[i].time - rp.cur_track.sequence[0].time
+        if delta > rp.cur_time:
+            break
+    end = i
+    return ([rp.cur_track.sequence[j] for j in range (max (0, end - depth), end)])
+
+def TimeFrames (rp, play, seek, frames):
+    """ Mean seconds per frame for playing and for seeking """
+    rng = np.random.default_rng (1)
+    t_start = rp.cur_track.t_len / 2
+    rp.cur_pos = rp.TimeIndex (t_start, "left")
+
+    start = time.perf_counter()
+    for k in range (frames):
+        rp.cur_time = t_start + (k + 1) * FRAME
+        rp.start_play_time = rp.clock() - rp.cur_time
+        play (rp)
+    t_play = (time.perf_counter() - start) / frames
+
+    seeks = rng.uniform (0.0, rp.cur_track.t_len, frames)
+    start = time.perf_counter()
+    for t in seeks:
+        rp.cur_time = t
+        seek (rp)
+    t_seek = (time.perf_counter() - start) / frames
+    return (t_play, t_seek)
+
+def Run (sizes=SIZES, frames=200):
+    """ Per frame times in microseconds for each track size """
+    results = []
+    for n in sizes:
+        rp = sd.RecPlay()
+        rp.cur_track = MakeTrack (n)
+        rp.state = sd.PlayState.PLAY
+        res = {"samples":n}
+        res["play_us"], res["seek_us"] = [1e6*t for t in TimeFrames (rp, lambda r: r.Play(),
+                                                                    lambda r: r.GetLastElemData (10), frames)]
+        if n <= LEGACY_MAX:
+            res["legacy_play_us"], res["legacy_seek_us"] = [1e6*t for t in TimeFrames (rp, LegacyPlay,
+                                                            lambda r: LegacyGetLastElemData (r, 10), 20)]
+        results.append (res)
+    return ({"name":"seek", "results":results})
+
+
+if __name__ == '__main__':
+    for res in Run()["results"]:
+        print ("  ".join (["%s %g" % (k, round (v, 1)) for k, v in res.items()]))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Compares two results files from benchmarks/suite.py, say from two commits.
+For every metric in both the change is shown as new / old, with a metric
+counted as better when it goes up if it is a rate (..._per_s) and when it
+goes down if it is a time (..._s, ..._ms, ..._us, with or without a track
+length after it). Other values, such as counts, are shown but not judged.
+Exits with 1 if any metric got worse by more than the threshold, so it can
+be used in a script.
+
+    python benchmarks/compare.py old.json new.json [--threshold 0.15]
+"""
+
+import argparse
+import json
+import re
+import sys
+
+RATE = re.compile (r"_per_s$")
+TIME = re.compile (r"_(s|ms|us)(_\d+)?$")
+
+
+def Direction (key):
+    """ 1 if bigger is better, -1 if smaller is better, 0 if neither """
+    if RATE.search (key):
+        return (1)
+    if TIME.search (key):
+        return (-1)
+    return (0)
+
+def Compare (old, new, threshold=0.15):
+    """ List of (stage, metric, old, new, ratio, verdict) for the metrics in
+    both, verdict being "better", "worse", "same" or "" when not judged """
+    rows = []
+    for stage, res in new["results"].items():
+        for key, val in res.items():
+            if key not in old["results"].get (stage, {}):
+                continue
+            was = old["results"][stage][key]
+            ratio = val / was if was else float ("nan")
+            sign  = Direction (key)
+            if sign == 0 or not was:
+                verdict = ""
+            elif (ratio - 1) * sign > threshold:
+                verdict = "better"
+            elif (ratio - 1) * sign < -threshold:
+                verdict = "worse"
+            else:
+                verdict = "same"
+            rows.append ((stage, key, was, val, ratio, verdict))
+    return (rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser (description="Compare two benchmark suite results files")
+    parser.add_argument ("old")
+    parser.add_argument ("new")
+    parser.add_argument ("--threshold", type=float, default=0.15, help="Change counted as better or worse")
+    args = parser.parse_args()
+
+    with open (args.old, "r") as fp:
+        old = json.load (fp)
+    with open (args.new, "r") as fp:
+        new = json.load (fp)
+    for key in ("commit", "date", "python", "numpy", "machine", "scale"):
+        print ("%-10s %-24s %s" % (key, old.get (key), new.get (key)))
+        if key == "scale" and old.get (key) != new.get (key):
+            print ("Warning, the results are at different scales")
+    print ()
+    rows = Compare (old, new, args.threshold)
+    for stage, key, was, val, ratio, verdict in rows:
+        print ("%-10s %-28s %14.6g %14.6g %7.2fx  %s" % (stage, key, was, val, ratio, verdict))
+    worse = [row for row in rows if row[5] == "worse"]
+    print ("\n%d better, %d worse of %d compared" % (len([r for r in rows if r[5] == "better"]), len(worse), len(rows)))
+    sys.exit (1 if worse else 0)
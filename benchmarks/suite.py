@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite over the hot paths, run headless on synthetic data so two
+commits can be compared. The input is the four MotionGenerator
+motions written scale times over into one .sat text, and a track of the
+motion samples repeated end to end for the larger sizes. Measured are:
+    read      - ReadTrackList samples and MB a second
+    write     - Track.Write lines a second
+    fk        - Body.Update and Track.PosData frames a second
+    playback  - RecPlay.Play and GetLastElemData us a frame against track length
+    plot      - PlotView.UpdatePlot and UpdatePlots elements a second
+    translate - translate_elem datagrams and elements a second
+Results go to a JSON file, benchmarks/results/<commit>.json unless named,
+with the commit and machine they came from, for benchmarks/compare.py.
+
+    python benchmarks/suite.py [--scale 20] [--out results.json] [--only read write ...]
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+import StreamData as sd
+import TrackStore as ts
+import MotionGenerator as mg
+import Kinematics as km
+import bench_seek
+import bench_plot
+
+ROOT    = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..")
+RESULTS = os.path.join (os.path.dirname (os.path.abspath (__file__)), "results")
+MOTIONS = mg.MOTIONS
+SIZES   = (1000, 10000, 100000, 1000000)   # Samples in the playback tracks
+PLOTS   = ["Spine_angle_X", "RightLowerarm_angle_X", "RightKnee_angle_X", "LeftUpperarm_angle_Y"]
+RECORDS = 15    # Records in each datagram for translate
+STAGES  = ("read", "write", "fk", "playback", "plot", "translate")
+
+
+def Dataset (scale=20, t_step=0.02, period=10.):
+    """ Text of a .sat file with each of MOTIONS scale times over """
+    fp = io.StringIO()
+    for k in range (scale):
+        for name in MOTIONS:
+            getattr (mg, name) (period, t_step).Write (fp, name)
+    return (fp.getvalue())
+
+def LongTrack (tracks, n):
+    """ Track of n SA_EUL_ANG samples, the samples of tracks end to end and
+    repeated, so times keep going up """
+    tim, cols = [], {"sensor":[], "angle_X":[], "angle_Y":[], "angle_Z":[]}
+    offset = 0.0
+    for trk in tracks:
+        msg = trk.store.columns["SA_EUL_ANG"]
+        if msg.count == 0:
+            continue
+        tim.append (msg.Time() + offset)
+        offset = tim[-1][-1] + 0.02
+        for f in cols:
+            cols[f].append (msg.Column (f))
+    tim  = np.concatenate (tim)
+    cols = {f:np.concatenate (v) for f, v in cols.items()}
+    reps = -(-n // len(tim))
+    span = tim[-1] + 0.02
+    tim  = (tim[None,:] + span * np.arange (reps)[:,None]).ravel()[:n]
+    cols = {f:np.tile (v, reps)[:n] for f, v in cols.items()}
+    trk = sd.Track ("Suite_%d" % n)
+    trk.sensor_dict = tracks[0].sensor_dict.copy()
+    trk.store.Extend (np.full (n, ts.MSG_CODE["SA_EUL_ANG"]), np.arange (n), {"SA_EUL_ANG":(tim, cols)})
+    trk.SetTimeLen()
+    return (trk)
+
+def SampleRate (tracks):
+    """ Samples a second over all of tracks """
+    return (sum ([len(t.sequence) for t in tracks]) / max (sum ([t.t_len for t in tracks]), 1e-3))
+
+def Best (func, repeat):
+    """ Shortest time of repeat calls of func, and its last result """
+    best = None
+    for _ in range (repeat):
+        start = time.perf_counter()
+        out = func ()
+        took = time.perf_counter() - start
+        best = took if best is None else min (best, took)
+    return (best, out)
+
+def Read (text, repeat=3):
+    took, tracks = Best (lambda: sd.ReadTrackList (io.StringIO (text)), repeat)
+    samples = sum ([len(trk.sequence) for trk in tracks])
+    return ({"tracks":len(tracks), "samples":samples, "read_s":took,
+             "read_samples_per_s":samples / took, "read_mbytes_per_s":len(text) / 1e6 / took})
+
+def Write (tracks, repeat=3):
+    def WriteAll ():
+        fp = io.StringIO()
+        for trk in tracks:
+            trk.Write (fp)
+        return (fp.getvalue())
+    took, text = Best (WriteAll, repeat)
+    lines = text.count ("\n")
+    return ({"lines":lines, "write_s":took, "write_lines_per_s":lines / took})
+
+def FK (tracks, frames=5000):
+    """ Body.Update a frame at a time with every limb's latest angle, and
+    PosData of one limb over every track """
+    trk   = max (tracks, key=lambda t: len(t.sequence))
+    body  = trk.player.body
+    times = trk.store.columns["SA_EUL_ANG"].Time()[:frames]
+    limbs = {limb:np.nan_to_num (ang) for limb, ang in km.TrackAngles (trk, times).items()}
+    start = time.perf_counter()
+    for i in range (len(times)):
+        body.Update ({limb:ang[i] for limb, ang in limbs.items()})
+    update = len(times) / (time.perf_counter() - start)
+
+    count = 0
+    start = time.perf_counter()
+    for trk in tracks:
+        count += len (trk.PosData ("RightLowerarm")[0])
+    return ({"body_update_frames_per_s":update, "posdata_frames":count,
+             "posdata_frames_per_s":count / (time.perf_counter() - start)})
+
+def Playback (tracks, sizes=SIZES, frames=200):
+    """ us a frame playing and seeking, for each track length """
+    res = {}
+    for n in sizes:
+        rp = sd.RecPlay()
+        rp.cur_track = LongTrack (tracks, n)
+        rp.state = sd.PlayState.PLAY
+        res["play_us_%d" % n], res["seek_us_%d" % n] = [1e6*t for t in bench_seek.TimeFrames (rp,
+                                    lambda r: r.Play(), lambda r: r.GetLastElemData (10), frames)]
+    return (res)
+
+def Plot (tracks, seconds=60., fps=50.):
+    """ Elements a second into a PlotView with PLOTS selected, one at a time
+    and a frame at a time """
+    rate = SampleRate (tracks)
+    trk  = LongTrack (tracks, int (seconds * rate))
+    elements = trk.store.Elements (0, len(trk.sequence))
+    frame = max (1, int (rate / fps))
+
+    def Single (view, batch):
+        for ele in batch:
+            view.UpdatePlot (ele)
+
+    res = {"plot_elements":len(elements)}
+    for key, feed in (("plot_elements_per_s", Single), ("plot_batch_elements_per_s", sd.PlotView.UpdatePlots)):
+        view = sd.PlotView (trk.sensor_dict)
+        view.UpdatePlotList (PLOTS)
+        res[key], _ = bench_plot.Replay (view, elements, frame, feed)
+    return (res)
+
+def Translate (tracks, seconds=60., records=RECORDS):
+    """ Datagrams and elements a second through translate_elem, for the
+    samples of tracks as SE text records """
+    rate = SampleRate (tracks)
+    trk  = LongTrack (tracks, int (seconds * rate))
+    cols = trk.store.columns["SA_EUL_ANG"]
+    recs = ["SE,%d,%d,%.4f,%.4f,%.4f;" % row for row in zip (cols.Column ("sensor").tolist(),
+            np.round (cols.Time() * 1000.).astype (np.int64).tolist(), cols.Column ("angle_X").tolist(),
+            cols.Column ("angle_Y").tolist(), cols.Column ("angle_Z").tolist())]
+    datagrams = ["".join (recs[i:i + records]) for i in range (0, len(recs), records)]
+    count = 0
+    start = time.perf_counter()
+    for data in datagrams:
+        count += len (sd.translate_elem (data))
+    took = time.perf_counter() - start
+    return ({"datagrams":len(datagrams), "translate_datagrams_per_s":len(datagrams) / took,
+             "translate_elements_per_s":count / took})
+
+def Commit ():
+    """ Short hash of the commit being benchmarked, with + if there are changes """
+    try:
+        head  = subprocess.run (["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run (["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return (None)
+    return ((head + "+" if dirty else head) or None)
+
+def Run (scale=20, t_step=0.02, stages=STAGES, sizes=SIZES):
+    """ Run the stages asked for, returns a dict of the settings, where it ran
+    and the results of each stage """
+    text   = Dataset (scale, t_step)
+    tracks = sd.ReadTrackList (io.StringIO (text))
+    out = {"commit":Commit(), "date":datetime.datetime.now().isoformat (timespec="seconds"),
+           "python":platform.python_version(), "numpy":np.__version__, "machine":platform.machine(),
+           "processor":platform.processor(), "scale":scale, "t_step":t_step, "mbytes":len(text) / 1e6,
+           "results":{}}
+    funcs = {"read":lambda: Read (text), "write":lambda: Write (tracks), "fk":lambda: FK (tracks),
+             "playback":lambda: Playback (tracks, sizes), "plot":lambda: Plot (tracks),
+             "translate":lambda: Translate (tracks)}
+    for stage in stages:
+        out["results"][stage] = funcs[stage]()
+    return (out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser (description="Run the benchmark suite and save the results as JSON")
+    parser.add_argument ("--scale", type=int, default=20, help="Times over the motions are written")
+    parser.add_argument ("--t-step", type=float, default=0.02, help="Seconds between motion samples")
+    parser.add_argument ("--sizes", type=int, nargs="+", default=list (SIZES), help="Playback track lengths")
+    parser.add_argument ("--only", nargs="+", choices=STAGES, default=list (STAGES))
+    parser.add_argument ("--out", help="JSON file for the results, results/<commit>.json by default")
+    args = parser.parse_args()
+
+    result = Run (args.scale, args.t_step, args.only, args.sizes)
+    for stage, res in result["results"].items():
+        for key, val in res.items():
+            print ("%-10s %-28s %s" % (stage, key, val))
+    filename = args.out or os.path.join (RESULTS, "%s.json" % (result["commit"] or "unknown"))
+    os.makedirs (os.path.dirname (os.path.abspath (filename)), exist_ok=True)
+    with open (filename, "w") as fp:
+        json.dump (result, fp, indent=1)
+    print ("Saved", filename)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+The modules are imported from the top of the repository, as the programs do
+"""
+
+import os
+import sys
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of rendering tracks without a display in HeadlessRender
+"""
+
+import os
+import numpy as np
+import StreamData as sd
+import HeadlessRender as hr
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+SIZE    = (80, 60)
+FPS     = 10.0
+
+
+def Track (index=3):
+    return (sd.ReadTrackList (open (TESTSET, "r"))[index])
+
+def Figure (image, renderer):
+    """ Pixels that differ from the background, i.e. those of the figure """
+    return (np.count_nonzero ((image != renderer.background).any (axis=2)))
+
+
+def test_frame_draws_figure ():
+    renderer = hr.SoftwareRenderer (SIZE)
+    assert renderer.background.shape == (SIZE[1], SIZE[0], 3)
+    assert (renderer.background == hr.BACKGROUND).all (axis=2).any()
+    times, start, end, joints = hr.TrackFigure (Track(), FPS)
+    image = renderer.Frame (start[0], end[0], joints[0])
+    assert Figure (image, renderer) > 20
+    assert (image == hr.JOINT_COLOUR).all (axis=2).any()
+
+def test_render_track (tmp_path):
+    track = Track()
+    _, times = track.store.TimeOrder()
+    frames = int (np.ceil ((times[-1] - times[0]) * FPS))
+    raw = str (tmp_path / "track.raw")
+    assert hr.RenderTrack (track, raw, FPS, SIZE, workers=1) == frames
+    video = np.fromfile (raw, dtype=np.uint8).reshape (frames, SIZE[1], SIZE[0], 3)
+    renderer = hr.SoftwareRenderer (SIZE)
+    assert all (Figure (image, renderer) > 20 for image in video[::7])
+    assert np.array_equal (video, hr.RenderFrames (track, FPS, SIZE))
+    folder = str (tmp_path / "frames")
+    assert hr.RenderTrack (track, folder, FPS, SIZE, workers=1) == frames
+    assert len(os.listdir (folder)) == frames
+
+def test_thumbnail_strip (tmp_path):
+    filename = str (tmp_path / "thumbs.png")
+    strip = hr.ThumbnailStrip (Track(), filename, count=4, size=SIZE, shrink=2)
+    assert strip.shape == (SIZE[1] // 2, 4 * SIZE[0] // 2, 3)
+    assert open (filename, "rb").read (8) == b"\x89PNG\r\n\x1a\n"
+    for thumb in np.split (strip, 4, axis=1):
+        assert len(np.unique (thumb.reshape (-1, 3), axis=0)) > 3
+
+def test_range_in_time_order ():
+    track = Track()
+    mixed = sd.Track (track.name)
+    mixed.sensor_dict = dict (track.sensor_dict)
+    order = list (range (len(track.sequence)))
+    order[0], order[-1] = order[-1], order[0]      # Last sample recorded first
+    for i in order:
+        mixed.sequence.append (track.sequence[i])
+    times = hr.TrackFigure (mixed, FPS)[0]
+    assert np.allclose (times, hr.TrackFigure (track, FPS)[0])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batched forward kinematics on tracks whose samples were not
+recorded in time order
+"""
+
+import os
+import numpy as np
+import StreamData as sd
+import Kinematics as km
+import Player as pl
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+
+
+def Shuffled (track, seed=1):
+    """ Copy of track with its samples recorded in a random order """
+    out = sd.Track (track.name)
+    out.sensor_dict = dict (track.sensor_dict)
+    out.player      = track.player
+    for i in np.random.default_rng (seed).permutation (len(track.sequence)).tolist():
+        out.sequence.append (track.sequence[i])
+    return (out)
+
+
+def test_track_angles_out_of_order ():
+    track = sd.ReadTrackList (open (TESTSET, "r"))[2]
+    mixed = Shuffled (track)
+    times = np.linspace (-0.1, track.t_len + 0.1, 57)
+    want  = km.TrackAngles (track, times)
+    got   = km.TrackAngles (mixed, times)
+    assert want.keys() == got.keys()
+    for limb in want:
+        assert np.allclose (want[limb], got[limb], equal_nan=True)
+
+def test_poses_in_time_order ():
+    track = sd.ReadTrackList (open (TESTSET, "r"))[2]
+    mixed = Shuffled (track)
+    times, names, pos = track.Poses (body=pl.Body ("standard", 1.6))
+    mixed_times, mixed_names, mixed_pos = mixed.Poses (body=pl.Body ("standard", 1.6))
+    assert (np.diff (mixed_times) >= 0).all()
+    assert np.array_equal (np.sort (times), mixed_times) and names == mixed_names
+    want = track.Poses (np.sort (times), pl.Body ("standard", 1.6))[2]
+    assert np.allclose (mixed_pos, want)
+    assert (np.diff (mixed.PosData ("RightLowerarm")[0]) >= 0).all()
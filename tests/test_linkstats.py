@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the stream counters in LinkStats
+"""
+
+import time
+import StreamData as sd
+import LinkStats as ls
+
+
+def Feed (stats, start, seconds, rate=100.):
+    """ Packets of one SA_EUL_ANG sample of sensor 2 at rate from start """
+    n = int (seconds * rate)
+    for k in range (n):
+        arrival = start + k / rate
+        stats.Packet (arrival, 40)
+        stats.Elements (arrival, [sd.Element ("SA_EUL_ANG", k / rate, {"sensor":2})])
+    return (start + (n - 1) / rate)
+
+
+def test_rates_go_stale ():
+    stats = ls.LinkStats()
+    last  = Feed (stats, time.perf_counter() - 2.5, 2.5)
+    stream = stats.streams[("SA_EUL_ANG", 2)]
+    assert abs (stream.Rate (last) - 100.) < 2.
+    assert abs (stats.Stats()["streams"][("SA_EUL_ANG", 2)]["rate"] - 100.) < 2.
+    assert "S2 100Hz" in stats.Summary ("Jacket")
+    # The stream stops, its rate goes to 0 with that of the connection
+    later = last + 2 * ls.RATE_WINDOW
+    assert stream.Rate (later) == 0.0 and stats.Stale (later)
+    assert stream.rate > 0.0                        # Last measured, kept
+    stats.last = stream.last = time.perf_counter() - 2 * ls.RATE_WINDOW
+    assert stats.Stats()["streams"][("SA_EUL_ANG", 2)]["rate"] == 0.0
+    assert "S2 0Hz" in stats.Summary ("Jacket")
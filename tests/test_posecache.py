@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the keyframes of PoseCache against the pose built up by Body.Update
+"""
+
+import os
+import numpy as np
+import StreamData as sd
+import PoseCache as pc
+import Player as pl
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+
+
+def Reference (cache, track, cur_time):
+    """ Joint positions at cur_time from a Body updated with the cache's limb
+    state, in the order of the cache's skeleton """
+    body = pl.Body ("standard", 1.6)
+    body.Update (cache.LimbState (cur_time, track.sensor_dict))
+    out = body.OutputPos()
+    return (np.array ([np.ravel (out[name]) for name in cache.skeleton.names]))
+
+
+def test_positions_match_body ():
+    track = sd.ReadTrackList (open (TESTSET, "r"))[0]
+    cache = pc.PoseCache (track, 0.1, pl.Body ("standard", 1.6))
+    assert cache.key_pos.shape == (len(cache.key_time), len(cache.skeleton), 3)
+    assert np.ptp (cache.key_pos, axis=0).max() > 1.0        # The body moves
+    for cur_time in (0.0, 0.3, 1.25, 4.0, 4.05, track.t_len):
+        assert np.allclose (cache.Positions (cur_time), Reference (cache, track, cur_time))
+
+def test_no_body ():
+    track = sd.ReadTrackList (open (TESTSET, "r"))[1]
+    cache = pc.PoseCache (track, 0.1)
+    assert cache.key_pos is None and cache.Positions (1.0) is None
+    rp = sd.RecPlay()
+    rp.cur_track = track
+    rp.cur_time  = 1.0
+    names, pos = rp.GetPosePositions (pl.Body ("standard", 1.6))
+    assert len(names) == len(pos)
+    assert rp.pose_cache.body is not None
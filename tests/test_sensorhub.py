@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the SensorHub event loop against simulated garments on this machine
+"""
+
+import time
+import StreamData as sd
+import SensorHub as sh
+import GarmentSim as gs
+import WireProtocol as wp
+
+TIMEOUT = 5.0
+
+
+def Wait (test, timeout=TIMEOUT):
+    """ Poll test until it is true or timeout seconds have gone """
+    end = time.perf_counter() + timeout
+    while not test():
+        if time.perf_counter() > end:
+            return (False)
+        time.sleep (0.02)
+    return (True)
+
+def Garments ():
+    """ Two garments, each with its own sensors and wire protocol """
+    jacket   = gs.GarmentSim (0, sensors=[2, 3], rate=200., records=4, seed=1)
+    trousers = gs.GarmentSim (0, sensors=[11, 12, 13], rate=200., records=6, protocol=wp.BINARY, seed=2)
+    jacket.start()
+    trousers.start()
+    return (jacket, trousers)
+
+
+def test_garments_kept_apart ():
+    jacket, trousers = Garments()
+    hub = sh.SensorHub()
+    try:
+        hub.AddConTCP ("Jacket", "127.0.0.1", jacket.port, 65535)
+        hub.AddConTCP ("Trousers", "127.0.0.1", trousers.port, 65535, protocol=wp.BINARY)
+        hub.Connect()
+        hub.StreamData()
+        assert Wait (lambda: all (item.status == sd.ConStatus.STREAMING for item in hub.sensoritems.values()))
+        sensors = set()
+        def Read ():
+            block = hub.ReadColumns()
+            times = block.Times()
+            assert (times[1:] >= times[:-1]).all()      # Garments merged in time order
+            sensors.update (ele.data["sensor"] for ele in block.Latest())
+            return (sensors == {2, 3, 11, 12, 13})
+        assert Wait (Read)
+        links = hub.LinkStats()
+        assert {sensor for name, sensor in links["Jacket"]["streams"]} == {2, 3}
+        assert {sensor for name, sensor in links["Trousers"]["streams"]} == {11, 12, 13}
+        assert links["Jacket"]["decode_errors"] == 0 and links["Trousers"]["decode_errors"] == 0
+    finally:
+        hub.Stop()
+        jacket.Stop()
+        trousers.Stop()
+
+def test_full_queue_drops_oldest ():
+    jacket, trousers = Garments()
+    hub = sh.SensorHub()
+    try:
+        hub.AddConTCP ("Jacket", "127.0.0.1", jacket.port, 65535, queue_depth=3)
+        hub.AddConTCP ("Trousers", "127.0.0.1", trousers.port, 65535, protocol=wp.BINARY)
+        hub.Connect()
+        hub.StreamData()
+        # Nothing is read, so the small queue fills and then drops
+        assert Wait (lambda: hub.QueueStats()["Jacket"]["dropped"] >= 5)
+        hub.StreamClose()
+        time.sleep (0.1)
+        stats = hub.QueueStats()
+        jack  = stats["Jacket"]
+        assert jack["depth"] == 3 and jack["max_depth"] == 3
+        assert jack["dropped"] == jack["received"] - 3
+        assert stats["Trousers"]["dropped"] == 0
+        block = hub.sensoritems["Jacket"].GetColumns()
+        assert block.count == 3 * 4                         # Only the newest datagrams are left
+    finally:
+        hub.Stop()
+        jacket.Stop()
+        trousers.Stop()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lazily loaded track list in TrackIndex, mostly saving over the
+file it has mapped
+"""
+
+import os
+import shutil
+import numpy as np
+import StreamData as sd
+import TrackIndex as ti
+import TrackWriter as tw
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+
+
+def Copy (tmp_path, name="tracks.sat"):
+    filename = str (tmp_path / name)
+    shutil.copy (TESTSET, filename)
+    return (filename)
+
+def Samples (track):
+    """ Times and columns of the SA_EUL_ANG samples of track """
+    msg = track.store.columns["SA_EUL_ANG"]
+    return ([msg.Time()] + [msg.Column (f) for f in msg.fields])
+
+def Same (a, b):
+    assert a.name == b.name
+    for x, y in zip (Samples (a), Samples (b)):
+        assert np.allclose (x, y)
+
+
+def test_save_over_mapped_file (tmp_path):
+    filename = Copy (tmp_path)
+    tracks = ti.LazyTrackList (filename, budget=1)    # Only the last track used stays parsed
+    before = [tracks[i] for i in range (len(tracks))]
+    assert len(tracks.loaded) == 1
+
+    save = tw.SaveThread (tracks, filename)
+    save.start()
+    # Tracks keep being read, and evicted, while the file is saved over
+    while not save.done:
+        for i in range (len(tracks)):
+            tracks[i]
+    save.join()
+    assert save.error is None
+    assert not os.path.exists (filename + tw.TEMP_EXTENSION)
+
+    assert len(tracks) == len(before)
+    assert len(tracks.data) == os.path.getsize (filename)
+    assert ti.ReadIndex (filename) is not None
+    for i, trk in enumerate (before):
+        Same (tracks[i], trk)
+
+def test_save_keeps_appended_tracks (tmp_path):
+    filename = Copy (tmp_path)
+    tracks = ti.LazyTrackList (filename)
+    n = len(tracks)
+    tracks.append (sd.ReadTrackList (open (TESTSET, "r"))[0])
+    save = tw.SaveThread (tracks, filename)
+    tracks.append (sd.ReadTrackList (open (TESTSET, "r"))[1])     # After the save started
+    save.run()
+    assert save.error is None
+    assert len(tracks.entries) == n + 1
+    assert len(tracks.extra) == 1
+    Same (tracks[n], tracks[0])
+    assert tracks[n + 1] is tracks.extra[0]
+
+def test_save_elsewhere_leaves_list (tmp_path):
+    filename = Copy (tmp_path)
+    tracks = ti.LazyTrackList (filename)
+    data   = tracks.data
+    save = tw.SaveThread (tracks, str (tmp_path / "other.sat"))
+    save.run()
+    assert save.error is None
+    assert tracks.data is data
+    assert len(sd.ReadTrackList (open (tmp_path / "other.sat", "r"))) == len(tracks)
+
+def test_load_closes_previous_list (tmp_path):
+    rp = sd.RecPlay()
+    rp.LoadTracklist (Copy (tmp_path, "one.sat"))
+    first = rp.track_list
+    track = first[0]
+    rp.LoadTracklist (Copy (tmp_path, "two.sat"))
+    assert first.data is None
+    assert len(track.sequence) > 0
+
+def test_save_loads_tracks_on_thread (tmp_path):
+    tracks = ti.LazyTrackList (Copy (tmp_path), budget=1)
+    for name in ("other.sat", "other.sab"):
+        save = tw.SaveThread (tracks, str (tmp_path / name))
+        assert len(tracks.loaded) == 0
+        steps = []
+        save.Progress = lambda done, total: steps.append (done / total)
+        save.run()
+        assert save.error is None
+        assert steps == sorted (steps) and len(steps) > len(tracks)
+        assert abs (steps[-1] - 1.0) < 1e-9
+        tracks.loaded.clear()
+
+def test_write_counts_without_loading (tmp_path):
+    tracks = ti.LazyTrackList (Copy (tmp_path), budget=1)
+    loads  = []
+    Load   = tracks.Load
+    tracks.Load = lambda index: loads.append (index) or Load (index)
+    steps  = []
+    with open (tmp_path / "out.sat", "w") as fp:
+        tw.WriteTracks (tracks, fp, lambda done, total: steps.append (done / total))
+    assert sorted (loads) == list (range (len(tracks)))     # Each parsed once, to be written
+    assert abs (steps[-1] - 1.0) < 1e-9
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the TrackStore and SequenceView compatibility layer against the
+list of Elements a Track used to hold
+"""
+
+import os
+import subprocess
+import sys
+import pytest
+import numpy as np
+import Messages as ms
+import StreamData as sd
+import TrackStore as ts
+
+ROOT    = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..")
+RECORDS = ("SE,2,30,1.5,2.5,3.5;SQ,3,10,1,0,0,0;SE,3,20,-1,-2,-3;CL,2,20,3;"
+           "AC,4,25,0.1,0.2,0.3;SO,5,15,10,20,30;SE,2,10,4,5,6;")
+
+
+def Legacy ():
+    """ List of Elements, of every known type and one unknown, not in time order """
+    elements = ms.translate_elem (RECORDS)
+    elements.insert (3, ms.Element ("SA_MARKER", 0.018, {"sensor":9, "label":"start"}))
+    return (elements)
+
+def Key (ele):
+    """ What an Element holds, values at the float32 they are stored at """
+    return ((ele.name, ele.time, sorted ((k, float (np.float32 (v)) if k != "label" else v) for k, v in ele.data.items())))
+
+def Filled (elements):
+    track = sd.Track ("Test")
+    for ele in elements:
+        track.sequence.append (ele)
+    return (track)
+
+
+def test_names_shared ():
+    assert sd.Element is ms.Element and sd.translate_elem is ms.translate_elem
+    assert ts.MSG_CODE is ms.MSG_CODE and ts.OTHER_CODE == ms.OTHER_CODE
+
+def test_import_alone ():
+    """ Modules StreamData uses can be imported first, there being no cycle """
+    for name in ("Messages", "TrackStore", "WireProtocol"):
+        run = subprocess.run ([sys.executable, "-c", "import " + name], cwd=ROOT, capture_output=True)
+        assert run.returncode == 0, run.stderr
+
+def test_sequence_like_list ():
+    legacy = Legacy()
+    seq = Filled (legacy).sequence
+    assert len(seq) == len(legacy)
+    assert [Key (e) for e in seq] == [Key (e) for e in legacy]
+    for i in (0, 3, -1, -len(legacy)):
+        assert Key (seq[i]) == Key (legacy[i])
+    assert [Key (e) for e in seq[2:6]] == [Key (e) for e in legacy[2:6]]
+    assert [Key (e) for e in seq[::-2]] == [Key (e) for e in legacy[::-2]]
+    assert seq[3] is legacy[3]                          # Unknown types are kept as they are
+    assert isinstance (seq[0].data["sensor"], int)
+    for i in (len(legacy), -len(legacy) - 1):
+        with pytest.raises (IndexError):
+            seq[i]
+
+def test_time_order ():
+    legacy = Legacy()
+    store  = Filled (legacy).store
+    ordered = sorted (legacy, key=lambda ele: ele.time)   # Stable, as TimeOrder
+    assert [Key (e) for e in store.TimeElements (0, store.count)] == [Key (e) for e in ordered]
+    assert [Key (e) for e in store.TimeElements (2, 5)] == [Key (e) for e in ordered[2:5]]
+    store.SortOrder()
+    assert [Key (e) for e in store.Elements (0, store.count)] == [Key (e) for e in ordered]
+
+def test_extend_same_as_append ():
+    legacy = Legacy()
+    single = Filled (legacy).store
+    block  = ts.TrackStore()
+    block.ExtendStore (single)
+    block.ExtendStore (single)
+    assert [Key (e) for e in block.Elements (0, block.count)] == [Key (e) for e in legacy + legacy]
+    block.ShiftTime (0.01)
+    assert np.allclose (block.Times(), [ele.time - 0.01 for ele in legacy + legacy])
+    assert [e.time for e in block.other] == [0.018 - 0.01] * 2 and single.other[0].time == 0.018
+    assert np.allclose (block.columns["SA_EUL_ANG"].Time(), [0.02, 0.01, 0.0, 0.02, 0.01, 0.0])
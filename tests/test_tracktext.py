@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the .sat reader in TrackText against Element.Read, the line by line
+reader it replaced
+"""
+
+import io
+import os
+import numpy as np
+import StreamData as sd
+import TrackText as tt
+
+TESTSET = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..", "Examples", "testset.sat")
+HEADER  = "SA_Track,Test\nSA_SensorDict,8,RightKnee\n"
+
+
+def Read (lines):
+    """ The one track read from a .sat text of HEADER and lines """
+    tracks = tt.ReadTracks (io.StringIO (HEADER + "\n".join (lines) + "\n"))
+    assert len(tracks) == 1
+    return (tracks[0])
+
+def Legacy (line):
+    """ Element of a data line read the old way """
+    ele = sd.Element (None, None, None)
+    ele.Read ([x.strip() for x in line.split (',')])
+    return (ele)
+
+def Numbers (tokens):
+    """ ParseNumbers of tokens as one row, after trimming """
+    block = ",".join (tokens).encode()
+    buf   = np.frombuffer (b'\0'*tt.WINDOW + block + b'\0'*tt.WINDOW, dtype=np.uint8)
+    seps  = np.flatnonzero (buf == tt.COMMA) - tt.WINDOW
+    starts = np.concatenate (([0], seps + 1))
+    ends   = np.concatenate ((seps, [len(block)]))
+    tt.TrimTokens (buf, starts, ends)
+    return (tt.ParseNumbers (block, buf, tt.Words (buf), starts[None,:], ends[None,:])[0])
+
+
+def test_trailing_spaces ():
+    trk = Read (["SA_EUL_ANG,0.0 ,sensor,8 ,angle_X, 1.5,angle_Y,2.25\t,angle_Z,15 ",
+                 "SA_EUL_ANG,0.5,sensor, 8,angle_X,-1 ,angle_Y,  0 ,angle_Z,7.5"])
+    msg = trk.store.columns["SA_EUL_ANG"]
+    assert msg.Column ("sensor").tolist() == [8, 8]
+    assert msg.Column ("angle_X").tolist() == [1.5, -1.0]
+    assert msg.Column ("angle_Y").tolist() == [2.25, 0.0]
+    assert msg.Column ("angle_Z").tolist() == [15.0, 7.5]
+
+def test_stray_sign_or_space_is_not_a_number ():
+    values = Numbers (["1-5", "1+5", "+-1", "--1", "5-", "1 5", "1\t5", " 1 5 ", "-.", "+", ".", "", "  "])
+    assert np.isnan (values).all()
+
+def test_stray_sign_line_skipped (capsys):
+    trk = Read (["SA_EUL_ANG,0.0,sensor,8,angle_X,1.0,angle_Y,2.0,angle_Z,3.0",
+                 "SA_EUL_ANG,0.1,sensor,8,angle_X,1-5,angle_Y,2.0,angle_Z,3.0",
+                 "SA_EUL_ANG,0.2,sensor,8,angle_X,1.0,angle_Y,2 0,angle_Z,3.0",
+                 "SA_EUL_ANG,0.3,sensor,8,angle_X,4.0,angle_Y,5.0,angle_Z,6.0"])
+    assert trk.store.columns["SA_EUL_ANG"].Column ("angle_X").tolist() == [1.0, 4.0]
+    assert capsys.readouterr().out.count ("Error reading line") == 2
+
+def test_numbers_match_float ():
+    rng    = np.random.default_rng (2)
+    tokens = ["%.*f" % (d, x) for d, x in zip (rng.integers (0, 12, 20000).tolist(), rng.uniform (-1e6, 1e6, 20000))]
+    tokens += [str (x) for x in rng.integers (-10**9, 10**9, 2000)]
+    tokens += ["+3", "-0", "-.5", "5.", "00012.50", "1e5", "nan", "-0.000001", "12345678", "-1234567",
+               "123456789012.25", "9484227692235.65", " 7", "8 ", "\t9\t"]
+    values = Numbers (tokens)
+    expect = np.array ([float (t) for t in tokens])
+    assert np.array_equal (values, expect, equal_nan=True)
+    assert np.array_equal (np.signbit (values), np.signbit (expect))
+
+def test_testset_matches_element_read ():
+    with open (TESTSET, "r") as fp:
+        text = fp.read()
+    tracks = tt.ReadTracks (io.StringIO (text))
+    lines  = [ln for ln in text.splitlines() if ln.split (',')[0].strip() not in tt.HEADER_NAMES + ("",)]
+    elements = [ele for trk in tracks for ele in trk.sequence]
+    assert len(elements) == len(lines)
+    i = 0
+    for trk in tracks:
+        # Track times start at 0.0
+        first = None
+        for ele in trk.sequence:
+            old = Legacy (lines[i])
+            first = old.time if first is None else first
+            assert ele.name == old.name
+            assert abs (ele.time - (old.time - first)) < 1e-9
+            assert ele.data == old.data
+            i += 1
+
+def test_numbers_without_numpy2 (monkeypatch):
+    # requirements.txt pins NumPy 1.x, which has no bitwise_count
+    monkeypatch.delattr (np, "bitwise_count", raising=False)
+    tokens = ["1", "-2.5", "+.75", "12345678", "1234.567", "-1.2345", "0.", "1.2.3", "1-2", ".", "x"]
+    values = Numbers (tokens)
+    expect = [1.0, -2.5, 0.75, 12345678.0, 1234.567, -1.2345, 0.0]
+    assert values[:7].tolist() == expect
+    assert np.isnan (values[7:]).all()
+    trk = Read (["SA_EUL_ANG,0.0,sensor,8,angle_X,1.5,angle_Y,-2.25,angle_Z,15"])
+    assert trk.store.columns["SA_EUL_ANG"].Column ("angle_Y").tolist() == [-2.25]
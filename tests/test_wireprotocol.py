@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the binary datagrams in WireProtocol, decoded as columns into a
+TrackStore and as Elements
+"""
+
+from collections import Counter
+import numpy as np
+import StreamData as sd
+import TrackStore as ts
+import WireProtocol as wp
+
+
+def Datagram ():
+    """ Mixed datagram, the SA_EUL_ANG records not in time order """
+    codes   = [2, 1, 2, 4, 5, 2]
+    sensors = [3, 1, 4, 1, 2, 3]
+    times   = [120, 100, 110, 100, 105, 115]
+    values  = np.arange (24, dtype=np.float32).reshape (6, 4)
+    return (wp.Encode (codes, sensors, times, values))
+
+def Key (ele):
+    return ((ele.name, ele.time, sorted (ele.data.items())))
+
+
+def test_columns_match_elements ():
+    data  = Datagram()
+    store = ts.TrackStore()
+    wp.DecodeInto (store, data, wp.BINARY)
+    assert store.count == 6
+    assert store.columns["SA_EUL_ANG"].count == 3
+    assert [Key (e) for e in store.Elements (0, store.count)] == [Key (e) for e in wp.DecodeElements (data)]
+    assert list (store.Times()) == [0.12, 0.1, 0.11, 0.1, 0.105, 0.115]
+
+def test_elements_round_trip ():
+    elements = wp.DecodeElements (Datagram())
+    assert [Key (e) for e in wp.DecodeElements (wp.EncodeElements (elements))] == [Key (e) for e in elements]
+    assert isinstance (elements[3].data["cal"], int)
+
+def test_bad_datagrams_counted ():
+    errors = Counter()
+    store  = ts.TrackStore()
+    wp.DecodeInto (store, Datagram()[:-3], wp.BINARY, errors)
+    assert store.count == 0
+    unknown = wp.Encode ([2, 9], [1, 1], [10, 20], np.zeros ((2, 4)))
+    wp.DecodeInto (store, unknown, wp.BINARY, errors)
+    assert store.count == 1
+    assert errors["binary length"] == 1 and errors["unknown"] == 1
+
+def test_latest_and_sort ():
+    store = ts.TrackStore()
+    wp.DecodeInto (store, Datagram(), wp.BINARY)
+    latest = store.Latest()
+    assert [(e.name, e.data["sensor"], e.time) for e in latest if e.name == "SA_EUL_ANG"] == \
+           [("SA_EUL_ANG", 4, 0.11), ("SA_EUL_ANG", 3, 0.12)]
+    store.SortOrder()
+    times = store.Times()
+    assert (times[1:] >= times[:-1]).all()